@@ -0,0 +1,11 @@
+"""Benchmarks for the hot paths, run against synthetic store catalogs of
+any size rather than the 95 stores in stores.json, and a fake geocoder
+rather than Postcodes.io, i.e.
+
+    python -m benchmarks run --sizes 100 10000 1000000
+    python -m benchmarks compare benchmarks/results/old.json new.json
+
+Catalogs are generated from a seed, so every run of the same settings
+measures the same stores. The results are saved as JSON, along with the
+settings and the environment they were measured in, so runs can be
+compared over time."""
@@ -0,0 +1,249 @@
+import argparse
+import dataclasses
+import datetime
+import os
+
+from benchmarks import cases, load_test, measure
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _print_measurement(m: measure.Measurement):
+    per_operation_ms = m.seconds["median"] / m.operations * 1000
+    peak = (
+        f"{m.peak_memory_bytes / 2**20:9.1f} MiB"
+        if m.peak_memory_bytes is not None
+        else f"{'-':>13}"
+    )
+    failures = f"  {m.failures} failed" if m.failures else ""
+    print(
+        f"{m.case:<26} {m.stores:>9} stores"
+        f"  {m.seconds['median'] * 1000:10.2f} ms"
+        f"  {per_operation_ms:10.4f} ms/op  {peak}{failures}"
+    )
+
+
+def run(args):
+    settings = cases.Settings(
+        sizes=args.sizes,
+        cases=args.cases,
+        repeats=args.repeats,
+        warmup=args.warmup,
+        memory=not args.no_memory,
+        seed=args.seed,
+        radius_km=args.radius_km,
+        queries=args.queries,
+        geocoder_latency_seconds=args.geocoder_latency,
+        geocoder_failure_rate=args.geocoder_failure_rate,
+    )
+    measurements = cases.run(settings, progress=_print_measurement)
+
+    output = args.output or os.path.join(
+        RESULTS_DIRECTORY,
+        f"{datetime.datetime.now():%Y%m%dT%H%M%S}.json",
+    )
+    measure.save_results(output, dataclasses.asdict(settings), measurements)
+    print(f"Saved the results to {output}.")
+
+
+def compare(args):
+    rows = measure.compare(
+        measure.load_results(args.baseline),
+        measure.load_results(args.candidate),
+    )
+    for r in rows:
+        print(
+            f"{r['case']:<26} {r['stores']:>9} stores"
+            f"  {r['baseline_seconds'] * 1000:10.2f} ms"
+            f"  {r['candidate_seconds'] * 1000:10.2f} ms  {r['ratio']:6.2f}x"
+        )
+
+
+def _mix(value: str) -> dict[str, float]:
+    """i.e. stores=1,nearby=9"""
+    mix = {}
+    for part in value.split(","):
+        route, _, weight = part.partition("=")
+        mix[route.strip()] = float(weight)
+    return mix
+
+
+def run_load_test(args):
+    settings = load_test.LoadTestSettings(
+        stores=args.stores,
+        clients=args.clients,
+        duration_seconds=args.duration,
+        mix=args.mix,
+        radius_km=args.radius_km,
+        postcodes=args.postcodes,
+        upstream_latency_seconds=args.upstream_latency,
+        upstream_jitter_seconds=args.upstream_jitter,
+        upstream_error_rate=args.upstream_error_rate,
+        upstream_max_bulk_postcodes=args.upstream_max_postcodes,
+        geocode_cache=args.geocode_cache,
+        seed=args.seed,
+    )
+    report = load_test.run(settings)
+
+    print(
+        f"{report['requests']} requests in {report['duration_seconds']:.1f}s"
+        f" from {settings.clients} clients"
+    )
+    for name, r in [("all", report)] + list(report.get("routes", {}).items()):
+        latency = r["latency_ms"]
+        print(
+            f"{name:<8} {r['requests']:>8} requests"
+            f"  p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms"
+            f"  p99 {latency['p99']:8.2f} ms  {r['statuses']}"
+        )
+    if "throughput_rps" in report:
+        print(f"Throughput {report['throughput_rps']:.1f} requests/s")
+    print(f"Upstream {report['upstream']['load']}")
+
+    output = args.output or os.path.join(
+        RESULTS_DIRECTORY,
+        f"load-{datetime.datetime.now():%Y%m%dT%H%M%S}.json",
+    )
+    measure.save_json(
+        output,
+        {"settings": dataclasses.asdict(settings), "report": report},
+    )
+    print(f"Saved the report to {output}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks.")
+    run_parser.set_defaults(command=run)
+    run_parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[100, 1_000, 10_000],
+        help="The numbers of stores in the synthetic catalogs.",
+    )
+    run_parser.add_argument(
+        "--cases",
+        nargs="+",
+        choices=list(cases.CASES),
+        default=list(cases.CASES),
+        help="The cases to run, all of them by default.",
+    )
+    run_parser.add_argument("--repeats", type=int, default=5)
+    run_parser.add_argument("--warmup", type=int, default=1)
+    run_parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Don't measure memory peaks, which takes an extra call per case.",
+    )
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--radius-km", type=float, default=cases.Settings.radius_km)
+    run_parser.add_argument(
+        "--queries",
+        type=int,
+        default=cases.Settings.queries,
+        help="How many postcodes each nearby case searches from.",
+    )
+    run_parser.add_argument(
+        "--geocoder-latency",
+        type=float,
+        default=0,
+        help="How long each call to the fake geocoder takes, in seconds.",
+    )
+    run_parser.add_argument(
+        "--geocoder-failure-rate",
+        type=float,
+        default=0,
+        help="The probability of each call to the fake geocoder failing.",
+    )
+    run_parser.add_argument(
+        "--output",
+        help="Where to save the results, benchmarks/results/<time>.json by default.",
+    )
+
+    compare_parser = commands.add_parser(
+        "compare",
+        help="Compare the median times of two runs.",
+    )
+    compare_parser.set_defaults(command=compare)
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    defaults = load_test.LoadTestSettings()
+    load_parser = commands.add_parser(
+        "load-test",
+        help="Drive the app with concurrent clients, against a mock Postcodes.io.",
+    )
+    load_parser.set_defaults(command=run_load_test)
+    load_parser.add_argument("--stores", type=int, default=defaults.stores)
+    load_parser.add_argument(
+        "--clients",
+        type=int,
+        default=defaults.clients,
+        help="How many clients send requests at once.",
+    )
+    load_parser.add_argument(
+        "--duration",
+        type=float,
+        default=defaults.duration_seconds,
+        help="How long to send requests for, in seconds.",
+    )
+    load_parser.add_argument(
+        "--mix",
+        type=_mix,
+        default=defaults.mix,
+        help="The weight of each route in the requests, i.e. stores=1,nearby=9.",
+    )
+    load_parser.add_argument("--radius-km", type=float, default=defaults.radius_km)
+    load_parser.add_argument(
+        "--postcodes",
+        type=int,
+        default=defaults.postcodes,
+        help="How many postcodes, besides the stores', are searched from.",
+    )
+    load_parser.add_argument(
+        "--upstream-latency",
+        type=float,
+        default=defaults.upstream_latency_seconds,
+        help="How long each call to the mock Postcodes.io takes, in seconds.",
+    )
+    load_parser.add_argument(
+        "--upstream-jitter",
+        type=float,
+        default=defaults.upstream_jitter_seconds,
+        help="How much, in seconds, the latency varies either way.",
+    )
+    load_parser.add_argument(
+        "--upstream-error-rate",
+        type=float,
+        default=defaults.upstream_error_rate,
+        help="The probability of each call to the mock Postcodes.io failing.",
+    )
+    load_parser.add_argument(
+        "--upstream-max-postcodes",
+        type=int,
+        default=defaults.upstream_max_bulk_postcodes,
+        help="The most postcodes the mock Postcodes.io accepts in one call.",
+    )
+    load_parser.add_argument(
+        "--geocode-cache",
+        action="store_true",
+        help="Cache geocodes on disk, as the app does by default.",
+    )
+    load_parser.add_argument("--seed", type=int, default=defaults.seed)
+    load_parser.add_argument(
+        "--output",
+        help=(
+            "Where to save the report, by default"
+            " benchmarks/results/load-<time>.json."
+        ),
+    )
+
+    args = parser.parse_args(argv)
+    args.command(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""The benchmarked hot paths, from reading the stores file up to rendering
+the routes. Each case is given a Bench, with a synthetic catalog already
+written to a stores file and loaded into a warm store catalog, and
+returns the call to time and how many operations each call does.
+
+The nearby searches are from a fixed sample of postcodes, half of them
+store postcodes, which the catalog resolves itself, and half of them
+other postcodes, which are geocoded. Results aren't cached, so every
+search does the full work."""
+
+import dataclasses
+import math
+import os
+import random
+import tempfile
+from typing import Callable, Iterator
+
+from benchmarks import synthetic
+from benchmarks.measure import Measurement, measure
+from src import config, constants
+from src.adapters import repo
+from src.app import create_app
+from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog, build_snapshot
+from src.srv_layer.result_cache import ResultCache
+
+
+@dataclasses.dataclass
+class Settings:
+    sizes: list[int]
+    cases: list[str]
+    repeats: int = 5
+    warmup: int = 1
+    memory: bool = True
+    seed: int = 0
+    radius_km: float = config.NEARBY_STORES_DEFAULT_RADIUS_KM
+    queries: int = 20
+    geocoder_latency_seconds: float = 0
+    geocoder_failure_rate: float = 0
+
+
+@dataclasses.dataclass
+class Bench:
+    settings: Settings
+    catalog: synthetic.SyntheticCatalog
+    stores_file_path: str
+    store_repo_factory: synthetic.SyntheticStoreRepoFactory
+    store_catalog: StoreCatalog
+    query_postcodes: list[str]
+
+
+Case = Callable[[Bench], tuple[Callable[[], object], int]]
+CASES: dict[str, Case] = {}
+
+
+def case(name: str):
+    def register(fn: Case) -> Case:
+        CASES[name] = fn
+        return fn
+
+    return register
+
+
+@case("StoreFileRepo.list")
+def store_file_repo_list(bench: Bench):
+    store_repo = repo.StoreFileRepo(bench.stores_file_path)
+    return store_repo.list, 1
+
+
+@case("build_snapshot")
+def catalog_build_snapshot(bench: Bench):
+    # Joins the stores with their coords, as views._aggregate_coords did
+    # before the catalog took it over.
+    return lambda: build_snapshot(bench.store_repo_factory), 1
+
+
+@case("Store.is_within_radius")
+def store_is_within_radius(bench: Bench):
+    table = bench.store_catalog.snapshot().table
+    stores = [table.row(i) for i in range(len(table))]
+    lat, long = _coords(bench, bench.query_postcodes[0])
+    radius_km = bench.settings.radius_km
+
+    def run():
+        for s in stores:
+            s.is_within_radius(lat, long, radius_km)
+
+    return run, len(stores)
+
+
+@case("views.stores")
+def views_stores(bench: Bench):
+    def run():
+        for _ in views.stores(bench.store_repo_factory, bench.store_catalog):
+            pass
+
+    return run, 1
+
+
+@case("views.nearby_stores")
+def views_nearby_stores(bench: Bench):
+    def run():
+        for p in bench.query_postcodes:
+            for _ in views.nearby_stores(
+                bench.store_repo_factory,
+                p,
+                bench.settings.radius_km,
+                bench.store_catalog,
+            ):
+                pass
+
+    return run, len(bench.query_postcodes)
+
+
+@case("routes.stores")
+def routes_stores(bench: Bench):
+    client = _create_app(bench).test_client()
+    return lambda: _get(client, "/"), 1
+
+
+@case("routes.nearby_stores")
+def routes_nearby_stores(bench: Bench):
+    client = _create_app(bench).test_client()
+    urls = [
+        f"/nearby/?postcode={p}&radius_km={bench.settings.radius_km}"
+        for p in bench.query_postcodes
+    ]
+
+    def run():
+        for url in urls:
+            _get(client, url)
+
+    return run, len(urls)
+
+
+def _coords(bench: Bench, postcode: str) -> tuple[float, float]:
+    return bench.catalog.coords[postcode]
+
+
+def _create_app(bench: Bench):
+    return create_app(
+        {
+            constants.STORE_REPO_FACTORY: bench.store_repo_factory,
+            constants.STORE_CATALOG: bench.store_catalog,
+            # Entries expire straight away, so nothing is served from cache.
+            constants.NEARBY_RESULT_CACHE: ResultCache(0, 0),
+        }
+    )
+
+
+def _get(client, url: str):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}.")
+    # Read the whole body, as streamed responses are rendered as they're read.
+    return response.get_data()
+
+
+def _sample_query_postcodes(
+    catalog: synthetic.SyntheticCatalog,
+    n: int,
+    seed: int,
+) -> list[str]:
+    rng = random.Random(seed)
+    resolved = catalog.resolved_postcodes()
+    others = [
+        p for p in catalog.query_postcodes if not math.isnan(catalog.coords[p][0])
+    ]
+    from_stores = rng.sample(resolved, min(n - n // 2, len(resolved)))
+    return from_stores + rng.sample(others, min(n // 2, len(others)))
+
+
+def benches(settings: Settings, directory: str) -> Iterator[Bench]:
+    """A bench for each size in turn. Only one catalog is held at a time."""
+    for size in settings.sizes:
+        catalog = synthetic.generate_catalog(size, seed=settings.seed)
+        stores_file_path = os.path.join(directory, f"stores_{size}.json")
+        catalog.write_stores_file(stores_file_path)
+
+        store_repo_factory = synthetic.SyntheticStoreRepoFactory(
+            stores_file_path,
+            synthetic.SyntheticStorePostcodeRepo(
+                catalog,
+                latency_seconds=settings.geocoder_latency_seconds,
+                failure_rate=settings.geocoder_failure_rate,
+                seed=settings.seed,
+            ),
+        )
+        # The catalog is built with a geocoder that doesn't fail, so every
+        # bench starts from the same stores whatever the failure rate.
+        store_catalog = StoreCatalog(
+            synthetic.SyntheticStoreRepoFactory(
+                stores_file_path,
+                synthetic.SyntheticStorePostcodeRepo(catalog),
+            )
+        )
+        store_catalog.snapshot()
+
+        yield Bench(
+            settings=settings,
+            catalog=catalog,
+            stores_file_path=stores_file_path,
+            store_repo_factory=store_repo_factory,
+            store_catalog=store_catalog,
+            query_postcodes=_sample_query_postcodes(
+                catalog,
+                settings.queries,
+                settings.seed,
+            ),
+        )
+        os.remove(stores_file_path)
+
+
+def run(
+    settings: Settings,
+    progress: Callable[[Measurement], None] = lambda m: None,
+) -> list[Measurement]:
+    unknown = [c for c in settings.cases if c not in CASES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases: {', '.join(unknown)}.")
+
+    measurements = []
+    with tempfile.TemporaryDirectory() as directory:
+        for bench in benches(settings, directory):
+            for name in settings.cases:
+                fn, operations = CASES[name](bench)
+                measurement = measure(
+                    name,
+                    len(bench.catalog),
+                    fn,
+                    operations=operations,
+                    repeats=settings.repeats,
+                    warmup=settings.warmup,
+                    memory=settings.memory,
+                )
+                measurements.append(measurement)
+                progress(measurement)
+    return measurements
@@ -0,0 +1,256 @@
+"""Microbenchmarks don't show how the app behaves under concurrency, so
+the load test runs the whole app, on a threaded server the same as
+`flask run`, and drives / and /nearby/ with concurrent clients.
+
+Postcodes.io is stood in for by the mock server, so the app's real
+geocoding stack, with its resilience, coalescing and result caching, is
+under load too, without calling the real thing. The app is pointed at it
+through config, the same as it would be pointed at Postcodes.io.
+
+The report gives the throughput and latency percentiles, overall and for
+each route, the statuses returned, and how many calls went upstream."""
+
+import contextlib
+import dataclasses
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks import synthetic
+from benchmarks.measure import percentile
+from benchmarks.mock_postcodesio import MAX_BULK_POSTCODES, MockPostcodesIOServer
+from src import config, constants
+from src.app import create_app
+
+ROUTES = ("stores", "nearby")
+
+
+@dataclasses.dataclass
+class LoadTestSettings:
+    stores: int = 10_000
+    clients: int = 8
+    duration_seconds: float = 30
+    # The relative weight of each route in the requests sent.
+    mix: dict[str, float] = dataclasses.field(
+        default_factory=lambda: {"stores": 1, "nearby": 9}
+    )
+    radius_km: float = config.NEARBY_STORES_DEFAULT_RADIUS_KM
+    # How many postcodes, that aren't store postcodes, the nearby searches
+    # are from, alongside as many store postcodes.
+    postcodes: int = 200
+    upstream_latency_seconds: float = 0.05
+    upstream_jitter_seconds: float = 0.02
+    upstream_error_rate: float = 0
+    upstream_max_bulk_postcodes: int = MAX_BULK_POSTCODES
+    # Whether geocodes are cached on disk, as they are by default.
+    geocode_cache: bool = False
+    seed: int = 0
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        # Every request would be logged to stderr otherwise.
+        pass
+
+
+@dataclasses.dataclass
+class _Sample:
+    route: str
+    # The HTTP status, or "error" when no response came back.
+    status: str
+    seconds: float
+
+
+@contextlib.contextmanager
+def _configured(**settings):
+    """Sets config for the duration, and puts it back after."""
+    previous = {name: getattr(config, name) for name in settings}
+    for name, value in settings.items():
+        setattr(config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(config, name, value)
+
+
+def _nearby_postcodes(
+    catalog: synthetic.SyntheticCatalog,
+    rng: random.Random,
+) -> list[str]:
+    resolved = catalog.resolved_postcodes()
+    from_stores = rng.sample(resolved, min(len(catalog.query_postcodes), len(resolved)))
+    # Postcodes that don't resolve are searched for too, as they are in
+    # real traffic.
+    return from_stores + catalog.query_postcodes
+
+
+def _client(
+    base_url: str,
+    settings: LoadTestSettings,
+    nearby_postcodes: list[str],
+    deadline: float,
+    seed: int,
+    samples: list[_Sample],
+):
+    rng = random.Random(seed)
+    routes = list(settings.mix)
+    weights = [settings.mix[r] for r in routes]
+
+    with requests.Session() as session:
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            if route == "stores":
+                url, params = f"{base_url}/", None
+            else:
+                url = f"{base_url}/nearby/"
+                params = {
+                    "postcode": rng.choice(nearby_postcodes),
+                    "radius_km": settings.radius_km,
+                }
+
+            started_at = time.perf_counter()
+            try:
+                response = session.get(url, params=params)
+                # Read the whole body, as the routes render as it's read.
+                _ = response.content
+                status = str(response.status_code)
+            except requests.RequestException:
+                status = "error"
+            samples.append(_Sample(route, status, time.perf_counter() - started_at))
+
+
+def _latency_ms(samples: list[_Sample]) -> dict[str, float]:
+    seconds = [s.seconds for s in samples]
+    return {
+        "p50": percentile(seconds, 50) * 1000,
+        "p95": percentile(seconds, 95) * 1000,
+        "p99": percentile(seconds, 99) * 1000,
+        "max": max(seconds) * 1000,
+    }
+
+
+def _statuses(samples: list[_Sample]) -> dict[str, int]:
+    statuses = {}
+    for s in samples:
+        statuses[s.status] = statuses.get(s.status, 0) + 1
+    return dict(sorted(statuses.items()))
+
+
+def _report(samples: list[_Sample], elapsed_seconds: float) -> dict:
+    if not samples:
+        return {"requests": 0, "duration_seconds": elapsed_seconds}
+    return {
+        "requests": len(samples),
+        "duration_seconds": elapsed_seconds,
+        "throughput_rps": len(samples) / elapsed_seconds,
+        "latency_ms": _latency_ms(samples),
+        "statuses": _statuses(samples),
+        "routes": {
+            route: {
+                "requests": len(route_samples),
+                "latency_ms": _latency_ms(route_samples),
+                "statuses": _statuses(route_samples),
+            }
+            for route in ROUTES
+            if (route_samples := [s for s in samples if s.route == route])
+        },
+    }
+
+
+def run(settings: LoadTestSettings) -> dict:
+    unknown = [r for r in settings.mix if r not in ROUTES]
+    if unknown:
+        raise ValueError(f"Unknown routes in the request mix: {', '.join(unknown)}.")
+
+    catalog = synthetic.generate_catalog(
+        settings.stores,
+        seed=settings.seed,
+        n_query_postcodes=settings.postcodes,
+    )
+    nearby_postcodes = _nearby_postcodes(catalog, random.Random(settings.seed))
+
+    with tempfile.TemporaryDirectory() as directory, MockPostcodesIOServer(
+        catalog,
+        latency_seconds=settings.upstream_latency_seconds,
+        jitter_seconds=settings.upstream_jitter_seconds,
+        error_rate=settings.upstream_error_rate,
+        max_bulk_postcodes=settings.upstream_max_bulk_postcodes,
+        seed=settings.seed,
+    ) as upstream:
+        stores_file_path = os.path.join(directory, "stores.json")
+        catalog.write_stores_file(stores_file_path)
+
+        with _configured(
+            STORES_FILE=stores_file_path,
+            STORES_DB_FILE=None,
+            SHARED_CATALOG_FILE=None,
+            GAZETTEER_FILE=None,
+            CENTROID_INDEX_FILE=None,
+            POSTCODESIO_BULK_POSTCODES_URL=upstream.bulk_postcodes_url,
+            GEOCODE_CACHE_FILE=(
+                os.path.join(directory, "geocode_cache.sqlite3")
+                if settings.geocode_cache
+                else None
+            ),
+        ):
+            # The app is warmed up first, so the stores are only geocoded
+            # before the clients start.
+            app = create_app({constants.WARM_UP_STEPS: ("catalog", "templates")})
+            app.config[constants.WARM_UP].wait()
+            warm_up_stats = upstream.stats()
+
+            server = make_server(
+                "127.0.0.1",
+                0,
+                app,
+                threaded=True,
+                request_handler=_QuietRequestHandler,
+            )
+            server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+            server_thread.start()
+            try:
+                base_url = f"http://127.0.0.1:{server.server_port}"
+                samples: list[_Sample] = []
+                started_at = time.perf_counter()
+                deadline = started_at + settings.duration_seconds
+                clients = [
+                    threading.Thread(
+                        target=_client,
+                        args=(
+                            base_url,
+                            settings,
+                            nearby_postcodes,
+                            deadline,
+                            settings.seed + i,
+                            samples,
+                        ),
+                    )
+                    for i in range(settings.clients)
+                ]
+                for c in clients:
+                    c.start()
+                for c in clients:
+                    c.join()
+                elapsed_seconds = time.perf_counter() - started_at
+            finally:
+                server.shutdown()
+                server_thread.join()
+                server.server_close()
+
+        run_stats = upstream.stats()
+
+    return _report(samples, elapsed_seconds) | {
+        "upstream": {
+            "warm_up": dataclasses.asdict(warm_up_stats),
+            "load": {
+                f.name: getattr(run_stats, f.name) - getattr(warm_up_stats, f.name)
+                for f in dataclasses.fields(run_stats)
+            },
+        }
+    }
@@ -0,0 +1,198 @@
+"""Timings and memory peaks, and the results files they're saved in.
+
+Each case is timed over several repeats, after a warm-up call, with the
+garbage collector off, the same as timeit, so a collection triggered by
+an earlier case doesn't land in a later one's timings. The memory peak
+is measured on a separate call, under tracemalloc, as tracing slows
+every allocation down and would skew the timings."""
+
+import dataclasses
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@dataclasses.dataclass
+class Measurement:
+    case: str
+    stores: int
+    # How many operations, i.e. searches, each call does.
+    operations: int
+    repeats: int
+    # min, median, mean and max of the calls, in seconds.
+    seconds: dict[str, float]
+    peak_memory_bytes: Optional[int]
+    # Calls that raised, i.e. when the geocoder is set to fail.
+    failures: int
+
+
+def _call(fn: Callable[[], object]) -> bool:
+    """Returns whether the call succeeded."""
+    try:
+        fn()
+    except Exception:
+        return False
+    return True
+
+
+def time_calls(fn: Callable[[], object], repeats: int, warmup: int = 1):
+    """Returns the time of each call, and how many of them failed."""
+    for _ in range(warmup):
+        _call(fn)
+
+    times, failures = [], 0
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            started_at = time.perf_counter()
+            failures += not _call(fn)
+            times.append(time.perf_counter() - started_at)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return times, failures
+
+
+def peak_memory_bytes(fn: Callable[[], object]) -> int:
+    """The most memory allocated at once during the call, over and above
+    what was already allocated before it."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _call(fn)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure(
+    case: str,
+    stores: int,
+    fn: Callable[[], object],
+    operations: int = 1,
+    repeats: int = 5,
+    warmup: int = 1,
+    memory: bool = True,
+) -> Measurement:
+    times, failures = time_calls(fn, repeats, warmup)
+    return Measurement(
+        case=case,
+        stores=stores,
+        operations=operations,
+        repeats=repeats,
+        seconds={
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.fmean(times),
+            "max": max(times),
+        },
+        peak_memory_bytes=peak_memory_bytes(fn) if memory else None,
+        failures=failures,
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """What the results were measured on, as timings are only comparable
+    between runs on the same machine and Python."""
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy.__version__ if numpy is not None else None,
+        "git_commit": _git_commit(),
+    }
+
+
+def percentile(values: list[float], p: float) -> float:
+    """The nearest-rank percentile, i.e. p=99 for the p99."""
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def save_json(path: str, document: dict):
+    """Saves the document along with when and where it was measured."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "environment": environment(),
+            }
+            | document,
+            f,
+            indent=2,
+        )
+
+
+def save_results(path: str, settings: dict, measurements: list[Measurement]):
+    save_json(
+        path,
+        {
+            "settings": settings,
+            "results": [dataclasses.asdict(m) for m in measurements],
+        },
+    )
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline: dict, candidate: dict) -> list[dict]:
+    """Pairs up the cases measured in both runs, at the same number of
+    stores. A ratio above 1 means the candidate is slower."""
+    baseline_seconds = {
+        (r["case"], r["stores"]): r["seconds"]["median"] for r in baseline["results"]
+    }
+
+    rows = []
+    for r in candidate["results"]:
+        key = r["case"], r["stores"]
+        if key not in baseline_seconds:
+            continue
+        rows.append(
+            {
+                "case": r["case"],
+                "stores": r["stores"],
+                "baseline_seconds": baseline_seconds[key],
+                "candidate_seconds": r["seconds"]["median"],
+                "ratio": r["seconds"]["median"] / baseline_seconds[key],
+            }
+        )
+    return rows
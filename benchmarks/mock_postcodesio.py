@@ -0,0 +1,171 @@
+"""A local HTTP server speaking the Postcodes.io bulk lookup API, i.e.
+
+    POST /postcodes {"postcodes": ["CM20 1FE", ...]}
+
+which answers for a synthetic catalog's postcodes. Its latency, jitter and
+error rate can be set, and it refuses more than 100 postcodes at a time,
+the same as Postcodes.io. It counts the calls made to it, so load tests
+can report how many went upstream."""
+
+import dataclasses
+import http.server
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+from typing import Optional
+
+from benchmarks import synthetic
+
+MAX_BULK_POSTCODES = 100
+
+
+@dataclasses.dataclass
+class UpstreamStats:
+    calls: int = 0
+    postcodes: int = 0
+    errors: int = 0
+    rejected: int = 0
+
+
+class MockPostcodesIOServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        catalog: synthetic.SyntheticCatalog,
+        latency_seconds: float = 0,
+        jitter_seconds: float = 0,
+        error_rate: float = 0,
+        max_bulk_postcodes: int = MAX_BULK_POSTCODES,
+        seed: int = 0,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+    ):
+        """Each call takes latency_seconds, give or take up to
+        jitter_seconds, and fails with a 500 with probability error_rate."""
+        super().__init__(address, _Handler)
+        self.catalog = catalog
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.max_bulk_postcodes = max_bulk_postcodes
+
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._stats = UpstreamStats()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def bulk_postcodes_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/postcodes"
+
+    def stats(self) -> UpstreamStats:
+        with self._lock:
+            return dataclasses.replace(self._stats)
+
+    def start(self) -> "MockPostcodesIOServer":
+        self._thread = threading.Thread(
+            target=self.serve_forever,
+            name="mock-postcodesio",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def lookup(self, postcodes: list[str]) -> tuple[int, dict]:
+        """Returns the status and body of the response."""
+        with self._lock:
+            self._stats.calls += 1
+            self._stats.postcodes += len(postcodes)
+            delay = self.latency_seconds + self._rng.uniform(
+                -self.jitter_seconds,
+                self.jitter_seconds,
+            )
+            failed = self._rng.random() < self.error_rate
+            rejected = len(postcodes) > self.max_bulk_postcodes
+            self._stats.errors += failed
+            self._stats.rejected += rejected
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if rejected:
+            return 400, {
+                "status": 400,
+                "error": (
+                    "Too many postcodes submitted. Up to"
+                    f" {self.max_bulk_postcodes} postcodes can be bulk requested"
+                    " at a time"
+                ),
+            }
+        if failed:
+            return 500, {"status": 500, "error": "Internal Server Error"}
+
+        return 200, {
+            "status": 200,
+            "result": [{"query": p, "result": self._result(p)} for p in postcodes],
+        }
+
+    def _result(self, postcode: str) -> Optional[dict]:
+        coords = self.catalog.coords.get(postcode)
+        if coords is None or math.isnan(coords[0]):
+            return None
+        return {"postcode": postcode, "latitude": coords[0], "longitude": coords[1]}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive, the same as Postcodes.io, so the app's pooled session
+    # reuses its connections.
+    protocol_version = "HTTP/1.1"
+    # The headers and body are written separately, so Nagle's algorithm
+    # would hold the body back for the client's delayed ACK.
+    disable_nagle_algorithm = True
+    server: MockPostcodesIOServer
+
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path.rstrip("/") != "/postcodes":
+            self._respond(404, {"status": 404, "error": "Resource not found"})
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # PostcodesIORepo sends the postcodes form encoded, others send JSON.
+        if self.headers.get_content_type() == "application/json":
+            postcodes = json.loads(body or b"{}").get("postcodes")
+        else:
+            postcodes = urllib.parse.parse_qs(body.decode("utf-8")).get("postcodes")
+
+        if not isinstance(postcodes, list):
+            self._respond(
+                400,
+                {"status": 400, "error": "Invalid JSON query submitted."},
+            )
+            return
+
+        self._respond(*self.server.lookup(postcodes))
+
+    def _respond(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Every call would be logged to stderr otherwise.
+        pass
@@ -0,0 +1,192 @@
+"""Synthetic UK store catalogs, and a fake geocoder that answers for their
+postcodes.
+
+Stores are clustered around the postcode areas, like real stores are
+around towns, rather than spread evenly over the country, so radius
+searches find a realistic number of them. The postcodes are shaped like
+real ones, i.e. CM20 1FE, and are all unique. Some of them don't
+resolve, the same as on Postcodes.io."""
+
+import array
+import dataclasses
+import json
+import math
+import random
+import threading
+import time
+from typing import Iterator
+
+from src.adapters import repo
+
+# The postcode areas, i.e. the letters of the outward code.
+AREAS = (
+    "AB AL B BA BB BD BH BL BN BR BS CA CB CF CH CM CO CR CT CV CW DA DD DE DG DH"
+    " DL DN DT DY E EC EH EN EX FK FY G GL GU HA HD HG HP HR HU HX IG IP KA KT KY L"
+    " LA LD LE LL LN LS LU M ME MK ML N NE NG NN NP NR NW OL OX PA PE PH PL PO PR RG"
+    " RH RM S SA SE SG SK SL SM SN SO SP SR SS ST SW SY TA TD TF TN TQ TR TS TW UB W"
+    " WA WC WD WF WN WR WS WV YO"
+).split()
+# Letters used in the unit of the inward code.
+UNIT_LETTERS = "ABDEFGHJLNPQRSTUWXYZ"
+
+# Roughly mainland Great Britain.
+MIN_LAT, MAX_LAT = 50.1, 58.6
+MIN_LONG, MAX_LONG = -5.5, 1.7
+# How far, in degrees, stores are scattered around the centre of their area.
+AREA_SPREAD_DEGREES = 0.25
+
+# Around 7% of postcodes fail to resolve on Postcodes.io.
+DEFAULT_UNRESOLVED_RATE = 0.07
+
+
+@dataclasses.dataclass(frozen=True)
+class SyntheticCatalog:
+    names: list[str]
+    postcodes: list[str]
+    # The coords of every postcode, the stores' and the query postcodes',
+    # or nan for those that don't resolve.
+    coords: dict[str, tuple[float, float]]
+    # Postcodes that don't belong to any store, for searches that have to
+    # geocode the query postcode.
+    query_postcodes: list[str]
+
+    def __len__(self):
+        return len(self.names)
+
+    def iter_stores(self) -> Iterator[dict]:
+        for name, postcode in zip(self.names, self.postcodes):
+            yield {"name": name, "postcode": postcode}
+
+    def write_stores_file(self, path: str):
+        """Writes the stores the same way as stores.json, or one store per
+        line if the path ends in .ndjson or .jsonl."""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".ndjson", ".jsonl")):
+                for s in self.iter_stores():
+                    f.write(json.dumps(s))
+                    f.write("\n")
+            else:
+                json.dump(list(self.iter_stores()), f, indent=2)
+
+    def resolved_postcodes(self) -> list[str]:
+        return [p for p in self.postcodes if not math.isnan(self.coords[p][0])]
+
+
+def _postcodes(rng: random.Random, n: int) -> Iterator[tuple[str, str]]:
+    """Yields n unique (area, postcode) pairs."""
+    seen = set()
+    while len(seen) < n:
+        area = rng.choice(AREAS)
+        postcode = (
+            f"{area}{rng.randint(1, 99)} {rng.randint(0, 9)}"
+            f"{rng.choice(UNIT_LETTERS)}{rng.choice(UNIT_LETTERS)}"
+        )
+        if postcode not in seen:
+            seen.add(postcode)
+            yield area, postcode
+
+
+def generate_catalog(
+    n_stores: int,
+    seed: int = 0,
+    unresolved_rate: float = DEFAULT_UNRESOLVED_RATE,
+    n_query_postcodes: int = 100,
+) -> SyntheticCatalog:
+    """The same arguments always generate the same catalog."""
+    rng = random.Random(seed)
+    centres = {
+        area: (rng.uniform(MIN_LAT, MAX_LAT), rng.uniform(MIN_LONG, MAX_LONG))
+        for area in AREAS
+    }
+
+    names, postcodes, coords = [], [], {}
+    for i, (area, postcode) in enumerate(_postcodes(rng, n_stores + n_query_postcodes)):
+        if rng.random() < unresolved_rate:
+            coords[postcode] = (float("nan"), float("nan"))
+        else:
+            lat, long = centres[area]
+            coords[postcode] = (
+                rng.gauss(lat, AREA_SPREAD_DEGREES),
+                rng.gauss(long, AREA_SPREAD_DEGREES),
+            )
+
+        if i < n_stores:
+            names.append(f"{area}_Store_{i}")
+            postcodes.append(postcode)
+
+    query_postcodes = list(coords)[n_stores:]
+    # Stores aren't listed in any particular order.
+    order = array.array("q", range(n_stores))
+    rng.shuffle(order)
+    return SyntheticCatalog(
+        names=[names[i] for i in order],
+        postcodes=[postcodes[i] for i in order],
+        coords=coords,
+        query_postcodes=query_postcodes,
+    )
+
+
+class SyntheticStorePostcodeRepo(repo.AbstractStorePostcodeRepo):
+    """Stands in for PostcodesIORepo. It answers for the catalog's
+    postcodes, and only those it's asked for, after latency_seconds. Each
+    call fails with a ConnectionError with probability failure_rate."""
+
+    def __init__(
+        self,
+        catalog: SyntheticCatalog,
+        latency_seconds: float = 0,
+        failure_rate: float = 0,
+        seed: int = 0,
+    ):
+        self.catalog = catalog
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    def postcode_to_coords_map(self, postcodes: list[str]) -> dict:
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if failed:
+            raise ConnectionError("The synthetic geocoder failed.")
+
+        coords = self.catalog.coords
+        return {
+            p: {"lat": coords[p][0], "long": coords[p][1]}
+            for p in postcodes
+            if p in coords and not math.isnan(coords[p][0])
+        }
+
+
+class SyntheticStoreRepoFactory:
+    """Reads the stores from a synthetic stores file, and geocodes them with
+    the synthetic geocoder. The same geocoder is shared by all the repos,
+    so its calls and failures can be counted."""
+
+    def __init__(
+        self,
+        stores_file_path: str,
+        store_postcode_repo: SyntheticStorePostcodeRepo,
+    ):
+        self.stores_file_path = stores_file_path
+        self.store_postcode_repo = store_postcode_repo
+
+    def create_store_repo(self) -> repo.AbstractStoreRepo:
+        return repo.StoreFileRepo(self.stores_file_path)
+
+    def create_store_postcode_repo(self) -> repo.AbstractStorePostcodeRepo:
+        return self.store_postcode_repo
+
+    def __call__(self) -> "SyntheticStoreRepoFactory":
+        # The app creates a factory per request from the class it's
+        # configured with. We configure it with the instance instead.
+        return self
@@ -1,7 +1,7 @@
 from typing import Protocol
 
 from src import config
-from src.adapters import repo
+from src.adapters import repo, resilience
 
 
 class StoreRepoFactory(Protocol):
@@ -14,7 +14,80 @@ class StoreRepoFactory(Protocol):
 
 class DefaultStoreRepoFactory(StoreRepoFactory):
     def create_store_repo(self) -> repo.AbstractStoreRepo:
-        return repo.StoreFileRepo(config.STORES_FILE)
+        if config.STORES_DB_FILE:
+            return repo.SqliteStoreRepo(
+                config.STORES_DB_FILE,
+                batch_size=config.STORE_INGEST_BATCH_SIZE,
+            )
+
+        return repo.StoreFileRepo(
+            config.STORES_FILE,
+            use_mmap=config.STORES_FILE_USE_MMAP,
+        )
 
     def create_store_postcode_repo(self) -> repo.AbstractStorePostcodeRepo:
-        return repo.PostcodesIORepo(config.POSTCODESIO_BULK_POSTCODES_URL)
+        postcode_repo = repo.PostcodesIORepo(
+            config.POSTCODESIO_BULK_POSTCODES_URL,
+            timeout=(
+                config.POSTCODESIO_CONNECT_TIMEOUT_SECONDS,
+                config.POSTCODESIO_READ_TIMEOUT_SECONDS,
+            ),
+            chunk_size=config.POSTCODESIO_BULK_CHUNK_SIZE,
+            max_workers=config.POSTCODESIO_MAX_WORKERS,
+        )
+
+        if config.GEOCODE_CACHE_FILE:
+            postcode_repo = repo.SqliteCachingStorePostcodeRepo(
+                postcode_repo,
+                config.GEOCODE_CACHE_FILE,
+                ttl_seconds=config.GEOCODE_CACHE_TTL_SECONDS,
+                negative_ttl_seconds=config.GEOCODE_CACHE_NEGATIVE_TTL_SECONDS,
+                max_entries=config.GEOCODE_CACHE_MAX_ENTRIES,
+            )
+
+        if config.GEOCODER_RESILIENCE:
+            postcode_repo = repo.ResilientStorePostcodeRepo(
+                postcode_repo,
+                resilience.GeocoderGuard.shared("postcodesio", _create_geocoder_guard),
+            )
+
+        if config.GEOCODER_COALESCE:
+            postcode_repo = repo.CoalescingStorePostcodeRepo(
+                postcode_repo,
+                "postcodesio",
+            )
+
+        if config.GAZETTEER_FILE:
+            gazetteer_repo = repo.GazetteerStorePostcodeRepo(config.GAZETTEER_FILE)
+            postcode_repo = (
+                repo.FallbackStorePostcodeRepo([gazetteer_repo, postcode_repo])
+                if config.GAZETTEER_FALLBACK_TO_POSTCODESIO
+                else gazetteer_repo
+            )
+
+        if config.CENTROID_INDEX_FILE:
+            postcode_repo = repo.CentroidFallbackStorePostcodeRepo(
+                postcode_repo,
+                config.CENTROID_INDEX_FILE,
+            )
+
+        return repo.NormalisingStorePostcodeRepo(postcode_repo)
+
+
+def _create_geocoder_guard() -> resilience.GeocoderGuard:
+    return resilience.GeocoderGuard(
+        resilience.LastKnownCoords(
+            config.GEOCODER_STALE_AFTER_SECONDS,
+            config.GEOCODER_LAST_KNOWN_MAX_ENTRIES,
+        ),
+        resilience.CircuitBreaker(
+            config.GEOCODER_CIRCUIT_FAILURE_THRESHOLD,
+            config.GEOCODER_CIRCUIT_RESET_SECONDS,
+            slow_call_seconds=config.GEOCODER_CIRCUIT_SLOW_CALL_SECONDS,
+        ),
+        hedge_after_seconds=config.GEOCODER_HEDGE_AFTER_SECONDS,
+        max_attempts=config.GEOCODER_MAX_ATTEMPTS,
+        timeout_seconds=config.GEOCODER_CALL_TIMEOUT_SECONDS,
+        max_hedged_postcodes=config.GEOCODER_MAX_HEDGED_POSTCODES,
+        max_workers=config.GEOCODER_MAX_WORKERS,
+    )
@@ -0,0 +1,191 @@
+"""A gazetteer is a local copy of the postcode to lat and long data, so
+coords can be looked up without a call to Postcodes.io, i.e. from an
+ONS postcode directory extract or a saved Postcodes.io bulk lookup.
+
+Parsing a few million postcodes from CSV or JSON at startup would be
+slow and every worker process would hold its own copy. Instead, the
+dataset is compiled once into a compact binary file:
+
+    header:  8 byte magic, then the number of records as a uint64
+    records: postcode (8 bytes, ascii, null padded), lat, long (doubles)
+
+Postcodes are stored upper case without spaces, and the records are
+sorted by postcode and are all the same width, so a postcode is found by
+bisecting the records directly. The file is memory-mapped rather than
+read, so startup costs next to nothing, and the pages are shared by all
+the processes that map it.
+
+The outward code and sector centroids used to approximate postcodes
+that don't resolve are compiled from the same dataset, into a small JSON
+file."""
+
+import bisect
+import csv
+import dataclasses
+import json
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Sequence
+from typing import Iterable, Iterator, Optional
+
+from src.domain.postcode import Centroid, CentroidIndex
+
+MAGIC = b"STGAZ001"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<8sdd")
+KEY_SIZE = 8
+
+# The ONS postcode directory uses these coords for postcodes without any.
+ONS_NO_COORDS = (99.999999, 0.0)
+
+
+def postcode_key(postcode: str) -> Optional[bytes]:
+    """The postcode as it's stored, or None if it can't be stored."""
+    key = "".join(postcode.split()).upper().encode("ascii", errors="replace")
+    if not key or len(key) > KEY_SIZE:
+        return None
+    return key.ljust(KEY_SIZE, b"\0")
+
+
+def compile_gazetteer(
+    entries: Iterable[tuple[str, float, float]],
+    gazetteer_file_path: str,
+) -> int:
+    """Compiles (postcode, lat, long) entries into a gazetteer file and
+    returns the number of postcodes in it. The file is written to one side
+    and moved into place, so processes that have the old file mapped keep
+    a consistent view of it."""
+    records = {}
+    for postcode, lat, long in entries:
+        if (key := postcode_key(postcode)) is not None:
+            records[key] = (lat, long)
+
+    directory = os.path.dirname(os.path.abspath(gazetteer_file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(records)))
+            for key in sorted(records):
+                f.write(RECORD.pack(key, *records[key]))
+        os.replace(tmp_path, gazetteer_file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return len(records)
+
+
+def compile_centroid_index(
+    entries: Iterable[tuple[str, float, float]],
+    centroid_index_file_path: str,
+) -> CentroidIndex:
+    centroid_index = CentroidIndex.from_entries(entries)
+    with open(centroid_index_file_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "sectors": {
+                    k: dataclasses.astuple(c) for k, c in centroid_index.sectors.items()
+                },
+                "outward_codes": {
+                    k: dataclasses.astuple(c)
+                    for k, c in centroid_index.outward_codes.items()
+                },
+            },
+            f,
+        )
+    return centroid_index
+
+
+def load_centroid_index(centroid_index_file_path: str) -> CentroidIndex:
+    with open(centroid_index_file_path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    return CentroidIndex(
+        {k: Centroid(*c) for k, c in data["sectors"].items()},
+        {k: Centroid(*c) for k, c in data["outward_codes"].items()},
+    )
+
+
+def iter_postcodesio_entries(path: str) -> Iterator[tuple[str, float, float]]:
+    """Entries from a saved Postcodes.io bulk lookup response, i.e.
+    test_store_postcodes.json."""
+    with open(path, encoding="utf-8") as f:
+        results = json.load(f)["result"]
+
+    for r in results:
+        if r["result"] and r["result"]["latitude"] is not None:
+            yield r["query"], r["result"]["latitude"], r["result"]["longitude"]
+
+
+def iter_ons_entries(path: str) -> Iterator[tuple[str, float, float]]:
+    """Entries from an ONS postcode directory CSV extract, which has the
+    postcode in a pcds (or pcd) column and the coords in lat and long."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            postcode = row.get("pcds") or row.get("pcd")
+            if not postcode or not row.get("lat") or not row.get("long"):
+                continue
+
+            coords = float(row["lat"]), float(row["long"])
+            if coords != ONS_NO_COORDS:
+                yield postcode, *coords
+
+
+def iter_entries(path: str) -> Iterator[tuple[str, float, float]]:
+    """Entries from either kind of source, going by the file extension."""
+    if path.lower().endswith(".csv"):
+        return iter_ons_entries(path)
+    return iter_postcodesio_entries(path)
+
+
+class _Keys(Sequence):
+    """The postcodes of the records, read straight from the map, so they
+    can be bisected without reading every record."""
+
+    def __init__(self, mm: mmap.mmap, count: int):
+        self.mm = mm
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = HEADER.size + i * RECORD.size
+        return self.mm[start : start + KEY_SIZE]
+
+
+class Gazetteer:
+    def __init__(self, gazetteer_file_path: str):
+        with open(gazetteer_file_path, "rb") as f:
+            # An empty file can't be mapped.
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise ValueError(f"{gazetteer_file_path} is not a gazetteer.")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or len(self._mm) != HEADER.size + count * RECORD.size:
+            self._mm.close()
+            raise ValueError(f"{gazetteer_file_path} is not a gazetteer.")
+
+        self._keys = _Keys(self._mm, count)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, postcode: str) -> Optional[tuple[float, float]]:
+        """The lat and long of the postcode, or None if it isn't known."""
+        key = postcode_key(postcode)
+        if key is None:
+            return None
+
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+
+        _, lat, long = RECORD.unpack_from(self._mm, HEADER.size + i * RECORD.size)
+        return lat, long
+
+    def close(self):
+        self._mm.close()
@@ -1,7 +1,24 @@
 import abc
-import json
+import itertools
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+from typing import Iterable, Iterator, Optional, Sequence
 
 import requests
+import requests.adapters
+
+from src import metrics
+from src.adapters import resilience, store_stream
+from src.adapters.gazetteer import Gazetteer, load_centroid_index
+from src.domain import postcode
+from src.domain.bounding_box import BoundingBox
+from src.domain.postcode import CentroidIndex
+from src.exceptions import GeocoderUnavailableError
 
 
 class AbstractStoreRepo(abc.ABC):
@@ -33,14 +50,63 @@ class AbstractStoreRepo(abc.ABC):
     def list(self) -> list:
         raise NotImplementedError
 
+    def iter_stores(self) -> Iterator[dict]:
+        """Yields the stores one at a time, so callers can work through a
+        very large catalog without holding all of it. Repos that can read
+        their stores incrementally should override this."""
+        return iter(self.list())
+
+    def version(self):
+        """Returns a value that changes whenever the stores change, so
+        callers holding on to the stores know when to reload them. None
+        means the repo can't tell, in which case the stores are assumed
+        not to change."""
+        return None
+
+    def candidates_within_radius(
+        self,
+        lat: float,
+        long: float,
+        radius_km: float,
+        version,
+    ) -> Optional[Sequence[int]]:
+        """Returns the positions, in the catalog table built from the stores
+        at version, of the stores that may be within radius_km of lat and
+        long, found with an index the repo keeps. The exact distances are
+        left to the caller. None means the repo keeps no such index, or its
+        stores have moved on from version, in which case the caller should
+        search the catalog itself."""
+        return None
+
 
 class StoreFileRepo(AbstractStoreRepo):
-    def __init__(self, store_file_path: str):
+    """The stores file is either a JSON array of stores or, if it ends in
+    .ndjson or .jsonl, one store per line. Either way it's parsed
+    incrementally, optionally through a memory map."""
+
+    def __init__(
+        self,
+        store_file_path: str,
+        use_mmap: bool = False,
+        chunk_size: int = store_stream.DEFAULT_CHUNK_SIZE,
+    ):
         self.store_file_path: str = store_file_path
+        self.use_mmap = use_mmap
+        self.chunk_size = chunk_size
 
     def list(self) -> list:
-        with open(self.store_file_path, encoding="utf-8") as f:
-            return json.load(f)
+        return list(self.iter_stores())
+
+    def iter_stores(self) -> Iterator[dict]:
+        return store_stream.iter_stores_file(
+            self.store_file_path,
+            chunk_size=self.chunk_size,
+            use_mmap=self.use_mmap,
+        )
+
+    def version(self):
+        stat = os.stat(self.store_file_path)
+        return stat.st_mtime_ns, stat.st_size
 
 
 class AbstractStorePostcodeRepo(abc.ABC):
@@ -53,25 +119,114 @@ class AbstractStorePostcodeRepo(abc.ABC):
 
 
 class PostcodesIORepo(AbstractStorePostcodeRepo):
-    def __init__(self, bulk_postcodes_url: str, timeout=10):
+    """Postcodes.io caps bulk lookups at 100 postcodes per request, so the
+    postcodes are split into chunks within that limit. The chunks are sent
+    concurrently on a bounded thread pool and the results merged.
+
+    Repos are created per request, so the keep-alive session is shared by
+    all instances rather than held on the instance. Otherwise we'd open a
+    new connection (and TLS handshake) to Postcodes.io every time. The
+    thread pool is shared too, and sized to the session's connection pool,
+    so however many requests are geocoding at once there are never more
+    chunks in flight than connections to send them on."""
+
+    MAX_BULK_POSTCODES = 100
+
+    _shared_session = None
+    _shared_session_lock = threading.Lock()
+    _shared_executor = None
+    _shared_executor_lock = threading.Lock()
+
+    def __init__(
+        self,
+        bulk_postcodes_url: str,
+        timeout=10,
+        chunk_size: int = MAX_BULK_POSTCODES,
+        max_workers: int = 4,
+        session: Optional[requests.Session] = None,
+    ):
+        if not 0 < chunk_size <= self.MAX_BULK_POSTCODES:
+            raise ValueError(
+                f"chunk_size must be between 1 and {self.MAX_BULK_POSTCODES}."
+            )
+
         self.bulk_postcodes_url: str = bulk_postcodes_url
         self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.session = session or self._get_shared_session(max_workers)
+
+    @classmethod
+    def _get_shared_session(cls, pool_size: int) -> requests.Session:
+        with cls._shared_session_lock:
+            if cls._shared_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=pool_size,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                cls._shared_session = session
+            return cls._shared_session
+
+    @classmethod
+    def _get_shared_executor(cls, max_workers: int) -> ThreadPoolExecutor:
+        with cls._shared_executor_lock:
+            if cls._shared_executor is None:
+                cls._shared_executor = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix="postcodesio",
+                )
+            return cls._shared_executor
 
     def postcode_to_coords_map(
         self,
         postcodes: list[str],
     ) -> dict:
-        # Call postcodes.io api for lat and long
-        # of all stores.
-        res = requests.post(
-            self.bulk_postcodes_url,
-            data={"postcodes": postcodes},
-            timeout=self.timeout,
+        postcodes = list(dict.fromkeys(postcodes))
+        chunks = [
+            postcodes[i : i + self.chunk_size]
+            for i in range(0, len(postcodes), self.chunk_size)
+        ]
+
+        if len(chunks) <= 1 or self.max_workers <= 1:
+            results = [self._fetch_chunk(c) for c in chunks]
+        else:
+            executor = self._get_shared_executor(self.max_workers)
+            results = list(executor.map(self._fetch_chunk, chunks))
+
+        coords_map = {}
+        for r in results:
+            coords_map.update(r)
+        return coords_map
+
+    def _fetch_chunk(self, postcodes: list[str]) -> dict:
+        metrics.UPSTREAM_BATCH_POSTCODES.labels(upstream="postcodesio").observe(
+            len(postcodes)
         )
 
+        # Call postcodes.io api for lat and long
+        # of the stores in this chunk.
+        try:
+            with metrics.UPSTREAM_REQUEST_SECONDS.labels(upstream="postcodesio").time():
+                res = self.session.post(
+                    self.bulk_postcodes_url,
+                    data={"postcodes": postcodes},
+                    timeout=self.timeout,
+                )
+                res.raise_for_status()
+        except Exception:
+            metrics.UPSTREAM_REQUESTS.labels(
+                upstream="postcodesio",
+                outcome="error",
+            ).inc()
+            raise
+        metrics.UPSTREAM_REQUESTS.labels(upstream="postcodesio", outcome="ok").inc()
+
         # Map postcodes to their coords.
         entries = res.json()["result"]
-        return {
+        coords_map = {
             e["query"]: {
                 "lat": e["result"]["latitude"],
                 "long": e["result"]["longitude"],
@@ -79,3 +234,646 @@ class PostcodesIORepo(AbstractStorePostcodeRepo):
             for e in entries
             if e["result"]
         }
+        metrics.GEOCODE_UNRESOLVED_POSTCODES.labels(upstream="postcodesio").inc(
+            len(postcodes) - len(coords_map)
+        )
+        return coords_map
+
+
+class GazetteerStorePostcodeRepo(AbstractStorePostcodeRepo):
+    """Looks postcodes up in a local gazetteer file, compiled with the
+    compile-gazetteer command, so there's no network call at all.
+
+    Repos are created per request, so the mapped gazetteer is shared by
+    all instances rather than opened by each. It's opened again once the
+    file is replaced, i.e. by compiling a newer dataset."""
+
+    _shared_gazetteers: dict = {}
+    _shared_gazetteers_lock = threading.Lock()
+
+    def __init__(self, gazetteer_file_path: str):
+        self.gazetteer_file_path = gazetteer_file_path
+
+    def postcode_to_coords_map(
+        self,
+        postcodes: list[str],
+    ) -> dict:
+        gazetteer = self._get_shared_gazetteer(self.gazetteer_file_path)
+
+        coords_map = {}
+        for p in postcodes:
+            if coords := gazetteer.lookup(p):
+                coords_map[p] = {"lat": coords[0], "long": coords[1]}
+        return coords_map
+
+    @classmethod
+    def _get_shared_gazetteer(cls, path: str) -> Gazetteer:
+        stat = os.stat(path)
+        file_id = stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+        with cls._shared_gazetteers_lock:
+            shared = cls._shared_gazetteers.get(path)
+            if shared is None or shared[0] != file_id:
+                # Lookups still running on the old map keep it alive.
+                shared = file_id, Gazetteer(path)
+                cls._shared_gazetteers[path] = shared
+            return shared[1]
+
+
+class FallbackStorePostcodeRepo(AbstractStorePostcodeRepo):
+    """Asks each repo in turn for the postcodes the ones before it didn't
+    resolve, i.e. the local gazetteer first and Postcodes.io for the
+    rest."""
+
+    def __init__(self, repos: list[AbstractStorePostcodeRepo]):
+        self.repos = repos
+
+    def postcode_to_coords_map(
+        self,
+        postcodes: list[str],
+    ) -> dict:
+        coords_map = {}
+        missing = list(dict.fromkeys(postcodes))
+        for r in self.repos:
+            if not missing:
+                break
+            found = r.postcode_to_coords_map(missing)
+            coords_map.update((p, found[p]) for p in missing if p in found)
+            missing = [p for p in missing if p not in found]
+        return coords_map
+
+
+class NormalisingStorePostcodeRepo(AbstractStorePostcodeRepo):
+    """Normalises the postcodes, i.e. "cm201fe" to "CM20 1FE", before
+    they're looked up, so that however a postcode is written it's looked
+    up (and cached) only once. The coords are returned under the postcodes
+    as they were given."""
+
+    def __init__(self, wrapped: AbstractStorePostcodeRepo):
+        self.wrapped = wrapped
+
+    def postcode_to_coords_map(
+        self,
+        postcodes: list[str],
+    ) -> dict:
+        normalised = {p: postcode.normalise(p) for p in postcodes}
+        found = self.wrapped.postcode_to_coords_map(
+            list(dict.fromkeys(normalised.values())),
+        )
+        return {p: found[n] for p, n in normalised.items() if n in found}
+
+
+class CentroidFallbackStorePostcodeRepo(AbstractStorePostcodeRepo):
+    """Postcodes that don't resolve get the centroid of their sector, or
+    failing that their outward code, from a precomputed centroid index.
+    There's no network call involved. The coords are flagged as
+    approximate.
+
+    As with the gazetteer, the centroid index is loaded once and shared
+    by all instances, until the file is replaced."""
+
+    _shared_indexes: dict = {}
+    _shared_indexes_lock = threading.Lock()
+
+    def __init__(
+        self,
+        wrapped: AbstractStorePostcodeRepo,
+        centroid_index_file_path: str,
+    ):
+        self.wrapped = wrapped
+        self.centroid_index_file_path = centroid_index_file_path
+
+    def postcode_to_coords_map(
+        self,
+        postcodes: list[str],
+    ) -> dict:
+        coords_map = self.wrapped.postcode_to_coords_map(postcodes)
+
+        missing = [p for p in postcodes if p not in coords_map]
+        if not missing:
+            return coords_map
+
+        centroid_index = self._get_shared_index(self.centroid_index_file_path)
+        for p in missing:
+            if centroid := centroid_index.lookup(p):
+                coords_map[p] = {
+                    "lat": centroid.lat,
+                    "long": centroid.long,
+                    "approximate": True,
+                }
+        return coords_map
+
+    @classmethod
+    def _get_shared_index(cls, path: str) -> CentroidIndex:
+        stat = os.stat(path)
+        file_id = stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+        with cls._shared_indexes_lock:
+            shared = cls._shared_indexes.get(path)
+            if shared is None or shared[0] != file_id:
+                shared = file_id, load_centroid_index(path)
+                cls._shared_indexes[path] = shared
+            return shared[1]
+
+
+class SqliteCachingStorePostcodeRepo(AbstractStorePostcodeRepo):
+    """Store coordinates almost never change, yet every page view used to
+    make a round trip to Postcodes.io for all of them. This repo decorates
+    another AbstractStorePostcodeRepo with a persistent cache held in a
+    local SQLite file, so only cache misses are sent to the wrapped repo.
+
+    Each entry carries its own expiry. Postcodes that the wrapped repo
+    could not resolve are cached too (negative caching), but for a shorter
+    time, so we don't keep asking for postcodes we know will fail. The
+    number of entries is bounded and the least recently used entries are
+    evicted first.
+
+    A connection is opened per call rather than held on the instance, as
+    sqlite3 connections cannot be shared between threads and the repos are
+    created per request. For the same reason the schema is created once
+    per cache file, the first time any instance uses it, rather than on
+    every connection."""
+
+    # SQLite limits the number of host parameters in a single statement.
+    _MAX_PARAMS = 500
+
+    _schema_ready_paths: set = set()
+    _schema_lock = threading.Lock()
+
+    def __init__(
+        self,
+        wrapped: AbstractStorePostcodeRepo,
+        cache_file_path: str,
+        ttl_seconds: float,
+        negative_ttl_seconds: float,
+        max_entries: int,
+        clock=time.time,
+    ):
+        self.wrapped = wrapped
+        self.cache_file_path = cache_file_path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+
+    def postcode_to_coords_map(
+        self,
+        postcodes: list[str],
+    ) -> dict:
+        postcodes = list(dict.fromkeys(postcodes))
+        now = self.clock()
+
+        with closing(self._connect()) as conn, conn:
+            cached = self._select(conn, postcodes, now)
+            misses = [p for p in postcodes if p not in cached]
+            metrics.GEOCODE_CACHE_LOOKUPS.labels(result="hit").inc(len(cached))
+            metrics.GEOCODE_CACHE_LOOKUPS.labels(result="miss").inc(len(misses))
+
+            if cached:
+                self._touch(conn, list(cached), now)
+
+        coords_map = {p: c for p, c in cached.items() if c is not None}
+        if not misses:
+            return coords_map
+
+        fetched = self.wrapped.postcode_to_coords_map(misses)
+
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO postcode_coords"
+                " (postcode, lat, long, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        (
+                            p,
+                            fetched[p]["lat"],
+                            fetched[p]["long"],
+                            now + self.ttl_seconds,
+                            now,
+                        )
+                        if p in fetched
+                        else (p, None, None, now + self.negative_ttl_seconds, now)
+                    )
+                    for p in misses
+                ],
+            )
+            self._evict(conn)
+
+        coords_map.update(fetched)
+        return coords_map
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.cache_file_path not in self._schema_ready_paths:
+            self._ensure_schema()
+        return sqlite3.connect(self.cache_file_path, timeout=5)
+
+    def _ensure_schema(self):
+        cls = type(self)
+        with cls._schema_lock:
+            if self.cache_file_path in cls._schema_ready_paths:
+                return
+            with closing(sqlite3.connect(self.cache_file_path, timeout=5)) as conn:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS postcode_coords ("
+                        " postcode TEXT PRIMARY KEY,"
+                        " lat REAL,"
+                        " long REAL,"
+                        " expires_at REAL NOT NULL,"
+                        " accessed_at REAL NOT NULL)"
+                    )
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS postcode_coords_accessed_at"
+                        " ON postcode_coords (accessed_at)"
+                    )
+            cls._schema_ready_paths.add(self.cache_file_path)
+
+    def _select(self, conn, postcodes: list[str], now: float) -> dict:
+        """Returns the unexpired entries. Negative entries map to None."""
+        cached = {}
+        for i in range(0, len(postcodes), self._MAX_PARAMS):
+            chunk = postcodes[i : i + self._MAX_PARAMS]
+            rows = conn.execute(
+                "SELECT postcode, lat, long FROM postcode_coords"
+                f" WHERE expires_at > ? AND postcode IN ({_params(chunk)})",
+                [now, *chunk],
+            )
+            for p, lat, long in rows:
+                cached[p] = None if lat is None else {"lat": lat, "long": long}
+        return cached
+
+    def _touch(self, conn, postcodes: list[str], now: float):
+        for i in range(0, len(postcodes), self._MAX_PARAMS):
+            chunk = postcodes[i : i + self._MAX_PARAMS]
+            conn.execute(
+                "UPDATE postcode_coords SET accessed_at = ?"
+                f" WHERE postcode IN ({_params(chunk)})",
+                [now, *chunk],
+            )
+
+    def _evict(self, conn):
+        (count,) = conn.execute("SELECT COUNT(*) FROM postcode_coords").fetchone()
+        if count <= self.max_entries:
+            return
+
+        conn.execute(
+            "DELETE FROM postcode_coords WHERE postcode IN ("
+            " SELECT postcode FROM postcode_coords"
+            " ORDER BY accessed_at ASC LIMIT ?)",
+            (count - self.max_entries,),
+        )
+
+
+class ResilientStorePostcodeRepo(AbstractStorePostcodeRepo):
+    """Guards the wrapped repo, i.e. Postcodes.io, so that requests don't
+    wait on it when it's slow or down.
+
+    Postcodes seen before are answered straight away from their last known
+    coords. Once those are stale they're still served, and fetched again
+    in the background. Only postcodes never seen before wait on the
+    wrapped repo, through a circuit breaker so they fail fast with
+    GeocoderUnavailableError while it's failing. Small lookups, i.e. the
+    postcode of a search, are hedged to cut the tail latency. Large ones,
+    i.e. building the catalog, are already split up and sent concurrently
+    by PostcodesIORepo, so they're made once and aren't held to the
+    deadline or counted as slow."""
+
+    def __init__(
+        self,
+        wrapped: AbstractStorePostcodeRepo,
+        guard: resilience.GeocoderGuard,
+    ):
+        self.wrapped = wrapped
+        self.guard = guard
+
+    def postcode_to_coords_map(
+        self,
+        postcodes: list[str],
+    ) -> dict:
+        postcodes = list(dict.fromkeys(postcodes))
+        fresh, stale, missing = self.guard.last_known.lookup(postcodes)
+
+        if stale:
+            self.guard.refresh_in_background(list(stale), self._fetch)
+
+        coords_map = {p: c for p, c in (fresh | stale).items() if c is not None}
+        if missing:
+            coords_map.update(self._fetch(missing))
+        return coords_map
+
+    def _fetch(self, postcodes: list[str]) -> dict:
+        guard = self.guard
+        hedged = len(postcodes) <= guard.max_hedged_postcodes
+
+        def fetch():
+            if not hedged:
+                return self.wrapped.postcode_to_coords_map(postcodes)
+            return resilience.hedged_call(
+                lambda: self.wrapped.postcode_to_coords_map(postcodes),
+                guard.executor,
+                guard.hedge_after_seconds,
+                guard.max_attempts,
+                guard.timeout_seconds,
+            )
+
+        try:
+            fetched = guard.breaker.call(fetch, check_slow=hedged)
+        except GeocoderUnavailableError:
+            raise
+        except Exception as e:
+            raise GeocoderUnavailableError(
+                f"The geocoder failed to look up {len(postcodes)} postcodes."
+            ) from e
+
+        guard.last_known.put(postcodes, fetched)
+        return fetched
+
+
+class CoalescingStorePostcodeRepo(AbstractStorePostcodeRepo):
+    """Under load, many requests look up the same postcodes at the same
+    time, i.e. every request to / when the catalog is rebuilt, and each
+    would send its own identical lookup to the wrapped repo.
+
+    Instead, concurrent lookups share the ones in flight. Each postcode is
+    only looked up by the first caller to ask for it. Callers that ask for
+    it while that lookup is in flight wait on its result, and only look
+    up the postcodes that nobody else is. If the shared lookup fails they
+    all get its error.
+
+    Repos are created per request, so the lookups in flight are shared by
+    all instances. Lookups are only shared between repos with the same
+    name, i.e. that wrap the same kind of repo."""
+
+    _shared_in_flight: dict = {}
+    _shared_in_flight_lock = threading.Lock()
+
+    def __init__(self, wrapped: AbstractStorePostcodeRepo, name: str):
+        self.wrapped = wrapped
+        self.name = name
+
+    def postcode_to_coords_map(
+        self,
+        postcodes: list[str],
+    ) -> dict:
+        postcodes = list(dict.fromkeys(postcodes))
+        in_flight = self._shared_in_flight
+
+        with self._shared_in_flight_lock:
+            waiting = {
+                p: in_flight[self.name, p]
+                for p in postcodes
+                if (self.name, p) in in_flight
+            }
+            mine = [p for p in postcodes if p not in waiting]
+            future = Future()
+            for p in mine:
+                in_flight[self.name, p] = future
+
+        coords_map = {}
+        if mine:
+            # Our own lookup goes first, and never waits on anyone else's,
+            # so callers can't end up waiting on each other.
+            try:
+                fetched = self.wrapped.postcode_to_coords_map(mine)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(fetched)
+            finally:
+                with self._shared_in_flight_lock:
+                    for p in mine:
+                        del in_flight[self.name, p]
+
+            coords_map.update((p, fetched[p]) for p in mine if p in fetched)
+
+        for p, f in waiting.items():
+            fetched = f.result()
+            if p in fetched:
+                coords_map[p] = fetched[p]
+        return coords_map
+
+
+class SqliteStoreRepo(AbstractStoreRepo):
+    """Keeps the stores in SQLite, with their geocoded coords alongside
+    them, so the catalog doesn't have to geocode them again on every load.
+    The database is filled in one go with import_stores, i.e. by the
+    import-stores command, from stores.json and the geocoding results.
+
+    Stores with coords are also entered into an R*Tree, so the stores near
+    a point can be found with an indexed query rather than a scan. The
+    R*Tree narrows the search down to a bounding box around the point, and
+    the caller checks the exact haversine distance for those only. Its ids
+    are the stores' positions in the catalog table, so the candidates can
+    be looked up in the catalog without reading the stores back. Stores
+    the import couldn't geocode aren't in it, even if the catalog manages
+    to geocode them later, until they're imported again.
+
+    The catalog asks for the version on every request, so that's a single
+    SELECT on a read-only connection kept open for the process. Otherwise,
+    as with the geocode cache, a connection is opened per call rather than
+    held on the instance, and the schema is only created by the import."""
+
+    # Keyed by process id and database, as a connection can't be carried
+    # over into a forked worker process.
+    _version_connections: dict = {}
+    _version_connections_lock = threading.Lock()
+
+    def __init__(self, db_file_path: str, batch_size: int = 10_000):
+        self.db_file_path = db_file_path
+        self.batch_size = batch_size
+
+    def ensure_schema(self):
+        with closing(sqlite3.connect(self.db_file_path, timeout=5)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stores ("
+                " id INTEGER PRIMARY KEY,"
+                " name TEXT NOT NULL,"
+                " postcode TEXT NOT NULL,"
+                " lat REAL,"
+                " long REAL,"
+                " approximate INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS stores_rtree"
+                " USING rtree (id, min_lat, max_lat, min_long, max_long)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value)"
+            )
+
+    def import_stores(
+        self,
+        stores: Iterable[dict],
+        store_postcode_repo: Optional[AbstractStorePostcodeRepo] = None,
+    ) -> int:
+        """Replaces all the stores with the given ones, in a single
+        transaction, and returns how many were imported. Stores without
+        coords are geocoded with store_postcode_repo, a batch at a time."""
+        count = 0
+        stores = iter(stores)
+        self.ensure_schema()
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM stores")
+            conn.execute("DELETE FROM stores_rtree")
+
+            while batch := list(itertools.islice(stores, self.batch_size)):
+                missing = [s["postcode"] for s in batch if not _has_coords(s)]
+                postcode_coords_map = {}
+                if missing and store_postcode_repo is not None:
+                    postcode_coords_map = store_postcode_repo.postcode_to_coords_map(
+                        list(dict.fromkeys(missing)),
+                    )
+
+                rows = []
+                for id_, s in enumerate(batch, start=count + 1):
+                    coords = postcode_coords_map.get(s["postcode"]) or s
+                    rows.append(
+                        (
+                            id_,
+                            s["name"],
+                            s["postcode"],
+                            coords.get("lat"),
+                            coords.get("long"),
+                            bool(coords.get("approximate")),
+                        )
+                    )
+                count += len(batch)
+
+                conn.executemany(
+                    "INSERT INTO stores (id, name, postcode, lat, long, approximate)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+            # The catalog table is sorted by name, with stores of the same
+            # name in the order they're read, i.e. by id, and its positions
+            # count from 0.
+            conn.execute(
+                "INSERT INTO stores_rtree (id, min_lat, max_lat, min_long, max_long)"
+                " SELECT position, lat, lat, long, long FROM ("
+                "  SELECT ROW_NUMBER() OVER (ORDER BY name, id) - 1 AS position,"
+                "  lat, long FROM stores)"
+                " WHERE lat IS NOT NULL AND long IS NOT NULL"
+            )
+
+            conn.execute(
+                "INSERT INTO store_meta (key, value) VALUES ('generation', 1)"
+                " ON CONFLICT (key) DO UPDATE SET value = value + 1"
+            )
+
+        return count
+
+    def list(self) -> list:
+        return list(self.iter_stores())
+
+    def iter_stores(self) -> Iterator[dict]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT name, postcode, lat, long, approximate FROM stores"
+                " ORDER BY id"
+            )
+            for row in rows:
+                yield _store_record(*row)
+
+    def candidates_within_radius(
+        self,
+        lat: float,
+        long: float,
+        radius_km: float,
+        version,
+    ) -> Optional[Sequence[int]]:
+        bounding_box = BoundingBox.around(lat, long, radius_km)
+
+        # A box crossing the antimeridian is queried as its two halves.
+        if bounding_box.crosses_antimeridian:
+            long_ranges = [
+                (bounding_box.min_long, 180.0),
+                (-180.0, bounding_box.max_long),
+            ]
+        else:
+            long_ranges = [(bounding_box.min_long, bounding_box.max_long)]
+
+        with closing(self._connect()) as conn:
+            # In one read transaction, so the R*Tree is the one that goes
+            # with the generation, even if an import commits in between.
+            conn.execute("BEGIN")
+            try:
+                rows = conn.execute(
+                    "SELECT value FROM store_meta WHERE key = 'generation'"
+                ).fetchall()
+                if not rows or rows[0][0] != version:
+                    return None
+
+                positions = []
+                for min_long, max_long in long_ranges:
+                    positions += [
+                        position
+                        for (position,) in conn.execute(
+                            "SELECT id FROM stores_rtree"
+                            " WHERE max_lat >= ? AND min_lat <= ?"
+                            " AND max_long >= ? AND min_long <= ?",
+                            (
+                                bounding_box.min_lat,
+                                bounding_box.max_lat,
+                                min_long,
+                                max_long,
+                            ),
+                        )
+                    ]
+                return positions
+            finally:
+                conn.rollback()
+
+    def version(self):
+        """Each import bumps the generation, so the catalog reloads. A
+        database that hasn't been imported into yet is at generation 0."""
+        with self._version_connections_lock:
+            conn = self._version_connection()
+            if conn is None:
+                return 0
+            # fetchall, so the statement is finished and doesn't hold the
+            # database's read lock against the next import.
+            rows = conn.execute(
+                "SELECT value FROM store_meta WHERE key = 'generation'"
+            ).fetchall()
+        return rows[0][0] if rows else 0
+
+    def _version_connection(self) -> Optional[sqlite3.Connection]:
+        key = (os.getpid(), self.db_file_path)
+        conn = self._version_connections.get(key)
+        if conn is None:
+            if not os.path.exists(self.db_file_path):
+                return None
+            conn = sqlite3.connect(
+                f"{pathlib.Path(self.db_file_path).resolve().as_uri()}?mode=ro",
+                uri=True,
+                timeout=5,
+                check_same_thread=False,
+            )
+            self._version_connections[key] = conn
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_file_path, timeout=5)
+
+
+def _has_coords(s: dict) -> bool:
+    return s.get("lat") is not None and s.get("long") is not None
+
+
+def _store_record(name, postcode, lat, long, approximate=False) -> dict:
+    """Coords are left out when the store doesn't have any, the same as
+    in stores.json."""
+    if lat is None or long is None:
+        return {"name": name, "postcode": postcode}
+    record = {"name": name, "postcode": postcode, "lat": lat, "long": long}
+    if approximate:
+        record["approximate"] = True
+    return record
+
+
+def _params(values: list) -> str:
+    return ", ".join("?" * len(values))
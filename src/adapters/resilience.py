@@ -0,0 +1,300 @@
+"""Postcodes.io is a remote service and every so often it's slow or down.
+Without anything in front of it, each request waits out the full timeout
+on every lookup and the worker threads pile up behind it. These are the
+building blocks used to guard it:
+
+    LastKnownCoords:  the last coords seen for each postcode, so they can
+                      be served straight away and refreshed in the
+                      background once they're stale.
+    CircuitBreaker:   stops calling the service after repeated failures or
+                      slow calls, so requests fail fast rather than wait,
+                      and lets a trial call through now and then to see if
+                      it has recovered.
+    hedged_call:      starts a second attempt if the first is slow, or
+                      retries straight away if it fails, and takes
+                      whichever answers first, which cuts the tail latency.
+
+GeocoderGuard holds one of each, along with the threads they run on, for
+ResilientStorePostcodeRepo. Repos are created per request, so the guard
+is shared by the whole process."""
+
+import collections
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from src.exceptions import GeocoderUnavailableError
+
+
+class CircuitOpenError(GeocoderUnavailableError):
+    def __init__(self):
+        super().__init__(
+            "The geocoder has failed repeatedly, so it isn't being called."
+        )
+
+
+class CircuitBreaker:
+    """Closed is the normal state, where calls go through. After
+    failure_threshold failures in a row, where a call that takes longer than
+    slow_call_seconds counts as a failure too, the circuit opens and calls
+    are refused. After reset_seconds it's half open: one trial call is let
+    through, which closes the circuit if it succeeds or opens it again if
+    it doesn't."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_seconds: float,
+        slow_call_seconds: Optional[float] = None,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self.clock() - self._opened_at < self.reset_seconds:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow_request(self) -> bool:
+        """Whether a call may go through. In the half open state only the
+        first caller gets to make the trial call."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+            self._trial_in_flight = False
+
+    def call(self, fn: Callable, check_slow: bool = True):
+        """Calls fn through the breaker, raising CircuitOpenError without
+        calling it if the circuit is open. Calls that are expected to take
+        a while, i.e. large bulk lookups, can opt out of the slow check."""
+        if not self.allow_request():
+            raise CircuitOpenError()
+
+        started_at = self.clock()
+        try:
+            result = fn()
+        except Exception:
+            self.record_failure()
+            raise
+
+        if (
+            check_slow
+            and self.slow_call_seconds is not None
+            and self.clock() - started_at > self.slow_call_seconds
+        ):
+            # The result is still good, it just took too long.
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
+
+
+def hedged_call(
+    fn: Callable,
+    executor: ThreadPoolExecutor,
+    hedge_after_seconds: float,
+    max_attempts: int,
+    timeout_seconds: float,
+):
+    """Calls fn on the executor and returns the first result from up to
+    max_attempts attempts. Another attempt is started whenever the ones
+    in flight have been going for hedge_after_seconds without an answer,
+    or straight away when one fails. fn must be safe to call more than
+    once, i.e. a lookup.
+
+    Raises TimeoutError if there's no answer within timeout_seconds, or
+    the last error if every attempt fails. Attempts still in flight are
+    left to finish on their own."""
+    deadline = time.monotonic() + timeout_seconds
+    pending = {executor.submit(fn)}
+    attempts = 1
+    error: Optional[BaseException] = None
+
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"No answer within {timeout_seconds} seconds.")
+
+        done, pending = wait(
+            pending,
+            timeout=(
+                min(remaining, hedge_after_seconds)
+                if attempts < max_attempts
+                else remaining
+            ),
+            return_when=FIRST_COMPLETED,
+        )
+        for f in done:
+            if f.exception() is None:
+                return f.result()
+            error = f.exception()
+
+        if attempts < max_attempts and time.monotonic() < deadline:
+            pending.add(executor.submit(fn))
+            attempts += 1
+
+    raise error
+
+
+class LastKnownCoords:
+    """The last coords fetched for each postcode and when, or None for
+    postcodes that didn't resolve. It's bounded, with the least recently
+    used postcodes evicted first."""
+
+    def __init__(
+        self,
+        stale_after_seconds: float,
+        max_entries: int,
+        clock=time.monotonic,
+    ):
+        self.stale_after_seconds = stale_after_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+
+    def lookup(self, postcodes: list[str]) -> tuple[dict, dict, list[str]]:
+        """Splits the postcodes into those with fresh coords, those with
+        stale coords and those without any, i.e. (fresh, stale, missing)."""
+        fresh, stale, missing = {}, {}, []
+        now = self.clock()
+
+        with self._lock:
+            for p in postcodes:
+                entry = self._entries.get(p)
+                if entry is None:
+                    missing.append(p)
+                    continue
+
+                self._entries.move_to_end(p)
+                fetched_at, coords = entry
+                if now - fetched_at < self.stale_after_seconds:
+                    fresh[p] = coords
+                else:
+                    stale[p] = coords
+        return fresh, stale, missing
+
+    def put(self, postcodes: list[str], coords_map: dict):
+        now = self.clock()
+        with self._lock:
+            for p in postcodes:
+                self._entries[p] = now, coords_map.get(p)
+                self._entries.move_to_end(p)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class GeocoderGuard:
+    """Everything ResilientStorePostcodeRepo needs that outlives a request.
+    Background refreshes run one at a time on their own thread, so they
+    can't crowd out the attempts made on behalf of requests."""
+
+    _shared_guards: dict = {}
+    _shared_guards_lock = threading.Lock()
+
+    def __init__(
+        self,
+        last_known: LastKnownCoords,
+        breaker: CircuitBreaker,
+        hedge_after_seconds: float,
+        max_attempts: int,
+        timeout_seconds: float,
+        max_hedged_postcodes: int,
+        max_workers: int,
+    ):
+        self.last_known = last_known
+        self.breaker = breaker
+        self.hedge_after_seconds = hedge_after_seconds
+        self.max_attempts = max_attempts
+        self.timeout_seconds = timeout_seconds
+        self.max_hedged_postcodes = max_hedged_postcodes
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="geocoder",
+        )
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="geocoder-refresh",
+        )
+        self._refreshing: set = set()
+        self._refreshing_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, name: str, create: Callable[[], "GeocoderGuard"]):
+        """The guard shared by the process under this name, created on
+        first use."""
+        with cls._shared_guards_lock:
+            guard = cls._shared_guards.get(name)
+            if guard is None:
+                guard = cls._shared_guards[name] = create()
+            return guard
+
+    def refresh_in_background(
+        self,
+        postcodes: list[str],
+        fetch: Callable[[list[str]], dict],
+    ) -> Optional[Future]:
+        """Fetches the postcodes again on the refresh thread, unless
+        they're already being refreshed or the circuit is open. Returns the
+        future of the refresh, or None if there isn't one."""
+        if self.breaker.state == CircuitBreaker.OPEN:
+            return None
+
+        with self._refreshing_lock:
+            postcodes = [p for p in postcodes if p not in self._refreshing]
+            if not postcodes:
+                return None
+            self._refreshing.update(postcodes)
+
+        def refresh():
+            try:
+                fetch(postcodes)
+            except GeocoderUnavailableError:
+                # The stale coords keep being served until a refresh works,
+                # and the breaker has recorded the failure.
+                pass
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.difference_update(postcodes)
+
+        return self._refresh_executor.submit(refresh)
@@ -0,0 +1,152 @@
+"""json.load parses the whole stores file before handing back the first
+store, so peak memory is the entire parsed document, and nothing can
+start until the parsing is done. For a store export of millions of rows
+that is too much.
+
+These readers parse the stores file incrementally instead and yield one
+store at a time. Two formats are supported:
+
+- A JSON array of stores, i.e. stores.json. The file is read in chunks
+  and each store decoded as soon as all of it has been read.
+- NDJSON, i.e. one store per line.
+
+Either can be read through a memory map rather than buffered reads, in
+which case the OS pages the file in as it's read and can drop the pages
+again straight after, as they're backed by the file."""
+
+import codecs
+import json
+import mmap
+import re
+from typing import Iterable, Iterator
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# The characters a JSON number can be made of.
+_NUMBER = re.compile(r"[-+0-9.eE]*")
+
+
+def is_ndjson(path: str) -> bool:
+    return path.lower().endswith(NDJSON_SUFFIXES)
+
+
+def _iter_text_chunks(path: str, chunk_size: int, use_mmap: bool) -> Iterator[str]:
+    if not use_mmap:
+        with open(path, encoding="utf-8") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+        return
+
+    with open(path, "rb") as f:
+        # An empty file can't be mapped.
+        if not f.seek(0, 2):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # A chunk can end part way through a multibyte character.
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            for start in range(0, len(mm), chunk_size):
+                yield decoder.decode(mm[start : start + chunk_size])
+            yield decoder.decode(b"", final=True)
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator:
+    """Yields the elements of a JSON array, given its text in chunks.
+
+    Each element is decoded with the standard decoder once the buffered
+    text holds all of it. Only the element being read is ever buffered,
+    along with at most one chunk."""
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer, pos = "", 0
+    # Where we are in the array: before the "[", before an element, or
+    # after an element, i.e. expecting a "," or the closing "]".
+    state = "start"
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+
+        if pos == len(buffer):
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise json.JSONDecodeError("Unterminated array", buffer, pos)
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        if state == "start":
+            if buffer[pos] != "[":
+                raise json.JSONDecodeError("Expecting '['", buffer, pos)
+            pos += 1
+            state = "first"
+        elif buffer[pos] == "]" and state in ("first", "after"):
+            _check_only_whitespace_left(buffer, pos + 1, chunks)
+            return
+        elif state == "after":
+            if buffer[pos] != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos += 1
+            state = "element"
+        else:
+            # A number is only complete once something that can't be part
+            # of it follows, as otherwise it may carry on into the next
+            # chunk, i.e. "1." then "5".
+            if _NUMBER.match(buffer, pos).end() == len(buffer):
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely the element runs on into the next chunk.
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+
+            yield value
+            pos = end
+            state = "after"
+
+
+def _check_only_whitespace_left(buffer: str, pos: int, chunks: Iterator[str]):
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos < len(buffer):
+            raise json.JSONDecodeError("Extra data", buffer, pos)
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        buffer, pos = chunk, 0
+
+
+def iter_ndjson(chunks: Iterable[str]) -> Iterator:
+    """Yields the values of NDJSON text, given in chunks. Blank lines are
+    skipped."""
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+    if pending.strip():
+        yield json.loads(pending)
+
+
+def iter_stores_file(
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    use_mmap: bool = False,
+) -> Iterator[dict]:
+    """Yields the stores in the file one at a time. Files ending in .ndjson
+    or .jsonl are read as NDJSON, anything else as a JSON array."""
+    chunks = _iter_text_chunks(path, chunk_size, use_mmap)
+    if is_ndjson(path):
+        return iter_ndjson(chunks)
+    return iter_json_array(chunks)
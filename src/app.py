@@ -1,3 +1,99 @@
+"""The application factory. Each call creates and configures a new app,
+so the server, the cli and the tests can each have their own, configured
+for their running mode, rather than all sharing one app that's
+configured by importing modules for their side effects.
+
+The app can optionally be warmed up at startup, i.e. with
+
+    create_app({constants.WARM_UP_STEPS: ("catalog", "geocode", "templates")})
+
+    catalog:    loads and geocodes the stores into the store catalog.
+    geocode:    looks up config.WARM_UP_POSTCODES, i.e. the most searched
+                postcodes, which also opens the connection to Postcodes.io.
+    templates:  compiles the templates.
+
+/readyz reports the app as ready once warm-up has finished, or its time
+budget has run out."""
+
+from typing import Callable, Mapping, Optional
+
 from flask import Flask
 
-app = Flask(__name__, template_folder="entrypoints/templates")
+from src import config, constants
+from src.adapters.factory import DefaultStoreRepoFactory
+from src.entrypoints import api, cli, health, metrics, routes
+from src.entrypoints.fragment_cache import StoreFragmentCache
+from src.srv_layer.catalog import StoreCatalog
+from src.srv_layer.result_cache import ResultCache
+from src.srv_layer.shared_catalog import SharedStoreCatalog
+from src.srv_layer.warm_up import WarmUp
+
+TEMPLATES = ("index.html", "store_item.html")
+
+
+def create_app(app_config: Optional[Mapping] = None) -> Flask:
+    app = Flask(__name__, template_folder="entrypoints/templates")
+
+    app.config[constants.STORE_REPO_FACTORY] = DefaultStoreRepoFactory
+    app.config[constants.WARM_UP_STEPS] = ()
+    app.config[constants.WARM_UP_BUDGET_SECONDS] = config.WARM_UP_BUDGET_SECONDS
+    app.config.update(app_config or {})
+
+    # The catalog is process-level so stores are only loaded and geocoded
+    # once, rather than on every request. With a shared catalog they're
+    # only loaded once for all the processes.
+    if constants.STORE_CATALOG not in app.config:
+        app.config[constants.STORE_CATALOG] = (
+            SharedStoreCatalog(
+                config.SHARED_CATALOG_FILE,
+                config.SHARED_CATALOG_ATTACH_TIMEOUT_SECONDS,
+            )
+            if config.SHARED_CATALOG_FILE
+            else StoreCatalog(app.config[constants.STORE_REPO_FACTORY]())
+        )
+    if constants.NEARBY_RESULT_CACHE not in app.config:
+        app.config[constants.NEARBY_RESULT_CACHE] = ResultCache(
+            config.NEARBY_RESULT_CACHE_MAX_ENTRIES,
+            config.NEARBY_RESULT_CACHE_TTL_SECONDS,
+        )
+    if constants.STORE_FRAGMENT_CACHE not in app.config:
+        app.config[constants.STORE_FRAGMENT_CACHE] = StoreFragmentCache()
+
+    for blueprint in [routes.bp, api.bp, health.bp, metrics.bp, cli.bp]:
+        app.register_blueprint(blueprint)
+
+    warm_up = WarmUp(
+        _warm_up_steps(app, app.config[constants.WARM_UP_STEPS]),
+        app.config[constants.WARM_UP_BUDGET_SECONDS],
+    )
+    app.config[constants.WARM_UP] = warm_up
+    if warm_up.steps:
+        warm_up.start()
+    else:
+        # There's nothing to wait for.
+        warm_up.run()
+
+    return app
+
+
+def _warm_up_steps(app: Flask, names) -> list[tuple[str, Callable[[], None]]]:
+    def catalog():
+        app.config[constants.STORE_CATALOG].snapshot()
+
+    def geocode():
+        store_repo_factory = app.config[constants.STORE_REPO_FACTORY]()
+        store_repo_factory.create_store_postcode_repo().postcode_to_coords_map(
+            list(config.WARM_UP_POSTCODES),
+        )
+
+    def templates():
+        for name in TEMPLATES:
+            app.jinja_env.get_template(name)
+
+    steps = {"catalog": catalog, "geocode": geocode, "templates": templates}
+
+    unknown = [n for n in names if n not in steps]
+    if unknown:
+        raise ValueError(f"Unknown warm-up steps: {', '.join(unknown)}.")
+
+    return [(n, steps[n]) for n in names]
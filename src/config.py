@@ -5,8 +5,152 @@ variables can be set within docker or docker compose."""
 STORES_FILE = "./stores.json"
 POSTCODESIO_BULK_POSTCODES_URL = "https://api.postcodes.io/postcodes"
 
+# The stores file is parsed incrementally, one store at a time, optionally through a
+# memory map. The catalog is built from it in batches of this many stores, each
+# geocoded in one go, so memory stays flat however large the file is.
+STORES_FILE_USE_MMAP = False
+STORE_INGEST_BATCH_SIZE = 10_000
+
+# The stores can instead be read from a SQLite database, with their coords, built from
+# the stores file with `flask --app src.app import-stores`. Set STORES_DB_FILE to the
+# database to use it in place of the stores file.
+STORES_DB_FILE = None
+STORES_DB_IMPORT_FILE = "./stores.sqlite3"
+
+# With several worker processes, the catalog can be built once and shared, rather than
+# built by every worker. `flask --app src.app publish-catalog --watch` builds it,
+# publishes it to a memory-mapped file, and publishes it again whenever the stores
+# change. Set SHARED_CATALOG_FILE to that file for the workers to attach to it
+# read-only. Workers wait up to SHARED_CATALOG_ATTACH_TIMEOUT_SECONDS for it at startup.
+SHARED_CATALOG_FILE = None
+SHARED_CATALOG_PUBLISH_FILE = "./catalog.bin"
+SHARED_CATALOG_WATCH_INTERVAL_SECONDS = 5
+SHARED_CATALOG_ATTACH_TIMEOUT_SECONDS = 30
+
+# Postcodes.io accepts at most 100 postcodes per bulk lookup. Larger lookups are
+# split into chunks and sent concurrently over a shared keep-alive session.
+POSTCODESIO_BULK_CHUNK_SIZE = 100
+POSTCODESIO_MAX_WORKERS = 4
+POSTCODESIO_CONNECT_TIMEOUT_SECONDS = 3.05
+POSTCODESIO_READ_TIMEOUT_SECONDS = 10
+
+# Postcodes.io is guarded so requests don't wait on it when it's slow or down. The last
+# known coords of a postcode are served straight away, and fetched again in the
+# background once they're older than GEOCODER_STALE_AFTER_SECONDS. After
+# GEOCODER_CIRCUIT_FAILURE_THRESHOLD failures or slow calls in a row, new postcodes
+# fail fast for GEOCODER_CIRCUIT_RESET_SECONDS rather than wait. Lookups of up to
+# GEOCODER_MAX_HEDGED_POSTCODES postcodes get another attempt if the first hasn't
+# answered within GEOCODER_HEDGE_AFTER_SECONDS, and give up after
+# GEOCODER_CALL_TIMEOUT_SECONDS. Set GEOCODER_RESILIENCE to False to call it directly.
+GEOCODER_RESILIENCE = True
+GEOCODER_STALE_AFTER_SECONDS = 60 * 60
+GEOCODER_LAST_KNOWN_MAX_ENTRIES = 100_000
+GEOCODER_CIRCUIT_FAILURE_THRESHOLD = 5
+GEOCODER_CIRCUIT_SLOW_CALL_SECONDS = 2
+GEOCODER_CIRCUIT_RESET_SECONDS = 30
+GEOCODER_HEDGE_AFTER_SECONDS = 0.5
+GEOCODER_MAX_ATTEMPTS = 2
+GEOCODER_CALL_TIMEOUT_SECONDS = 3
+GEOCODER_MAX_HEDGED_POSTCODES = POSTCODESIO_BULK_CHUNK_SIZE
+GEOCODER_MAX_WORKERS = 8
+
+# Concurrent lookups of the same postcodes share one call to Postcodes.io, rather than
+# each making their own. Set GEOCODER_COALESCE to False to call it for each lookup.
+GEOCODER_COALESCE = True
+
+# Postcodes can be looked up in a local gazetteer, compiled with
+# `flask --app src.app compile-gazetteer`, rather than Postcodes.io. Set GAZETTEER_FILE
+# to the compiled file to use it. Postcodes missing from it are still looked up on
+# Postcodes.io, unless GAZETTEER_FALLBACK_TO_POSTCODESIO is False.
+GAZETTEER_FILE = None
+GAZETTEER_COMPILE_FILE = "./gazetteer.bin"
+GAZETTEER_FALLBACK_TO_POSTCODESIO = True
+
+# Postcodes that can't be resolved get the centroid of their sector, or failing that
+# their outward code, flagged as approximate. The centroids are compiled from a
+# postcode dataset with `flask --app src.app compile-centroids`. Set
+# CENTROID_INDEX_FILE to the compiled file to use it.
+CENTROID_INDEX_FILE = None
+CENTROID_INDEX_COMPILE_FILE = "./centroids.json"
+
 # Lat and long for some postcodes cannot be retrieved. We can agree with the business
 # on what is an acceptable success rate of retrieval, i.e. 93%.
 POSTCODESIO_BULK_POSTCODES_SUCCESS_RATE = 0.93
 
 TEST_STORE_POSTCODES_FILE = "./test_store_postcodes.json"
+
+# Store coords rarely change, so geocoding results are cached on disk in front of
+# Postcodes.io. Postcodes that fail to resolve are cached for a shorter time.
+# Set GEOCODE_CACHE_FILE to None to disable the cache.
+GEOCODE_CACHE_FILE = "./geocode_cache.sqlite3"
+GEOCODE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+GEOCODE_CACHE_NEGATIVE_TTL_SECONDS = 60 * 60
+GEOCODE_CACHE_MAX_ENTRIES = 100_000
+
+# Nearby searches check a bounding box around the query point before the exact
+# distance. Catalogs of at least this many stores also get a spatial index, which
+# narrows the search down further but takes longer to build.
+SPATIAL_INDEX_MIN_STORES = 1000
+
+# Nearby searches are around this postcode and within this radius, unless the
+# caller asks for different ones. The radius can be at most half way around the
+# earth, beyond which every store is within it.
+NEARBY_STORES_DEFAULT_POSTCODE = "CM20 1FE"
+NEARBY_STORES_DEFAULT_RADIUS_KM = 30
+NEARBY_STORES_MAX_RADIUS_KM = 20_016
+
+# The number of stores returned by a nearest stores search, unless the caller asks
+# for a different number, and the most they can ask for.
+NEAREST_STORES_DEFAULT_K = 5
+NEAREST_STORES_MAX_K = 100
+
+# The number of stores in a page of JSON api results, unless the caller asks for a
+# different number, and the most they can ask for.
+API_DEFAULT_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# The Cache-Control header sent with the store listings. They also carry an ETag and
+# Last-Modified, so caches can cheaply revalidate them once they go stale.
+HTTP_CACHE_CONTROL = "public, max-age=60"
+
+# Finished nearby search results are cached in memory, keyed by postcode and radius.
+# Radii are rounded up to a bucket of this many km so that similar searches share a
+# result. Set the bucket to None to key on the exact radius.
+NEARBY_RESULT_CACHE_MAX_ENTRIES = 1024
+NEARBY_RESULT_CACHE_TTL_SECONDS = 5 * 60
+NEARBY_RESULT_CACHE_RADIUS_BUCKET_KM = 5
+
+# Batch nearby searches take at most this many origin postcodes. The distances from
+# the origins to the stores are calculated a block of origins at a time, with at most
+# this many distances in a block.
+BATCH_NEARBY_MAX_POSTCODES = 1000
+BATCH_NEARBY_MAX_BLOCK_CELLS = 1_000_000
+
+# Store listings of at least this many stores are streamed, rather than rendered in
+# full before they're sent. Either way, the stores are written out this many at a time.
+STORE_LIST_STREAM_MIN_STORES = 1000
+STORE_LIST_CHUNK_STORES = 100
+
+# The server warms up at startup, in the background, before /readyz reports it as
+# ready: "catalog" loads and geocodes the stores, "geocode" looks up WARM_UP_POSTCODES
+# and "templates" compiles the templates. Steps that haven't started within
+# WARM_UP_BUDGET_SECONDS are skipped. Set WARM_UP_STEPS to () to start cold.
+WARM_UP_STEPS = ("catalog", "geocode", "templates")
+WARM_UP_BUDGET_SECONDS = 60
+WARM_UP_POSTCODES = (NEARBY_STORES_DEFAULT_POSTCODE,)
+
+# Each stage of serving the stores is timed, and calls to Postcodes.io counted, for
+# Prometheus to scrape from /metrics. Set METRICS_ENABLED to False to record nothing.
+METRICS_ENABLED = True
+
+# Requests to the store listings can be profiled with cProfile and tracemalloc, and
+# the profiles written to PROFILING_OUTPUT_DIR. With PROFILING_ENABLED, a request that
+# sends PROFILING_TOKEN in its X-Profile-Token header is profiled, and 1 in
+# PROFILING_SAMPLE_EVERY requests are, unless it's 0. The oldest profiles are deleted
+# to keep them within PROFILING_DISK_BUDGET_BYTES.
+PROFILING_ENABLED = False
+PROFILING_TOKEN = None
+PROFILING_OUTPUT_DIR = "./profiles"
+PROFILING_SAMPLE_EVERY = 0
+PROFILING_DISK_BUDGET_BYTES = 100 * 1024 * 1024
+PROFILING_TRACEMALLOC_TOP = 25
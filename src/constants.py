@@ -1 +1,7 @@
 STORE_REPO_FACTORY = "STORE_REPO_FACTORY"
+STORE_CATALOG = "STORE_CATALOG"
+NEARBY_RESULT_CACHE = "NEARBY_RESULT_CACHE"
+STORE_FRAGMENT_CACHE = "STORE_FRAGMENT_CACHE"
+WARM_UP = "WARM_UP"
+WARM_UP_STEPS = "WARM_UP_STEPS"
+WARM_UP_BUDGET_SECONDS = "WARM_UP_BUDGET_SECONDS"
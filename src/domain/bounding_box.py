@@ -0,0 +1,116 @@
+"""Most stores are nowhere near the query point, yet each of them used
+to pay for the full haversine calculation. A lat and long bounding box
+around the query point can be derived from the radius once per query,
+and checking a store against it is just a few comparisons. Only the
+stores inside the box need the exact distance check.
+
+The box is conservative: it can include stores outside the radius, but
+never excludes one inside it. Longitude degrees get shorter towards the
+poles, so the box widens with latitude. When the radius reaches over a
+pole, every longitude is within reach, and when the box crosses the
+antimeridian its longitude range wraps around, i.e. min_long is greater
+than max_long.
+
+See http://janmatuschek.de/LatitudeLongitudeBoundingCoordinates for the
+derivation of the longitude range."""
+
+import dataclasses
+import math
+from typing import Optional, Sequence
+
+from src.domain.store import EARTH_RADIUS_KM, PREFILTER_SLACK_KM
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@dataclasses.dataclass(frozen=True)
+class PrefilterResult:
+    # Positions of the stores inside the box.
+    positions: list[int]
+    # Number of stores rejected by the box.
+    pruned: int
+
+
+@dataclasses.dataclass(frozen=True)
+class BoundingBox:
+    min_lat: float
+    max_lat: float
+    min_long: float
+    max_long: float
+
+    @classmethod
+    def around(cls, lat: float, long: float, radius_km: float) -> "BoundingBox":
+        if radius_km < 0:
+            raise ValueError("radius_km cannot be negative.")
+
+        angle = (radius_km + PREFILTER_SLACK_KM) / EARTH_RADIUS_KM
+        lat_rad = math.radians(lat)
+        min_lat_rad, max_lat_rad = lat_rad - angle, lat_rad + angle
+
+        # The radius reaches over a pole, so all longitudes are in reach.
+        if max_lat_rad >= math.pi / 2 or min_lat_rad <= -math.pi / 2:
+            return cls(
+                min_lat=max(math.degrees(min_lat_rad), -90.0),
+                max_lat=min(math.degrees(max_lat_rad), 90.0),
+                min_long=-180.0,
+                max_long=180.0,
+            )
+
+        delta_long = math.degrees(math.asin(math.sin(angle) / math.cos(lat_rad)))
+        min_long, max_long = long - delta_long, long + delta_long
+
+        # Wrap around the antimeridian.
+        if min_long < -180.0:
+            min_long += 360.0
+        if max_long > 180.0:
+            max_long -= 360.0
+
+        return cls(
+            min_lat=math.degrees(min_lat_rad),
+            max_lat=math.degrees(max_lat_rad),
+            min_long=min_long,
+            max_long=max_long,
+        )
+
+    @property
+    def crosses_antimeridian(self) -> bool:
+        return self.min_long > self.max_long
+
+    def contains(self, lat: Optional[float], long: Optional[float]) -> bool:
+        if lat is None or long is None:
+            return False
+
+        if not self.min_lat <= lat <= self.max_lat:
+            return False
+
+        if self.crosses_antimeridian:
+            return long >= self.min_long or long <= self.max_long
+        return self.min_long <= long <= self.max_long
+
+    def prefilter(
+        self,
+        lats: Sequence[Optional[float]],
+        longs: Sequence[Optional[float]],
+    ) -> PrefilterResult:
+        """Returns the positions of the stores, given their lats and longs,
+        that are inside the box, and how many stores were pruned."""
+        if numpy is not None:
+            lats_arr = numpy.asarray(lats, dtype=float)
+            longs_arr = numpy.asarray(longs, dtype=float)
+
+            inside = (lats_arr >= self.min_lat) & (lats_arr <= self.max_lat)
+            if self.crosses_antimeridian:
+                inside &= (longs_arr >= self.min_long) | (longs_arr <= self.max_long)
+            else:
+                inside &= (longs_arr >= self.min_long) & (longs_arr <= self.max_long)
+
+            positions = numpy.flatnonzero(inside).tolist()
+        else:
+            positions = [
+                i for i, coords in enumerate(zip(lats, longs)) if self.contains(*coords)
+            ]
+
+        return PrefilterResult(positions=positions, pruned=len(lats) - len(positions))
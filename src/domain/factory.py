@@ -16,7 +16,6 @@ establishes a pattern we can use moving forward.
 
 We don't need to use a class for this, just a function."""
 
-import decimal
 from typing import Optional
 
 from src.domain.store import Store
@@ -25,7 +24,8 @@ from src.domain.store import Store
 def create_store(
     name: str,
     postcode: str,
-    lat: Optional[decimal.Decimal] = None,
-    long: Optional[decimal.Decimal] = None,
+    lat: Optional[float] = None,
+    long: Optional[float] = None,
+    approximate: bool = False,
 ):
-    return Store(name, postcode, lat, long)
+    return Store(name, postcode, lat, long, approximate)
@@ -0,0 +1,107 @@
+"""A UK postcode is an outward code, i.e. CM20, and an inward code, i.e.
+1FE, which is always a digit and 2 letters. The first character of the
+inward code narrows the outward code down to a sector, i.e. CM20 1.
+
+The same postcode is often written in different ways, "cm201fe" and
+"CM20  1FE" among them. Normalising postcodes before they're looked up
+means they all share the same cache entries.
+
+Around 7% of postcodes fail to resolve, mostly ones that are new or have
+been retired. Their neighbours usually do resolve, so the centroid of
+the resolved postcodes in the same sector, or failing that the same
+outward code, is a fair approximation of where they are. The centroids
+are averaged as points on the unit sphere rather than as lats and longs,
+the same as the spatial index works with them."""
+
+import dataclasses
+import math
+from typing import Iterable, Optional
+
+from src.domain.spatial import to_unit_vector
+
+INWARD_CODE_LENGTH = 3
+MIN_POSTCODE_LENGTH = 5
+MAX_POSTCODE_LENGTH = 7
+
+
+def normalise(postcode: str) -> str:
+    """Upper case, with a single space before the inward code. Anything
+    not shaped like a postcode is only upper cased and has its spaces
+    removed."""
+    compact = "".join(postcode.split()).upper()
+    if not MIN_POSTCODE_LENGTH <= len(compact) <= MAX_POSTCODE_LENGTH:
+        return compact
+    return f"{compact[:-INWARD_CODE_LENGTH]} {compact[-INWARD_CODE_LENGTH:]}"
+
+
+def outward_code(postcode: str) -> Optional[str]:
+    normalised = normalise(postcode)
+    if " " not in normalised:
+        return None
+    return normalised.split(" ")[0]
+
+
+def sector(postcode: str) -> Optional[str]:
+    normalised = normalise(postcode)
+    if " " not in normalised:
+        return None
+    outward, inward = normalised.split(" ")
+    return f"{outward} {inward[0]}"
+
+
+@dataclasses.dataclass(frozen=True)
+class Centroid:
+    lat: float
+    long: float
+    # The number of resolved postcodes the centroid was taken from.
+    count: int
+
+
+def _centroid(x: float, y: float, z: float, count: int) -> Centroid:
+    return Centroid(
+        lat=math.degrees(math.atan2(z, math.hypot(x, y))),
+        long=math.degrees(math.atan2(y, x)),
+        count=count,
+    )
+
+
+class CentroidIndex:
+    """The centroids of the sectors and outward codes of resolved
+    postcodes, built from (postcode, lat, long) entries."""
+
+    def __init__(self, sectors: dict, outward_codes: dict):
+        self.sectors: dict[str, Centroid] = sectors
+        self.outward_codes: dict[str, Centroid] = outward_codes
+
+    @classmethod
+    def from_entries(
+        cls,
+        entries: Iterable[tuple[str, float, float]],
+    ) -> "CentroidIndex":
+        """Builds the index from (postcode, lat, long) entries."""
+        sums = {}, {}
+        for postcode, lat, long in entries:
+            keys = sector(postcode), outward_code(postcode)
+            if keys[0] is None:
+                continue
+
+            x, y, z = to_unit_vector(lat, long)
+            for key, key_sums in zip(keys, sums):
+                s = key_sums.setdefault(key, [0.0, 0.0, 0.0, 0])
+                s[0] += x
+                s[1] += y
+                s[2] += z
+                s[3] += 1
+
+        sectors, outward_codes = (
+            {key: _centroid(*s) for key, s in key_sums.items()} for key_sums in sums
+        )
+        return cls(sectors, outward_codes)
+
+    def lookup(self, postcode: str) -> Optional[Centroid]:
+        """The centroid of the postcode's sector if known, otherwise of its
+        outward code, or None if neither is known."""
+        key = sector(postcode)
+        if key is None:
+            return None
+        return self.sectors.get(key) or self.outward_codes.get(outward_code(postcode))
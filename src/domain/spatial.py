@@ -0,0 +1,227 @@
+"""Checking every store with the haversine formula is fine for a
+hundred stores, but not for the tens of thousands we plan to load. The
+spatial index narrows a radius query down to the stores that could be
+within the radius, and only those are checked exactly.
+
+The index is a k-d tree over points on the unit sphere rather than over
+lat and long. Lat and long distort badly towards the poles and wrap
+around at the antimeridian, whereas straight line (chord) distance in 3D
+grows with the great circle distance everywhere. So a radius on the
+earth's surface maps to a sphere in 3D that the tree can search without
+special cases.
+
+The index only returns candidates. It errs on the side of including a
+store, and it's the domain's distance formula that has the final say.
+This way the index can never change which stores are considered within
+the radius."""
+
+import array
+import collections.abc
+import heapq
+import math
+from typing import Optional, Sequence
+
+from src.domain.store import EARTH_RADIUS_KM, PREFILTER_SLACK_KM
+
+
+def to_unit_vector(lat: float, long: float) -> tuple[float, float, float]:
+    lat_rad, long_rad = math.radians(lat), math.radians(long)
+    cos_lat = math.cos(lat_rad)
+    return (
+        cos_lat * math.cos(long_rad),
+        cos_lat * math.sin(long_rad),
+        math.sin(lat_rad),
+    )
+
+
+def chord_length(radius_km: float) -> float:
+    """The straight line distance between 2 points on the unit sphere that
+    are radius_km apart along the earth's surface."""
+    angle = min(radius_km / EARTH_RADIUS_KM, math.pi)
+    return 2 * math.sin(angle / 2)
+
+
+class SpatialIndex:
+    """A static k-d tree. The points are sorted in place so that the
+    tree is implicit: the node for a range of points is the median of
+    that range, and its children are the ranges either side of it. This
+    keeps the whole index to a few flat lists."""
+
+    def __init__(
+        self,
+        lats: Sequence[Optional[float]],
+        longs: Sequence[Optional[float]],
+    ):
+        # Stores without coords can't be within any radius.
+        self._ids = [
+            i
+            for i, (lat, long) in enumerate(zip(lats, longs))
+            if lat is not None
+            and long is not None
+            and not (math.isnan(lat) or math.isnan(long))
+        ]
+        self._points = [to_unit_vector(lats[i], longs[i]) for i in self._ids]
+        self._axes = [0] * len(self._ids)
+        self._build(0, len(self._ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    @classmethod
+    def from_columns(
+        cls,
+        ids: Sequence[int],
+        points: Sequence[float],
+        axes: Sequence[int],
+    ) -> "SpatialIndex":
+        """Recreates an index from the columns of one that's already been
+        built, i.e. read from a shared catalog, without building it again.
+        points are the x, y and z of each point in turn."""
+        index = cls.__new__(cls)
+        index._ids = ids
+        index._points = _FlatPoints(points)
+        index._axes = axes
+        return index
+
+    def columns(self) -> tuple[array.array, array.array, bytes]:
+        """The ids, points and axes of the tree, as from_columns takes them."""
+        return (
+            array.array("q", self._ids),
+            array.array("d", (c for point in self._points for c in point)),
+            bytes(self._axes),
+        )
+
+    def _build(self, lo: int, hi: int):
+        ranges = [(lo, hi)]
+        while ranges:
+            lo, hi = ranges.pop()
+            if hi - lo <= 1:
+                continue
+
+            # Split on the axis with the widest spread.
+            points = self._points[lo:hi]
+            axis = max(
+                range(3),
+                key=lambda a: max(p[a] for p in points) - min(p[a] for p in points),
+            )
+
+            order = sorted(range(lo, hi), key=lambda i: self._points[i][axis])
+            self._points[lo:hi] = [self._points[i] for i in order]
+            self._ids[lo:hi] = [self._ids[i] for i in order]
+
+            mid = (lo + hi) // 2
+            self._axes[mid] = axis
+            ranges.append((lo, mid))
+            ranges.append((mid + 1, hi))
+
+    def candidates_within_radius(
+        self,
+        lat: float,
+        long: float,
+        radius_km: float,
+    ) -> list[int]:
+        """Returns the positions, in the sequences the index was built from,
+        of the points that could be within radius_km of lat and long."""
+        if radius_km < 0:
+            raise ValueError("radius_km cannot be negative.")
+
+        query = to_unit_vector(lat, long)
+        max_sq = chord_length(radius_km + PREFILTER_SLACK_KM) ** 2
+
+        found = []
+        ranges = [(0, len(self._ids))]
+        while ranges:
+            lo, hi = ranges.pop()
+            if lo >= hi:
+                continue
+
+            mid = (lo + hi) // 2
+            point = self._points[mid]
+            if (
+                (point[0] - query[0]) ** 2
+                + (point[1] - query[1]) ** 2
+                + (point[2] - query[2]) ** 2
+            ) <= max_sq:
+                found.append(self._ids[mid])
+
+            axis = self._axes[mid]
+            diff = query[axis] - point[axis]
+            near, far = (
+                ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            )
+            ranges.append(near)
+            if diff * diff <= max_sq:
+                ranges.append(far)
+
+        return sorted(found)
+
+    def nearest(
+        self,
+        lat: float,
+        long: float,
+        k: int,
+        max_radius_km: Optional[float] = None,
+    ) -> list[int]:
+        """Returns the positions, in the sequences the index was built from,
+        of the k points nearest to lat and long, nearest first. Chord length
+        grows with great circle distance, so the nearest in 3D are also the
+        nearest on the earth's surface. The tree is walked nearest branch
+        first, keeping the best k found so far in a heap, and branches that
+        can't beat the worst of those are skipped."""
+        if k < 0:
+            raise ValueError("k cannot be negative.")
+
+        query = to_unit_vector(lat, long)
+        max_sq = (
+            math.inf
+            if max_radius_km is None
+            else chord_length(max_radius_km + PREFILTER_SLACK_KM) ** 2
+        )
+
+        # A max heap of (negated squared distance, tree position).
+        best: list[tuple[float, int]] = []
+
+        def search(lo: int, hi: int):
+            if lo >= hi or k == 0:
+                return
+
+            mid = (lo + hi) // 2
+            point = self._points[mid]
+            dist_sq = (
+                (point[0] - query[0]) ** 2
+                + (point[1] - query[1]) ** 2
+                + (point[2] - query[2]) ** 2
+            )
+            if dist_sq <= max_sq:
+                if len(best) < k:
+                    heapq.heappush(best, (-dist_sq, mid))
+                elif dist_sq < -best[0][0]:
+                    heapq.heapreplace(best, (-dist_sq, mid))
+
+            axis = self._axes[mid]
+            diff = query[axis] - point[axis]
+            near, far = (
+                ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            )
+            search(*near)
+
+            bound = -best[0][0] if len(best) == k else max_sq
+            if diff * diff <= bound:
+                search(*far)
+
+        search(0, len(self._ids))
+        return [self._ids[mid] for _, mid in sorted(best, reverse=True)]
+
+
+class _FlatPoints(collections.abc.Sequence):
+    """The points of a tree held as one flat sequence of floats."""
+
+    def __init__(self, flat: Sequence[float]):
+        self.flat = flat
+
+    def __len__(self):
+        return len(self.flat) // 3
+
+    def __getitem__(self, i):
+        j = 3 * i
+        return self.flat[j], self.flat[j + 1], self.flat[j + 2]
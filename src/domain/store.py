@@ -1,28 +1,75 @@
-import decimal
+import array
+import heapq
 import math
-from typing import Optional
+from typing import Optional, Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 EARTH_RADIUS_NM = 3440.1
 NM_TO_KM = 1.852
+EARTH_RADIUS_KM = EARTH_RADIUS_NM * NM_TO_KM
+
+# Prefilters, i.e. bounding boxes and spatial indexes, widen their search
+# by this much so that floating point differences between their maths and
+# ours can't exclude a store on the boundary.
+PREFILTER_SLACK_KM = 0.001
+
+# The batch distances are computed with the same formula as the scalar
+# ones, but the vectorized maths can round differently in the last few
+# bits. Batch and scalar distances agree to within this many km.
+BATCH_DISTANCE_TOLERANCE_KM = 1e-6
 
 
 class Store:
     """This is a domain class that provides relevant
     domain logic. In this case it is a place to put
     logic that determines if the store is within distance
-    from a given lat and long."""
+    from a given lat and long.
+
+    Slots keep each instance small, as there can be a great many stores."""
+
+    __slots__ = ("name", "postcode", "lat", "long", "approximate")
 
     def __init__(
         self,
         name: str,
         postcode: str,
-        lat: Optional[decimal.Decimal] = None,
-        long: Optional[decimal.Decimal] = None,
+        lat: Optional[float] = None,
+        long: Optional[float] = None,
+        approximate: bool = False,
     ):
         self.name = name
         self.postcode = postcode
         self.lat = lat
         self.long = long
+        # The coords are only those of the area the postcode is in.
+        self.approximate = approximate
+
+    def __eq__(self, other):
+        if not isinstance(other, Store):
+            return NotImplemented
+        return all(getattr(self, a) == getattr(other, a) for a in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (
+            f"Store(name={self.name!r}, postcode={self.postcode!r}, "
+            f"lat={self.lat!r}, long={self.long!r}, approximate={self.approximate!r})"
+        )
+
+    def to_dict(self) -> dict:
+        """Coords are left out when the store doesn't have any, the same
+        as the stores read from a store repo."""
+        d = {"name": self.name, "postcode": self.postcode}
+        if self.lat is not None and self.long is not None:
+            d["lat"], d["long"] = self.lat, self.long
+            if self.approximate:
+                d["approximate"] = True
+        return d
 
     def is_within_radius(
         self,
@@ -49,6 +96,25 @@ class Store:
             compare_long,
         )
 
+    @staticmethod
+    def distances_km_from(
+        compare_lat,
+        compare_long,
+        lats: Sequence[Optional[float]],
+        longs: Sequence[Optional[float]],
+    ):
+        """The batch counterpart of distance_km_from. Calculates the
+        distances from one point to many stores, given their lats and
+        longs, in a single vectorized pass. Stores without coords get a
+        distance of NaN, which never compares as within any radius.
+
+        Uses NumPy when it's installed, otherwise falls back to plain
+        Python over arrays. Either way the results match distance_km_from
+        to within BATCH_DISTANCE_TOLERANCE_KM."""
+        if numpy is not None:
+            return _haversine_km_from_deg_numpy(compare_lat, compare_long, lats, longs)
+        return _haversine_km_from_deg_array(compare_lat, compare_long, lats, longs)
+
     def _haversine_nm_from_deg(self, lat_a, long_a, lat_b, long_b):
         """Using haversine formula under the hood to calculate
         distance between 2 points on earth. This makes it easier
@@ -85,3 +151,188 @@ class Store:
             )
             * NM_TO_KM
         )
+
+
+def positions_within_radius(
+    query_lat,
+    query_long,
+    radius_km,
+    lats: Sequence[Optional[float]],
+    longs: Sequence[Optional[float]],
+) -> list[int]:
+    """The batch counterpart of Store.is_within_radius. Returns the
+    positions of the stores, given their lats and longs, that are within
+    radius_km of the query point. The same rules apply, i.e. stores
+    without coords are never within the radius."""
+    return [
+        i
+        for i, _ in distances_within_radius(
+            query_lat,
+            query_long,
+            radius_km,
+            lats,
+            longs,
+        )
+    ]
+
+
+def distances_within_radius(
+    query_lat,
+    query_long,
+    radius_km,
+    lats: Sequence[Optional[float]],
+    longs: Sequence[Optional[float]],
+) -> list[tuple[int, float]]:
+    """As positions_within_radius, but returns each position along with
+    its distance from the query point."""
+    if radius_km < 0:
+        raise ValueError("radius_km cannot be negative.")
+
+    distances = Store.distances_km_from(query_lat, query_long, lats, longs)
+
+    # Store.is_within_radius treats a falsy lat or long as missing, and
+    # missing coords have a distance of NaN, which is never within radius.
+    if numpy is not None:
+        within = numpy.flatnonzero(
+            (distances <= radius_km)
+            & (numpy.asarray(lats, dtype=float) != 0)
+            & (numpy.asarray(longs, dtype=float) != 0)
+        )
+        return list(zip(within.tolist(), distances[within].tolist()))
+
+    return [
+        (i, d)
+        for i, d in enumerate(distances)
+        if d <= radius_km and lats[i] and longs[i]
+    ]
+
+
+def nearest_positions(
+    query_lat,
+    query_long,
+    k: int,
+    lats: Sequence[Optional[float]],
+    longs: Sequence[Optional[float]],
+    max_radius_km=None,
+) -> list[tuple[float, int]]:
+    """Returns the distances and positions of the k stores, given their
+    lats and longs, nearest to the query point, nearest first. A heap is
+    used to select them, rather than sorting every store by distance.
+    Optionally only stores within max_radius_km are considered, and the
+    distances found checking the radius are the ones the heap selects on."""
+    if k < 0:
+        raise ValueError("k cannot be negative.")
+
+    if max_radius_km is not None:
+        within_radius = distances_within_radius(
+            query_lat,
+            query_long,
+            max_radius_km,
+            lats,
+            longs,
+        )
+        return heapq.nsmallest(k, ((d, i) for i, d in within_radius))
+
+    distances = Store.distances_km_from(query_lat, query_long, lats, longs)
+
+    # Missing coords have a distance of NaN, which never equals itself.
+    return heapq.nsmallest(
+        k,
+        ((d, i) for i, d in enumerate(distances.tolist()) if d == d),
+    )
+
+
+def batch_distances_within_radius(
+    query_lats: Sequence[float],
+    query_longs: Sequence[float],
+    radius_km,
+    lats: Sequence[Optional[float]],
+    longs: Sequence[Optional[float]],
+    max_block_cells: int = 1_000_000,
+) -> list[list[tuple[int, float]]]:
+    """As distances_within_radius, but for many query points at once.
+    Returns the positions and distances of the stores within radius_km of
+    each query point, in the same order as the query points.
+
+    The distances from the query points to the stores, i.e. the distance
+    matrix, are calculated in one vectorized pass per block of query
+    points. A block is as many query points as keep the matrix within
+    max_block_cells distances, so memory stays bounded however many query
+    points there are. Without NumPy each query point is done on its own."""
+    if radius_km < 0:
+        raise ValueError("radius_km cannot be negative.")
+
+    if numpy is None:
+        return [
+            distances_within_radius(query_lat, query_long, radius_km, lats, longs)
+            for query_lat, query_long in zip(query_lats, query_longs)
+        ]
+
+    lats_b = numpy.asarray(lats, dtype=float)
+    longs_b = numpy.asarray(longs, dtype=float)
+
+    # The same rules as distances_within_radius, i.e. a falsy lat or long
+    # is missing. Only the stores with coords make it into the matrix.
+    positions = numpy.flatnonzero(
+        (lats_b != 0) & (longs_b != 0) & ~numpy.isnan(lats_b) & ~numpy.isnan(longs_b)
+    )
+    lats_b_rad = numpy.radians(lats_b[positions])
+    longs_b_rad = numpy.radians(longs_b[positions])
+    sin_lats_b, cos_lats_b = numpy.sin(lats_b_rad), numpy.cos(lats_b_rad)
+
+    block_size = max(1, max_block_cells // max(len(positions), 1))
+    results = []
+    for start in range(0, len(query_lats), block_size):
+        lats_a_rad = numpy.radians(
+            numpy.asarray(query_lats[start : start + block_size], dtype=float)
+        )[:, numpy.newaxis]
+        longs_a_rad = numpy.radians(
+            numpy.asarray(query_longs[start : start + block_size], dtype=float)
+        )[:, numpy.newaxis]
+
+        cos_angle = numpy.sin(lats_a_rad) * sin_lats_b + numpy.cos(
+            lats_a_rad
+        ) * cos_lats_b * numpy.cos(longs_a_rad - longs_b_rad)
+        distances = (
+            EARTH_RADIUS_NM * numpy.arccos(numpy.clip(cos_angle, -1.0, 1.0)) * NM_TO_KM
+        )
+
+        for row in distances:
+            within = numpy.flatnonzero(row <= radius_km)
+            results.append(list(zip(positions[within].tolist(), row[within].tolist())))
+
+    return results
+
+
+def _haversine_km_from_deg_numpy(lat_a, long_a, lats_b, longs_b):
+    lat_a_rad, long_a_rad = math.radians(lat_a), math.radians(long_a)
+    lats_b_rad = numpy.radians(numpy.asarray(lats_b, dtype=float))
+    longs_b_rad = numpy.radians(numpy.asarray(longs_b, dtype=float))
+
+    cos_angle = (math.sin(lat_a_rad) * numpy.sin(lats_b_rad)) + math.cos(
+        lat_a_rad
+    ) * numpy.cos(lats_b_rad) * numpy.cos(long_a_rad - longs_b_rad)
+
+    # Rounding can push the same point just past 1, outside of acos' domain.
+    return EARTH_RADIUS_NM * numpy.arccos(numpy.clip(cos_angle, -1.0, 1.0)) * NM_TO_KM
+
+
+def _haversine_km_from_deg_array(lat_a, long_a, lats_b, longs_b):
+    lat_a_rad, long_a_rad = math.radians(lat_a), math.radians(long_a)
+    sin_lat_a, cos_lat_a = math.sin(lat_a_rad), math.cos(lat_a_rad)
+
+    distances = array.array("d", bytes(8 * len(lats_b)))
+    for i, (lat_b, long_b) in enumerate(zip(lats_b, longs_b)):
+        if lat_b is None or long_b is None or math.isnan(lat_b + long_b):
+            distances[i] = math.nan
+            continue
+
+        lat_b_rad, long_b_rad = math.radians(lat_b), math.radians(long_b)
+        cos_angle = (sin_lat_a * math.sin(lat_b_rad)) + cos_lat_a * math.cos(
+            lat_b_rad
+        ) * math.cos(long_a_rad - long_b_rad)
+
+        distances[i] = (
+            EARTH_RADIUS_NM * math.acos(min(1.0, max(-1.0, cos_angle))) * NM_TO_KM
+        )
+    return distances
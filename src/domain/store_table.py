@@ -0,0 +1,147 @@
+"""At 100k+ stores, holding every store as its own dict (or Store) adds
+up, as does creating them again on every request just to call one
+method. The store table is a compact, columnar representation of many
+stores: names, postcodes, lats and longs are held in parallel columns,
+with the coords packed as 8 byte floats. Missing coords are NaN. Coords
+that are only approximate, i.e. the centroid of the store's postcode
+sector, are flagged in a column of their own.
+
+The table is read-only once built. Filtering and sorting don't copy any
+stores, they return a view, which is just the table plus the positions
+of the rows in it. A Store is only created for a row when it's read from
+a view, i.e. when it's rendered, and is discarded straight after."""
+
+import array
+import collections.abc
+import math
+from typing import Iterable, Mapping, Optional, Sequence, Union
+
+from src.domain.factory import create_store
+from src.domain.store import Store
+
+
+def _coord_or_nan(coord) -> float:
+    return math.nan if coord is None else coord
+
+
+def _nan_to_none(coord: float) -> Optional[float]:
+    return None if math.isnan(coord) else coord
+
+
+class StoreTable:
+    # Weak references let caches keyed by table drop their entries once
+    # nothing is reading the table any more.
+    __slots__ = ("names", "postcodes", "lats", "longs", "approximate", "__weakref__")
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        postcodes: Sequence[str],
+        lats: Sequence[float],
+        longs: Sequence[float],
+        approximate: Optional[bytes] = None,
+    ):
+        if approximate is None:
+            approximate = bytes(len(names))
+
+        if not (
+            len(names) == len(postcodes) == len(lats) == len(longs) == len(approximate)
+        ):
+            raise ValueError("All columns must have the same length.")
+
+        self.names = names
+        self.postcodes = postcodes
+        self.lats = lats
+        self.longs = longs
+        self.approximate = approximate
+
+    def __len__(self):
+        return len(self.names)
+
+    def row(self, i: int) -> Store:
+        return create_store(
+            self.names[i],
+            self.postcodes[i],
+            _nan_to_none(self.lats[i]),
+            _nan_to_none(self.longs[i]),
+            bool(self.approximate[i]),
+        )
+
+    def view(self, positions: Optional[Sequence[int]] = None) -> "StoreTableView":
+        return StoreTableView(
+            self,
+            range(len(self)) if positions is None else positions,
+        )
+
+
+class StoreTableBuilder:
+    """Appends stores to the table's columns as they come in, i.e. batch by
+    batch from a stream of store records, so the records themselves don't
+    need to be held on to."""
+
+    def __init__(self):
+        self.names, self.postcodes = [], []
+        self.lats, self.longs = array.array("d"), array.array("d")
+        self.approximate = bytearray()
+
+    def extend(
+        self,
+        records: Iterable[Mapping],
+        postcode_coords_map: Optional[Mapping] = None,
+    ):
+        postcode_coords_map = postcode_coords_map or {}
+        for r in records:
+            coords = postcode_coords_map.get(r["postcode"]) or r
+            self.names.append(r["name"])
+            self.postcodes.append(r["postcode"])
+            self.lats.append(_coord_or_nan(coords.get("lat")))
+            self.longs.append(_coord_or_nan(coords.get("long")))
+            self.approximate.append(bool(coords.get("approximate")))
+
+    def build(self, sort_by_name: bool = True) -> StoreTable:
+        names, postcodes, lats, longs, approximate = (
+            self.names,
+            self.postcodes,
+            self.lats,
+            self.longs,
+            self.approximate,
+        )
+
+        if sort_by_name:
+            order = sorted(range(len(names)), key=names.__getitem__)
+            names = [names[i] for i in order]
+            postcodes = [postcodes[i] for i in order]
+            lats = array.array("d", (lats[i] for i in order))
+            longs = array.array("d", (longs[i] for i in order))
+            approximate = bytes(approximate[i] for i in order)
+
+        return StoreTable(
+            tuple(names),
+            tuple(postcodes),
+            memoryview(lats).toreadonly(),
+            memoryview(longs).toreadonly(),
+            bytes(approximate),
+        )
+
+
+class StoreTableView(collections.abc.Sequence):
+    """A read-only sequence of Stores over selected rows of a table."""
+
+    __slots__ = ("table", "positions")
+
+    def __init__(self, table: StoreTable, positions: Sequence[int]):
+        self.table = table
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            return StoreTableView(self.table, self.positions[i])
+        return self.table.row(self.positions[i])
+
+    def __iter__(self):
+        row = self.table.row
+        for i in self.positions:
+            yield row(i)
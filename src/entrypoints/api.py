@@ -0,0 +1,231 @@
+"""JSON endpoints for the stores, so that downstream services no longer
+need to scrape the html.
+
+Results are paginated with an opaque cursor. The cursor records the
+version of the catalog the first page came from as well as the position
+to carry on from, so a client paging through the results while the
+catalog is reloaded is told its cursor has expired rather than silently
+getting pages from 2 different catalogs.
+
+Alternatively, results can be streamed as NDJSON (one JSON object per
+line) by asking for format=ndjson or sending an Accept header of
+application/x-ndjson. Stores are written out as they're produced, so
+large result sets are never held as one list or one response body."""
+
+import base64
+import binascii
+import itertools
+import json
+from typing import Optional
+
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from src import config, constants
+from src.adapters.factory import StoreRepoFactory
+from src.exceptions import PostcodeNotFoundError
+from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog
+from src.srv_layer.result_cache import ResultCache
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+bp = Blueprint("api", __name__)
+
+
+class _BadRequest(Exception):
+    pass
+
+
+class _CursorExpired(Exception):
+    pass
+
+
+def _encode_cursor(catalog_version: str, offset: int) -> str:
+    cursor = json.dumps({"v": catalog_version, "o": offset}).encode("utf-8")
+    return base64.urlsafe_b64encode(cursor).decode("ascii")
+
+
+def _decode_cursor(cursor: Optional[str]) -> tuple[Optional[str], int]:
+    if not cursor:
+        return None, 0
+
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        catalog_version, offset = decoded["v"], int(decoded["o"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise _BadRequest("cursor is not valid.")
+
+    if offset < 0:
+        raise _BadRequest("cursor is not valid.")
+
+    return catalog_version, offset
+
+
+def _limit(streaming: bool) -> Optional[int]:
+    # Streams are unbounded unless the caller asks for a limit.
+    default = None if streaming else config.API_DEFAULT_PAGE_SIZE
+    limit = request.args.get("limit", default, type=int)
+
+    if limit is not None and not 0 < limit <= config.API_MAX_PAGE_SIZE:
+        raise _BadRequest(f"limit must be between 1 and {config.API_MAX_PAGE_SIZE}.")
+
+    return limit
+
+
+def _is_streaming() -> bool:
+    if request.args.get("format") == "ndjson":
+        return True
+    return (
+        request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+        == NDJSON_MIMETYPE
+    )
+
+
+def _respond(results: views.StoreResults, offset: int, limit: Optional[int]):
+    if _is_streaming():
+        stores = results.stores
+        if limit is not None:
+            stores = itertools.islice(stores, limit)
+        return Response(
+            (json.dumps(s) + "\n" for s in stores),
+            mimetype=NDJSON_MIMETYPE,
+        )
+
+    # Take one more than the page, to know whether there's a next page.
+    page = list(itertools.islice(results.stores, limit + 1))
+    next_cursor = (
+        _encode_cursor(results.catalog_version, offset + limit)
+        if len(page) > limit
+        else None
+    )
+    return jsonify(
+        {
+            "stores": page[:limit],
+            "next_cursor": next_cursor,
+            "catalog_version": results.catalog_version,
+        }
+    )
+
+
+def _check_cursor_version(cursor_version: Optional[str], results):
+    if cursor_version is not None and cursor_version != results.catalog_version:
+        raise _CursorExpired()
+
+
+@bp.route("/api/stores/")
+def api_stores():
+    store_repo_factory: StoreRepoFactory = current_app.config[
+        constants.STORE_REPO_FACTORY
+    ]
+    catalog: StoreCatalog = current_app.config[constants.STORE_CATALOG]
+
+    cursor_version, offset = _decode_cursor(request.args.get("cursor"))
+    limit = _limit(_is_streaming())
+
+    results = views.query_stores(store_repo_factory(), catalog, offset)
+    _check_cursor_version(cursor_version, results)
+    return _respond(results, offset, limit)
+
+
+@bp.route("/api/stores/nearby/")
+def api_nearby_stores():
+    store_repo_factory: StoreRepoFactory = current_app.config[
+        constants.STORE_REPO_FACTORY
+    ]
+    catalog: StoreCatalog = current_app.config[constants.STORE_CATALOG]
+    result_cache: ResultCache = current_app.config[constants.NEARBY_RESULT_CACHE]
+
+    postcode = request.args.get("postcode")
+    if not postcode:
+        raise _BadRequest("postcode is required.")
+
+    radius_km = request.args.get(
+        "radius_km",
+        config.NEARBY_STORES_DEFAULT_RADIUS_KM,
+        type=float,
+    )
+    if not 0 <= radius_km <= config.NEARBY_STORES_MAX_RADIUS_KM:
+        raise _BadRequest(
+            f"radius_km must be between 0 and {config.NEARBY_STORES_MAX_RADIUS_KM}."
+        )
+
+    cursor_version, offset = _decode_cursor(request.args.get("cursor"))
+    limit = _limit(_is_streaming())
+
+    try:
+        results = views.query_nearby_stores(
+            store_repo_factory(),
+            postcode,
+            radius_km,
+            catalog,
+            offset,
+            result_cache,
+        )
+    except PostcodeNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+
+    _check_cursor_version(cursor_version, results)
+    return _respond(results, offset, limit)
+
+
+@bp.route("/api/stores/nearby/batch/", methods=["POST"])
+def api_batch_nearby_stores():
+    """Takes a JSON body of {"postcodes": [...], "radius_km": 30} and
+    returns the stores nearby each postcode, in the same order."""
+    store_repo_factory: StoreRepoFactory = current_app.config[
+        constants.STORE_REPO_FACTORY
+    ]
+    catalog: StoreCatalog = current_app.config[constants.STORE_CATALOG]
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise _BadRequest("body must be a JSON object.")
+
+    postcodes = body.get("postcodes")
+    if (
+        not isinstance(postcodes, list)
+        or not postcodes
+        or not all(isinstance(p, str) and p for p in postcodes)
+    ):
+        raise _BadRequest("postcodes must be a list of postcodes.")
+    if len(postcodes) > config.BATCH_NEARBY_MAX_POSTCODES:
+        raise _BadRequest(
+            f"postcodes can have at most {config.BATCH_NEARBY_MAX_POSTCODES} postcodes."
+        )
+
+    radius_km = body.get("radius_km", config.NEARBY_STORES_DEFAULT_RADIUS_KM)
+    if (
+        isinstance(radius_km, bool)
+        or not isinstance(radius_km, (int, float))
+        or not 0 <= radius_km <= config.NEARBY_STORES_MAX_RADIUS_KM
+    ):
+        raise _BadRequest(
+            f"radius_km must be between 0 and {config.NEARBY_STORES_MAX_RADIUS_KM}."
+        )
+
+    results = views.batch_nearby_stores(
+        store_repo_factory(),
+        postcodes,
+        radius_km,
+        catalog,
+    )
+    return jsonify(
+        {
+            "results": results.results,
+            "catalog_version": results.catalog_version,
+        }
+    )
+
+
+@bp.errorhandler(_BadRequest)
+def api_bad_request(e: _BadRequest):
+    return jsonify({"error": str(e)}), 400
+
+
+@bp.errorhandler(_CursorExpired)
+def api_cursor_expired(e: _CursorExpired):
+    _ = e
+    return (
+        jsonify({"error": "cursor has expired as the stores have since changed."}),
+        410,
+    )
@@ -0,0 +1,136 @@
+"""Commands run with the flask cli, i.e.
+
+    flask --app src.app import-stores
+
+which creates the app with create_app, so it isn't warmed up for
+nothing. They're entrypoints the same as the routes, so they get their
+repos from the app's store repo factory too."""
+
+import time
+
+import click
+from flask import Blueprint, current_app
+
+from src import config, constants
+from src.adapters import gazetteer, repo
+from src.srv_layer import shared_catalog
+from src.srv_layer.catalog import StoreCatalog
+
+# The commands are registered on the app itself, rather than under a group.
+bp = Blueprint("cli", __name__, cli_group=None)
+
+
+@bp.cli.command("import-stores")
+@click.option(
+    "--stores-file",
+    default=config.STORES_FILE,
+    show_default=True,
+    help="The stores file to import, a JSON array or NDJSON.",
+)
+@click.option(
+    "--db-file",
+    default=config.STORES_DB_FILE or config.STORES_DB_IMPORT_FILE,
+    show_default=True,
+    help="The SQLite database to import the stores into.",
+)
+def import_stores(stores_file, db_file):
+    """Imports the stores, and their geocoded coords, into a SQLite
+    database, replacing any stores already in it."""
+    store_repo_factory = current_app.config[constants.STORE_REPO_FACTORY]()
+
+    count = repo.SqliteStoreRepo(
+        db_file,
+        batch_size=config.STORE_INGEST_BATCH_SIZE,
+    ).import_stores(
+        repo.StoreFileRepo(stores_file).iter_stores(),
+        store_repo_factory.create_store_postcode_repo(),
+    )
+
+    click.echo(f"Imported {count} stores into {db_file}.")
+
+
+@bp.cli.command("compile-gazetteer")
+@click.argument("source_file")
+@click.option(
+    "--output-file",
+    default=config.GAZETTEER_FILE or config.GAZETTEER_COMPILE_FILE,
+    show_default=True,
+    help="The gazetteer file to write.",
+)
+def compile_gazetteer(source_file, output_file):
+    """Compiles a postcode dataset into a gazetteer file. SOURCE_FILE is
+    either an ONS postcode directory CSV extract or a saved Postcodes.io
+    bulk lookup response, i.e. test_store_postcodes.json."""
+    count = gazetteer.compile_gazetteer(
+        gazetteer.iter_entries(source_file),
+        output_file,
+    )
+
+    click.echo(f"Compiled {count} postcodes into {output_file}.")
+
+
+@bp.cli.command("compile-centroids")
+@click.argument("source_file")
+@click.option(
+    "--output-file",
+    default=config.CENTROID_INDEX_FILE or config.CENTROID_INDEX_COMPILE_FILE,
+    show_default=True,
+    help="The centroid index file to write.",
+)
+def compile_centroids(source_file, output_file):
+    """Compiles the sector and outward code centroids of a postcode
+    dataset, the same kinds of SOURCE_FILE as compile-gazetteer takes."""
+    centroid_index = gazetteer.compile_centroid_index(
+        gazetteer.iter_entries(source_file),
+        output_file,
+    )
+
+    click.echo(
+        f"Compiled {len(centroid_index.sectors)} sectors and"
+        f" {len(centroid_index.outward_codes)} outward codes into {output_file}."
+    )
+
+
+@bp.cli.command("publish-catalog")
+@click.option(
+    "--output-file",
+    default=config.SHARED_CATALOG_FILE or config.SHARED_CATALOG_PUBLISH_FILE,
+    show_default=True,
+    help="The catalog file for the workers to attach to.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running, and publish the catalog again when the stores change.",
+)
+@click.option(
+    "--interval",
+    default=config.SHARED_CATALOG_WATCH_INTERVAL_SECONDS,
+    show_default=True,
+    type=float,
+    help="How often to check whether the stores have changed, in seconds.",
+)
+def publish_catalog(output_file, watch, interval):
+    """Builds the store catalog, once for all the worker processes, and
+    publishes it for them to attach to."""
+    # Not the app's catalog, which may be the one we're publishing.
+    catalog = StoreCatalog(current_app.config[constants.STORE_REPO_FACTORY]())
+
+    published_version = None
+    while True:
+        # A change to the stores is reloaded in the background, so wait for
+        # it, to publish the new stores now rather than on the next check.
+        catalog.snapshot()
+        catalog.wait_for_reload()
+        snapshot = catalog.snapshot()
+        if snapshot.version != published_version:
+            shared_catalog.publish_snapshot(snapshot, output_file)
+            published_version = snapshot.version
+            click.echo(
+                f"Published {len(snapshot.table)} stores, version"
+                f" {snapshot.version}, to {output_file}."
+            )
+
+        if not watch:
+            break
+        time.sleep(interval)
@@ -0,0 +1,105 @@
+"""The store listings used to render every store's <li> on every request,
+even though a store's html only changes when the catalog does. The
+fragment cache keeps each store's rendered html, so it's rendered once
+per catalog version, and pages are put together from the cached
+fragments.
+
+Fragments are held in a list parallel to the catalog table's rows, and
+are filled in as they're first rendered, so a store that's never listed
+is never rendered. A new catalog version comes with a new table, with a
+list of its own. The lists are held weakly by table, so requests still
+reading the old table during a reload keep using its fragments, rather
+than dropping the new table's, and the old list goes when the old table
+does.
+
+Filling in a fragment is a single assignment, so it isn't locked. Two
+requests rendering the same store at once both render it, and one of
+them wins, which does no harm as they render the same html.
+
+The hits, misses and invalidations are counted on /metrics, along with
+how many fragments are held."""
+
+import threading
+import weakref
+from typing import Callable, Iterator
+
+from src import metrics
+from src.domain.store import Store
+from src.domain.store_table import StoreTable, StoreTableView
+
+
+class StoreFragmentCache:
+    def __init__(self, name: str = "store_fragments"):
+        self._lock = threading.Lock()
+        self._fragments_by_table: weakref.WeakKeyDictionary = (
+            weakref.WeakKeyDictionary()
+        )
+        # The fragments for the newest table.
+        self._fragments: list = []
+        # Near enough the number of fragments held, as a race can render a
+        # fragment twice.
+        self._rendered = 0
+        self._has_table = False
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._hit_counter = metrics.CACHE_LOOKUPS.labels(cache=name, result="hit")
+        self._miss_counter = metrics.CACHE_LOOKUPS.labels(cache=name, result="miss")
+        self._invalidation_counter = metrics.CACHE_INVALIDATIONS.labels(cache=name)
+        self._entries_gauge = metrics.CACHE_ENTRIES.labels(cache=name)
+
+    def fragments(
+        self,
+        stores: StoreTableView,
+        render: Callable[[Store], str],
+    ) -> Iterator[str]:
+        """The html of each store in the view, in turn, rendering only the
+        stores that aren't cached yet."""
+        fragments = self._fragments_for(stores.table)
+        row = stores.table.row
+        hits = misses = 0
+        try:
+            for i in stores.positions:
+                fragment = fragments[i]
+                if fragment is None:
+                    fragment = fragments[i] = render(row(i))
+                    misses += 1
+                else:
+                    hits += 1
+                yield fragment
+        finally:
+            # Counted once per page rather than per store, to keep the lock
+            # out of the loop.
+            with self._lock:
+                self.hits += hits
+                self.misses += misses
+                if fragments is self._fragments:
+                    self._rendered += misses
+                    self._entries_gauge.set(self._rendered)
+            self._hit_counter.inc(hits)
+            self._miss_counter.inc(misses)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "fragments": sum(f is not None for f in self._fragments),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+    def _fragments_for(self, table: StoreTable) -> list:
+        with self._lock:
+            fragments = self._fragments_by_table.get(table)
+            if fragments is None:
+                if self._has_table:
+                    self.invalidations += 1
+                    self._invalidation_counter.inc()
+                self._has_table = True
+                fragments = self._fragments_by_table[table] = [None] * len(table)
+                self._fragments = fragments
+                self._rendered = 0
+                self._entries_gauge.set(0)
+            return fragments
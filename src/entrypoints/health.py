@@ -0,0 +1,23 @@
+"""Probes for the orchestrator. /healthz is the liveness probe, which only
+says the process is up and serving. /readyz is the readiness probe, which
+only says the app is ready once warm-up has finished, so traffic is never
+routed to a cold container."""
+
+from flask import Blueprint, current_app, jsonify
+
+from src import constants
+from src.srv_layer.warm_up import WarmUp
+
+bp = Blueprint("health", __name__)
+
+
+@bp.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@bp.route("/readyz")
+def readyz():
+    warm_up: WarmUp = current_app.config[constants.WARM_UP]
+    report = warm_up.report()
+    return jsonify(report), 200 if report["ready"] else 503
@@ -0,0 +1,76 @@
+"""The store listings only change when the catalog changes, so browsers
+and CDNs can keep them and check back with us whether they're still
+current, rather than have us recompute the page every time.
+
+Responses get a strong ETag derived from the catalog version and the
+request's path and query params, and a Last-Modified of when the
+catalog snapshot was built. A request that already has the current
+version (If-None-Match, or failing that If-Modified-Since) gets a 304
+straight away, without calling the view at all. Only the catalog
+version is needed to decide that, which costs a stat of stores.json."""
+
+import datetime
+import functools
+import hashlib
+
+from flask import Response, current_app, make_response, request
+
+from src import config, constants
+from src.srv_layer.catalog import StoreCatalog
+
+
+def _etag(catalog_version: str) -> str:
+    key = "|".join(
+        [
+            catalog_version,
+            request.path,
+            *(f"{k}={v}" for k, v in sorted(request.args.items(multi=True))),
+        ]
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _is_not_modified(etag: str, last_modified: datetime.datetime) -> bool:
+    # If-None-Match takes precedence when both are sent.
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def _set_validators(response: Response, etag: str, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers["Cache-Control"] = config.HTTP_CACHE_CONTROL
+
+
+def conditional_on_catalog(view):
+    """Decorates a route whose response depends only on the catalog and
+    the request's path and query params."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        catalog: StoreCatalog = current_app.config[constants.STORE_CATALOG]
+        snapshot = catalog.snapshot()
+
+        etag = _etag(snapshot.version)
+        # HTTP dates only have a resolution of seconds.
+        last_modified = datetime.datetime.fromtimestamp(
+            int(snapshot.built_at),
+            tz=datetime.timezone.utc,
+        )
+
+        if _is_not_modified(etag, last_modified):
+            response = Response(status=304)
+            _set_validators(response, etag, last_modified)
+            return response
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            _set_validators(response, etag, last_modified)
+        return response
+
+    return wrapper
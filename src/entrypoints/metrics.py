@@ -0,0 +1,14 @@
+"""Prometheus scrapes /metrics for the stage timings and counters that
+the hot paths record, in the Prometheus text format. The text is only
+rendered here, so recording costs next to nothing between scrapes."""
+
+from flask import Blueprint, Response
+
+from src import metrics
+
+bp = Blueprint("metrics", __name__)
+
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,166 @@
+"""Performance problems are hard to reproduce locally, as they depend on
+Postcodes.io's latency and on the data. So requests can be profiled where
+they happen, on demand.
+
+With profiling enabled in config, a request that sends the profiling
+token in the X-Profile-Token header is run under cProfile, and its
+profile written to a .pstats file for pstats or snakeviz. The biggest
+allocations made during the request, by tracemalloc, are written next to
+it. The response's X-Profile header names the files.
+
+Requests can also be sampled, 1 in PROFILING_SAMPLE_EVERY of them, to
+catch regressions in live traffic. The profiles are kept within a disk
+budget, with the oldest deleted to make room for new ones.
+
+Only one request is profiled at a time, as cProfile and tracemalloc
+can't be run twice at once. A request that arrives while another is
+being profiled is served as normal."""
+
+import cProfile
+import datetime
+import functools
+import hmac
+import os
+import random
+import threading
+import tracemalloc
+import uuid
+from typing import Optional
+
+from flask import make_response, request
+
+from src import config
+
+TOKEN_HEADER = "X-Profile-Token"
+PROFILE_HEADER = "X-Profile"
+
+PSTATS_SUFFIX = ".pstats"
+ALLOCATIONS_SUFFIX = ".allocations.txt"
+
+_profiling_lock = threading.Lock()
+
+
+def _profile_reason() -> Optional[str]:
+    """Why this request should be profiled, or None if it shouldn't."""
+    if not config.PROFILING_ENABLED:
+        return None
+
+    token = request.headers.get(TOKEN_HEADER)
+    if token and config.PROFILING_TOKEN:
+        if hmac.compare_digest(token.encode(), config.PROFILING_TOKEN.encode()):
+            return "requested"
+        return None
+
+    if (
+        config.PROFILING_SAMPLE_EVERY
+        and random.randrange(config.PROFILING_SAMPLE_EVERY) == 0
+    ):
+        return "sampled"
+    return None
+
+
+def _profile_files(directory: str) -> list[os.DirEntry]:
+    """The profiles and their allocations, oldest first."""
+    try:
+        entries = [
+            e
+            for e in os.scandir(directory)
+            if e.is_file() and e.name.endswith((PSTATS_SUFFIX, ALLOCATIONS_SUFFIX))
+        ]
+    except FileNotFoundError:
+        return []
+    return sorted(entries, key=lambda e: (e.stat().st_mtime_ns, e.name))
+
+
+def _enforce_disk_budget(directory: str, budget_bytes: int):
+    """Deletes the oldest profiles until the rest fit in the budget."""
+    entries = _profile_files(directory)
+    total = sum(e.stat().st_size for e in entries)
+    for e in entries:
+        if total <= budget_bytes:
+            break
+        total -= e.stat().st_size
+        try:
+            os.remove(e.path)
+        except FileNotFoundError:
+            # Another worker process got to it first.
+            pass
+
+
+def _write_allocations(
+    path: str,
+    snapshot: tracemalloc.Snapshot,
+    peak_bytes: int,
+    top: int,
+):
+    # Leave out tracemalloc's own allocations.
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    statistics = snapshot.statistics("lineno")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{request.method} {request.full_path}\n")
+        f.write(f"Peak traced memory: {peak_bytes / 1024:.1f} KiB\n")
+        f.write(f"Top {top} allocations still held at the end of the request:\n")
+        for stat in statistics[:top]:
+            f.write(f"{stat}\n")
+
+
+def _run_view(view, args, kwargs):
+    response = make_response(view(*args, **kwargs))
+    # A streamed response is only rendered as it's sent, after the profile
+    # has ended, so it's read in full while it's still being profiled.
+    if response.is_streamed:
+        response.make_sequence()
+    return response
+
+
+def _profile(view, args, kwargs, reason: str):
+    directory = config.PROFILING_OUTPUT_DIR
+    name = "{:%Y%m%dT%H%M%S}-{}-{}-{}".format(
+        datetime.datetime.now(),
+        request.endpoint.replace(".", "_"),
+        reason,
+        uuid.uuid4().hex[:8],
+    )
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        response = profiler.runcall(_run_view, view, args, kwargs)
+        allocations = tracemalloc.take_snapshot()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, name + PSTATS_SUFFIX))
+    _write_allocations(
+        os.path.join(directory, name + ALLOCATIONS_SUFFIX),
+        allocations,
+        peak_bytes,
+        config.PROFILING_TRACEMALLOC_TOP,
+    )
+    _enforce_disk_budget(directory, config.PROFILING_DISK_BUDGET_BYTES)
+
+    if reason == "requested":
+        response.headers[PROFILE_HEADER] = name
+    return response
+
+
+def profiled(view):
+    """Decorates a route so its requests can be profiled."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        reason = _profile_reason()
+        if reason is None:
+            return view(*args, **kwargs)
+
+        # Somebody else is being profiled, so serve this one as normal.
+        if not _profiling_lock.acquire(blocking=False):
+            return view(*args, **kwargs)
+        try:
+            return _profile(view, args, kwargs, reason)
+        finally:
+            _profiling_lock.release()
+
+    return wrapper
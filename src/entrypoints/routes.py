@@ -1,30 +1,168 @@
-from flask import render_template
+import itertools
+from typing import Iterable, Iterator
 
-from src import constants
+from flask import (
+    Blueprint,
+    abort,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+    stream_template,
+)
+from markupsafe import Markup
+
+from src import config, constants, metrics
 from src.adapters.factory import StoreRepoFactory
-from src.app import app
+from src.domain.store_table import StoreTableView
+from src.entrypoints.fragment_cache import StoreFragmentCache
+from src.entrypoints.http_caching import conditional_on_catalog
+from src.entrypoints.profiling import profiled
+from src.exceptions import GeocoderUnavailableError, PostcodeNotFoundError
 from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog
+from src.srv_layer.result_cache import ResultCache
+
+bp = Blueprint("routes", __name__)
 
 
-@app.route("/")
+@bp.route("/")
+@profiled
+@conditional_on_catalog
 def stores():
-    store_repo_factory: StoreRepoFactory = app.config[constants.STORE_REPO_FACTORY]
-    return render_template(
-        "index.html",
-        stores=views.stores(
+    store_repo_factory: StoreRepoFactory = current_app.config[
+        constants.STORE_REPO_FACTORY
+    ]
+    catalog: StoreCatalog = current_app.config[constants.STORE_CATALOG]
+    return _render_store_view(
+        views.stores(
             store_repo_factory(),
+            catalog,
         ),
     )
 
 
-@app.route("/nearby/")
+@bp.route("/nearby/")
+@profiled
+@conditional_on_catalog
 def nearby_stores():
-    store_repo_factory: StoreRepoFactory = app.config[constants.STORE_REPO_FACTORY]
-    return render_template(
-        "index.html",
-        stores=views.nearby_stores(
+    postcode = request.args.get("postcode", config.NEARBY_STORES_DEFAULT_POSTCODE)
+    radius_km = request.args.get(
+        "radius_km",
+        config.NEARBY_STORES_DEFAULT_RADIUS_KM,
+        type=float,
+    )
+
+    if not 0 <= radius_km <= config.NEARBY_STORES_MAX_RADIUS_KM:
+        abort(
+            400,
+            f"radius_km must be between 0 and {config.NEARBY_STORES_MAX_RADIUS_KM}.",
+        )
+
+    store_repo_factory: StoreRepoFactory = current_app.config[
+        constants.STORE_REPO_FACTORY
+    ]
+    catalog: StoreCatalog = current_app.config[constants.STORE_CATALOG]
+    result_cache: ResultCache = current_app.config[constants.NEARBY_RESULT_CACHE]
+    return _render_store_view(
+        views.nearby_stores(
+            store_repo_factory(),
+            postcode,
+            radius_km,
+            catalog,
+            result_cache,
+        ),
+    )
+
+
+@bp.route("/nearest/<postcode>/")
+@profiled
+@conditional_on_catalog
+def nearest_stores(postcode):
+    k = request.args.get("k", config.NEAREST_STORES_DEFAULT_K, type=int)
+    max_radius_km = request.args.get("max_radius_km", None, type=float)
+
+    if not 0 < k <= config.NEAREST_STORES_MAX_K:
+        abort(400, f"k must be between 1 and {config.NEAREST_STORES_MAX_K}.")
+    if max_radius_km is not None and max_radius_km < 0:
+        abort(400, "max_radius_km cannot be negative.")
+
+    store_repo_factory: StoreRepoFactory = current_app.config[
+        constants.STORE_REPO_FACTORY
+    ]
+    catalog: StoreCatalog = current_app.config[constants.STORE_CATALOG]
+    return _render_stores(
+        views.nearest_stores(
             store_repo_factory(),
-            "CM20 1FE",
-            30,
+            postcode,
+            k,
+            max_radius_km,
+            catalog,
         ),
     )
+
+
+def _store_item():
+    return current_app.jinja_env.get_template("store_item.html").module.store_item
+
+
+def _render_store_view(stores: StoreTableView):
+    """Renders the stores from their cached fragments."""
+    fragment_cache: StoreFragmentCache = current_app.config[
+        constants.STORE_FRAGMENT_CACHE
+    ]
+    return _render_store_items(
+        fragment_cache.fragments(stores, _store_item()),
+        len(stores),
+    )
+
+
+def _render_stores(stores: list):
+    # Nearest stores carry their distance from the postcode, so their
+    # fragments can't be cached. There are only ever a few of them.
+    store_item = _store_item()
+    return _render_store_items((store_item(s) for s in stores), len(stores))
+
+
+def _chunks(store_items: Iterator[str], size: int) -> Iterator[Markup]:
+    # A streamed page is written out a chunk at a time, so a chunk per
+    # store would mean a write per store.
+    while chunk := list(itertools.islice(store_items, size)):
+        yield Markup("").join(chunk)
+
+
+def _timed_render(stream: Iterable[str]) -> Iterator[str]:
+    with metrics.stage("render"):
+        yield from stream
+
+
+def _render_store_items(store_items: Iterator[str], n_stores: int):
+    store_item_chunks = _chunks(store_items, config.STORE_LIST_CHUNK_STORES)
+
+    # A long list is streamed, so the first of it is sent before the rest
+    # is rendered, and the page is never held in memory as a whole.
+    if n_stores >= config.STORE_LIST_STREAM_MIN_STORES:
+        return current_app.response_class(
+            _timed_render(
+                stream_template("index.html", store_item_chunks=store_item_chunks)
+            )
+        )
+
+    # The stores are produced as the template reads them, so rendering
+    # includes creating them.
+    with metrics.stage("render"):
+        return render_template("index.html", store_item_chunks=store_item_chunks)
+
+
+@bp.app_errorhandler(PostcodeNotFoundError)
+def postcode_not_found(e: PostcodeNotFoundError):
+    return str(e), 404
+
+
+@bp.app_errorhandler(GeocoderUnavailableError)
+def geocoder_unavailable(e: GeocoderUnavailableError):
+    # The circuit is open for this long, so there's no point retrying sooner.
+    headers = {"Retry-After": str(config.GEOCODER_CIRCUIT_RESET_SECONDS)}
+    if request.path.startswith("/api/"):
+        return jsonify({"error": str(e)}), 503, headers
+    return str(e), 503, headers
@@ -0,0 +1,15 @@
+"""Custom exceptions that are not bound to any particular layer in the
+architecture. Any part of the functionality below the entrypoints can
+raise them, and the entrypoints catch the ones they know about and turn
+them into the appropriate response."""
+
+
+class PostcodeNotFoundError(Exception):
+    def __init__(self, postcode: str):
+        super().__init__(f"Coordinates could not be found for postcode {postcode}.")
+        self.postcode = postcode
+
+
+class GeocoderUnavailableError(Exception):
+    """The postcodes could not be looked up as the geocoder, i.e.
+    Postcodes.io, is failing or too slow to answer."""
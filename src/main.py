@@ -1,9 +1,15 @@
-from src import constants
-from src.adapters.factory import DefaultStoreRepoFactory
-from src.app import app
-from src.entrypoints import routes
+"""The app run on the server, i.e. with
 
-_ = app, routes
+    flask --app src.main run
 
+It's warmed up at startup, unless config.WARM_UP_STEPS is empty."""
 
-app.config[constants.STORE_REPO_FACTORY] = DefaultStoreRepoFactory
+from src import config, constants
+from src.app import create_app
+
+app = create_app(
+    {
+        constants.WARM_UP_STEPS: config.WARM_UP_STEPS,
+        constants.WARM_UP_BUDGET_SECONDS: config.WARM_UP_BUDGET_SECONDS,
+    }
+)
@@ -0,0 +1,339 @@
+"""When /nearby/ was slow in production, we couldn't tell where the time
+went. The hot paths now record how long each stage takes, i.e. geocoding
+the query postcode, filtering the stores or rendering the template, in a
+latency histogram per stage. Calls to Postcodes.io and geocode misses are
+counted too. Everything is exposed in the Prometheus text format on
+/metrics.
+
+Recording is kept cheap, as it happens on every request whether or not
+anybody is scraping: an observation is a bisect of the buckets and two
+additions under a lock. The text is only rendered when /metrics is
+scraped. Set config.METRICS_ENABLED to False to record nothing at all.
+
+The metrics are held per process, so each worker process reports its own
+and Prometheus sums them up.
+
+The classes follow prometheus_client's, so the metrics could be moved
+over to it without touching the code that records them."""
+
+import bisect
+import math
+import threading
+import time
+from typing import Iterator, Optional, Sequence
+
+from src import config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# In seconds, from well under a millisecond, i.e. a cached search, up to
+# the Postcodes.io timeouts.
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric"):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            family = metric.family_name
+            lines.append(f"# HELP {family} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {family} {metric.type_name}")
+            for suffix, labels, value in metric.samples():
+                lines.append(
+                    f"{metric.name}{suffix}{_format_labels(labels)}"
+                    f" {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._children_lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    @property
+    def family_name(self) -> str:
+        """The name on the HELP and TYPE lines, which Prometheus matches
+        the samples' names against."""
+        return self.name
+
+    def labels(self, **labels):
+        """The child metric for these label values, created on first use."""
+        key = tuple([str(labels[n]) for n in self.labelnames])
+        child = self._children.get(key)
+        if child is None:
+            with self._children_lock:
+                child = self._children.setdefault(key, self._create_child())
+        return child
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        with self._children_lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            labels = dict(zip(self.labelnames, key))
+            yield from child.samples(labels)
+
+    def _create_child(self):
+        raise NotImplementedError
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount: float = 1):
+        if not config.METRICS_ENABLED:
+            return
+        with self._lock:
+            self._value += amount
+
+    def samples(self, labels: dict):
+        yield "_total", labels, self._value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    @property
+    def family_name(self) -> str:
+        # As prometheus_client does, the counter's samples and family are
+        # both named with _total. Otherwise the family has no samples and
+        # Prometheus stores them untyped.
+        return f"{self.name}_total"
+
+    def _create_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value: float):
+        # A single assignment, so there's nothing to lock.
+        self._value = value
+
+    def samples(self, labels: dict):
+        yield "", labels, self._value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _create_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _Timer:
+    __slots__ = ("histogram", "started_at")
+
+    def __init__(self, histogram: "_HistogramChild"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started_at)
+
+
+class _HistogramChild:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # The last count is for the +Inf bucket.
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        if not config.METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def time(self) -> _Timer:
+        """Observes how long the with block takes, in seconds."""
+        return _Timer(self)
+
+    def samples(self, labels: dict):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+
+        # Prometheus buckets are cumulative.
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield "_bucket", labels | {"le": _format_value(upper_bound)}, cumulative
+        yield "_sum", labels, total
+        yield "_count", labels, cumulative
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _create_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+
+STAGE_SECONDS = Histogram(
+    "stores_stage_duration_seconds",
+    "Time taken by each stage of serving the stores.",
+    ["stage"],
+)
+UPSTREAM_REQUESTS = Counter(
+    "stores_upstream_requests",
+    "Requests made to upstream services, by outcome.",
+    ["upstream", "outcome"],
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "stores_upstream_request_duration_seconds",
+    "Time taken by each request to an upstream service.",
+    ["upstream"],
+)
+UPSTREAM_BATCH_POSTCODES = Histogram(
+    "stores_upstream_batch_postcodes",
+    "Postcodes sent in each request to an upstream service.",
+    ["upstream"],
+    buckets=(1, 2, 5, 10, 25, 50, 75, 100),
+)
+GEOCODE_CACHE_LOOKUPS = Counter(
+    "stores_geocode_cache_lookups",
+    "Postcodes looked up in the geocode cache, by hit or miss.",
+    ["result"],
+)
+GEOCODE_UNRESOLVED_POSTCODES = Counter(
+    "stores_geocode_unresolved_postcodes",
+    "Postcodes an upstream service couldn't resolve.",
+    ["upstream"],
+)
+CACHE_LOOKUPS = Counter(
+    "stores_cache_lookups",
+    "Lookups in the in-memory caches, by cache and hit or miss.",
+    ["cache", "result"],
+)
+CACHE_EVICTIONS = Counter(
+    "stores_cache_evictions",
+    "Entries evicted from the in-memory caches to make room, by cache.",
+    ["cache"],
+)
+CACHE_INVALIDATIONS = Counter(
+    "stores_cache_invalidations",
+    "Times the in-memory caches were emptied for a new catalog version.",
+    ["cache"],
+)
+CACHE_ENTRIES = Gauge(
+    "stores_cache_entries",
+    "Entries held in the in-memory caches, by cache.",
+    ["cache"],
+)
+PREFILTER_STORES = Counter(
+    "stores_prefilter_stores",
+    "Stores checked by the bounding box prefilter, by whether it kept or pruned"
+    " them. Only catalogs too small for a spatial index are prefiltered.",
+    ["result"],
+)
+CATALOG_STORES = Gauge(
+    "stores_catalog_stores",
+    "Stores in the most recently built or attached store catalog.",
+)
+
+
+def stage(name: str) -> _Timer:
+    """Times a stage, i.e.
+
+    with metrics.stage("geocode"):
+        ..."""
+    return STAGE_SECONDS.labels(stage=name).time()
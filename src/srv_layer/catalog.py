@@ -0,0 +1,214 @@
+"""Stores and their coordinates change rarely, yet every request used
+to re-read stores.json, re-geocode every store and re-sort the result.
+The catalog does that join once per process and holds the result as an
+immutable snapshot that the views read from.
+
+The catalog asks the store repo for its version on every read, which
+for stores.json is a cheap stat of the file. When the version changes a
+new snapshot is built on a background thread, and swapped in with a
+single assignment once it's done. Only one rebuild runs at a time, and
+every read carries on getting the current snapshot in the meantime,
+including the read that noticed the change, so readers never block on a
+reload, however long geocoding the stores takes. The only time readers
+wait is for the very first build, as there is nothing to serve before
+then."""
+
+import dataclasses
+import hashlib
+import itertools
+import logging
+import threading
+import time
+import types
+from typing import Optional
+
+from src import config, metrics
+from src.adapters.factory import StoreRepoFactory
+from src.domain import postcode
+from src.domain.spatial import SpatialIndex
+from src.domain.store_table import StoreTable, StoreTableBuilder
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class CatalogSnapshot:
+    # The stores with their coords, sorted by name.
+    table: StoreTable
+    # The position in the table of each store postcode, normalised, so a
+    # postcode that belongs to a store doesn't need geocoding.
+    postcode_positions: types.MappingProxyType
+    # Digest of the contents, so the same data gets the same version
+    # in every process.
+    version: str
+    # The store repo version the snapshot was built from.
+    source_version: object
+    built_at: float
+    # Positions in the index refer to positions in the table.
+    index: Optional[SpatialIndex] = None
+
+
+def _digest(table: StoreTable) -> str:
+    digest = hashlib.sha1()
+    for column in (table.names, table.postcodes):
+        digest.update("\x1f".join(column).encode("utf-8"))
+        digest.update(b"\x1e")
+    digest.update(table.lats)
+    digest.update(table.longs)
+    digest.update(table.approximate)
+    return digest.hexdigest()[:16]
+
+
+def build_snapshot(
+    store_repo_factory: StoreRepoFactory,
+    source_version=None,
+    clock=time.time,
+    spatial_index_min_stores: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> CatalogSnapshot:
+    """The stores are streamed from the repo and geocoded a batch at a time,
+    so only the table and one batch of store records are held at once.
+    Stores that come with their coords, i.e. from a store database, aren't
+    geocoded again."""
+    if spatial_index_min_stores is None:
+        spatial_index_min_stores = config.SPATIAL_INDEX_MIN_STORES
+    if batch_size is None:
+        batch_size = config.STORE_INGEST_BATCH_SIZE
+
+    with metrics.stage("catalog_build"):
+        snapshot = _build_snapshot(
+            store_repo_factory,
+            source_version,
+            clock,
+            spatial_index_min_stores,
+            batch_size,
+        )
+    metrics.CATALOG_STORES.set(len(snapshot.table))
+    return snapshot
+
+
+def _build_snapshot(
+    store_repo_factory: StoreRepoFactory,
+    source_version,
+    clock,
+    spatial_index_min_stores: int,
+    batch_size: int,
+) -> CatalogSnapshot:
+    store_repo = store_repo_factory.create_store_repo()
+    store_postcode_repo = store_repo_factory.create_store_postcode_repo()
+
+    builder = StoreTableBuilder()
+    stores = store_repo.iter_stores()
+    while True:
+        # The stores are read as they're needed, so reading them is timed
+        # a batch at a time.
+        with metrics.stage("store_read"):
+            batch = list(itertools.islice(stores, batch_size))
+        if not batch:
+            break
+
+        missing = [
+            s["postcode"]
+            for s in batch
+            if s.get("lat") is None or s.get("long") is None
+        ]
+        if missing:
+            with metrics.stage("store_geocode"):
+                postcode_coords_map = store_postcode_repo.postcode_to_coords_map(
+                    list(dict.fromkeys(missing))
+                )
+        else:
+            postcode_coords_map = {}
+        builder.extend(batch, postcode_coords_map)
+
+    table = builder.build()
+    del builder
+
+    postcode_positions = {}
+    for i, p in enumerate(table.postcodes):
+        postcode_positions.setdefault(postcode.normalise(p), i)
+
+    return CatalogSnapshot(
+        table=table,
+        postcode_positions=types.MappingProxyType(postcode_positions),
+        version=_digest(table),
+        source_version=source_version,
+        built_at=clock(),
+        index=(
+            SpatialIndex(table.lats, table.longs)
+            if len(table) >= spatial_index_min_stores
+            else None
+        ),
+    )
+
+
+class StoreCatalog:
+    def __init__(self, store_repo_factory: StoreRepoFactory):
+        self.store_repo_factory = store_repo_factory
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._build_lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+
+        if snapshot is None:
+            with self._build_lock:
+                if self._snapshot is None:
+                    self._snapshot = build_snapshot(
+                        self.store_repo_factory,
+                        self.store_repo_factory.create_store_repo().version(),
+                    )
+                return self._snapshot
+
+        try:
+            source_version = self.store_repo_factory.create_store_repo().version()
+        except Exception:
+            # i.e. stores.json is being replaced. What we have is still good,
+            # and we'll check again on the next read.
+            logger.exception("Failed to read the store catalog's version.")
+            return snapshot
+
+        # A repo that can't tell us its version is assumed not to change.
+        if source_version is None or source_version == snapshot.source_version:
+            return snapshot
+
+        # Somebody else is already rebuilding, so serve what we have.
+        if not self._build_lock.acquire(blocking=False):
+            return snapshot
+
+        try:
+            self._reload_thread = threading.Thread(
+                target=self._reload,
+                args=(snapshot, source_version),
+                name="store-catalog-reload",
+                daemon=True,
+            )
+            self._reload_thread.start()
+        except Exception:
+            self._build_lock.release()
+            raise
+        return snapshot
+
+    def wait_for_reload(self, timeout: Optional[float] = None):
+        """Waits for the reload in progress, if there is one, to finish. For
+        callers that want the newest stores rather than a quick answer, i.e.
+        publishing the catalog."""
+        reload_thread = self._reload_thread
+        if reload_thread is not None:
+            reload_thread.join(timeout)
+
+    def _reload(self, snapshot: CatalogSnapshot, source_version):
+        # Runs with the build lock held, which snapshot() acquired for us.
+        try:
+            if self._snapshot is snapshot:
+                self._snapshot = build_snapshot(
+                    self.store_repo_factory,
+                    source_version,
+                )
+        except Exception:
+            # Keep serving the last good snapshot rather than failing
+            # every request. We'll try again on the next read.
+            logger.exception("Failed to reload the store catalog.")
+        finally:
+            self._build_lock.release()
@@ -0,0 +1,90 @@
+"""Nearby searches are highly repetitive: the same handful of postcodes
+and radii make up most of the traffic. The result cache keeps finished
+results in memory so that a repeat search skips both geocoding the
+postcode and filtering the stores.
+
+Results only hold for the catalog they were computed from, so the
+catalog version is part of every entry's key. Entries for an old version
+are never looked up again once the requests still reading the old
+catalog are done, so they're left to be evicted or to expire rather than
+dropped when a new version turns up. Dropping them would empty the cache
+back and forth during a reload, as requests on the old and the new
+catalog take turns.
+
+The cache is bounded, with the least recently used entries evicted
+first, and entries also expire after a while. Flask's server handles
+requests on several threads, so all access goes through a lock.
+
+The hits, misses and evictions are also counted on
+/metrics, so we can see whether the cache pays for itself."""
+
+import collections
+import threading
+import time
+from typing import Hashable
+
+from src import metrics
+
+
+class ResultCache:
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        clock=time.monotonic,
+        name: str = "nearby_results",
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+        self._hit_counter = metrics.CACHE_LOOKUPS.labels(cache=name, result="hit")
+        self._miss_counter = metrics.CACHE_LOOKUPS.labels(cache=name, result="miss")
+        self._eviction_counter = metrics.CACHE_EVICTIONS.labels(cache=name)
+        self._entries_gauge = metrics.CACHE_ENTRIES.labels(cache=name)
+
+        self._lock = threading.Lock()
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, catalog_version: str):
+        """Returns the cached result, or None on a miss."""
+        key = (catalog_version, key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                    self._entries_gauge.set(len(self._entries))
+                self.misses += 1
+                self._miss_counter.inc()
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._hit_counter.inc()
+            return entry[1]
+
+    def put(self, key: Hashable, catalog_version: str, result):
+        key = (catalog_version, key)
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                self._eviction_counter.inc()
+            self._entries_gauge.set(len(self._entries))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
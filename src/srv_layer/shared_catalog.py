@@ -0,0 +1,282 @@
+"""In production there are several worker processes, and each used to
+read the stores, geocode them and hold its own copy of the catalog. So
+memory and calls to Postcodes.io grew with the number of workers.
+
+Instead, the catalog can be built once, by the publish-catalog command,
+and published to a file that every worker memory-maps read-only. The
+pages of the file are shared by all the processes that map it, so there's
+only one copy of the catalog however many workers there are. The file
+holds the table's columns, the store postcode lookup and the spatial
+index, laid out so they can be read in place:
+
+    header:   8 byte magic, then the number of stores, and the offset
+              and size of the metadata, as uint64s
+    sections: each aligned to 8 bytes, i.e. the lats and longs as
+              doubles, and strings as uint64 offsets into a utf-8 blob
+    metadata: JSON, with the catalog version and where each section is
+
+Refreshes are atomic. A new catalog is written to one side and moved
+into place, and workers attach to it the next time they read the
+catalog. Readers still holding the old snapshot keep a consistent view
+of the old file until they're done with it."""
+
+import array
+import bisect
+import collections.abc
+import itertools
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional, Sequence
+
+from src import metrics
+from src.domain.spatial import SpatialIndex
+from src.domain.store_table import StoreTable
+from src.srv_layer.catalog import CatalogSnapshot
+
+MAGIC = b"STCAT001"
+HEADER = struct.Struct("<8sQQQ")
+ALIGNMENT = 8
+
+logger = logging.getLogger(__name__)
+
+
+def _file_id(stat: os.stat_result) -> tuple:
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _strings(values: Sequence[str]) -> tuple[array.array, bytes]:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = array.array("Q", itertools.accumulate(map(len, encoded), initial=0))
+    return offsets, b"".join(encoded)
+
+
+def publish_snapshot(snapshot: CatalogSnapshot, catalog_file_path: str):
+    """Writes the snapshot to a catalog file. The file is written to one
+    side and moved into place, so workers never see it half written."""
+    table = snapshot.table
+
+    # The store postcodes, normalised and sorted so they can be bisected,
+    # along with the position of each in the table.
+    keys = sorted(snapshot.postcode_positions)
+    key_offsets, key_blob = _strings(keys)
+    name_offsets, name_blob = _strings(table.names)
+    postcode_offsets, postcode_blob = _strings(table.postcodes)
+
+    sections = {
+        "lats": bytes(table.lats),
+        "longs": bytes(table.longs),
+        "approximate": bytes(table.approximate),
+        "name_offsets": name_offsets.tobytes(),
+        "names": name_blob,
+        "postcode_offsets": postcode_offsets.tobytes(),
+        "postcodes": postcode_blob,
+        "key_offsets": key_offsets.tobytes(),
+        "keys": key_blob,
+        "key_positions": array.array(
+            "q", (snapshot.postcode_positions[k] for k in keys)
+        ).tobytes(),
+    }
+    if snapshot.index is not None:
+        ids, points, axes = snapshot.index.columns()
+        sections |= {
+            "index_ids": ids.tobytes(),
+            "index_points": points.tobytes(),
+            "index_axes": axes,
+        }
+
+    directory = os.path.dirname(os.path.abspath(catalog_file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(bytes(HEADER.size))
+
+            layout = {}
+            for name, data in sections.items():
+                f.write(bytes(-f.tell() % ALIGNMENT))
+                layout[name] = [f.tell(), len(data)]
+                f.write(data)
+
+            meta = json.dumps(
+                {
+                    "version": snapshot.version,
+                    "built_at": snapshot.built_at,
+                    "sections": layout,
+                }
+            ).encode("utf-8")
+            meta_offset = f.tell()
+            f.write(meta)
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, len(table), meta_offset, len(meta)))
+        os.replace(tmp_path, catalog_file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class _StringColumn(collections.abc.Sequence):
+    """Strings read straight from the map, decoded as they're read."""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return str(self.blob[self.offsets[i] : self.offsets[i + 1]], "utf-8")
+
+
+class _PostcodePositions(collections.abc.Mapping):
+    """The position of each store postcode, found by bisecting the sorted
+    postcodes rather than from a dict, so it isn't copied into each
+    worker."""
+
+    def __init__(self, keys: _StringColumn, positions: memoryview):
+        self._keys = keys
+        self._positions = positions
+
+    def __getitem__(self, key):
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            raise KeyError(key)
+        return self._positions[i]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def attach_snapshot(catalog_file_path: str) -> CatalogSnapshot:
+    """Maps a catalog file read-only and returns the snapshot in it. The
+    snapshot's columns are read from the map, so nothing is copied, and
+    its source version is the identity of the file."""
+    with open(catalog_file_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        # An empty file can't be mapped.
+        if stat.st_size < HEADER.size:
+            raise ValueError(f"{catalog_file_path} is not a store catalog.")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, count, meta_offset, meta_size = HEADER.unpack_from(mm)
+    if magic != MAGIC or meta_offset + meta_size != len(mm):
+        mm.close()
+        raise ValueError(f"{catalog_file_path} is not a store catalog.")
+
+    meta = json.loads(mm[meta_offset : meta_offset + meta_size])
+    view = memoryview(mm)
+
+    def section(name: str, fmt: str = "B") -> memoryview:
+        offset, size = meta["sections"][name]
+        return view[offset : offset + size].cast(fmt)
+
+    table = StoreTable(
+        _StringColumn(section("name_offsets", "Q"), section("names")),
+        _StringColumn(section("postcode_offsets", "Q"), section("postcodes")),
+        section("lats", "d"),
+        section("longs", "d"),
+        section("approximate"),
+    )
+    if len(table) != count:
+        raise ValueError(f"{catalog_file_path} is not a store catalog.")
+
+    index = None
+    if "index_ids" in meta["sections"]:
+        index = SpatialIndex.from_columns(
+            section("index_ids", "q"),
+            section("index_points", "d"),
+            section("index_axes"),
+        )
+
+    return CatalogSnapshot(
+        table=table,
+        postcode_positions=_PostcodePositions(
+            _StringColumn(section("key_offsets", "Q"), section("keys")),
+            section("key_positions", "q"),
+        ),
+        version=meta["version"],
+        source_version=_file_id(stat),
+        built_at=meta["built_at"],
+        index=index,
+    )
+
+
+class SharedStoreCatalog:
+    """Used by the workers in place of StoreCatalog. Each read is a stat
+    of the catalog file, and the file is attached again when it's been
+    replaced. As with StoreCatalog, only one thread attaches at a time and
+    the rest carry on reading the current snapshot.
+
+    The first read waits up to attach_timeout_seconds for the catalog to be
+    published, i.e. when the workers start before the publisher."""
+
+    def __init__(
+        self,
+        catalog_file_path: str,
+        attach_timeout_seconds: float = 0,
+    ):
+        self.catalog_file_path = catalog_file_path
+        self.attach_timeout_seconds = attach_timeout_seconds
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._attach_lock = threading.Lock()
+
+    def snapshot(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._attach_lock:
+                if self._snapshot is None:
+                    self._snapshot = self._attach_first()
+                return self._snapshot
+
+        try:
+            file_id = _file_id(os.stat(self.catalog_file_path))
+        except FileNotFoundError:
+            # Keep serving what we have until it's published again.
+            return snapshot
+
+        if file_id == snapshot.source_version:
+            return snapshot
+
+        # Somebody else is already attaching, so serve what we have.
+        if not self._attach_lock.acquire(blocking=False):
+            return snapshot
+
+        try:
+            if self._snapshot is snapshot:
+                self._snapshot = self._attach()
+        except Exception:
+            # Keep serving the last good snapshot, the same as StoreCatalog.
+            logger.exception("Failed to attach the shared store catalog.")
+        finally:
+            self._attach_lock.release()
+
+        return self._snapshot
+
+    def _attach_first(self) -> CatalogSnapshot:
+        deadline = time.monotonic() + self.attach_timeout_seconds
+        while True:
+            try:
+                return self._attach()
+            except FileNotFoundError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _attach(self) -> CatalogSnapshot:
+        with metrics.stage("catalog_attach"):
+            snapshot = attach_snapshot(self.catalog_file_path)
+        metrics.CATALOG_STORES.set(len(snapshot.table))
+        return snapshot
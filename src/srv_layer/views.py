@@ -18,74 +18,421 @@ a views.py file inside.
 Service layer objects are intended to make it simple for our higher
 level code (i.e. routes) to call."""
 
+import array
+import itertools
+import logging
+import math
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from src import config, metrics
 from src.adapters.factory import StoreRepoFactory
-from src.domain import factory
+from src.domain import postcode as postcode_module
+from src.domain import store
+from src.domain.bounding_box import BoundingBox, PrefilterResult
+from src.domain.store_table import StoreTableView
+from src.exceptions import PostcodeNotFoundError
+from src.srv_layer.catalog import CatalogSnapshot, StoreCatalog
+from src.srv_layer.result_cache import ResultCache
 
+logger = logging.getLogger(__name__)
 
-def _aggregate_coords(stores: list, postcode_coords_map: dict):
-    for s in stores:
-        if coords := postcode_coords_map.get(s["postcode"]):
-            s["lat"], s["long"] = coords["lat"], coords["long"]
 
+def _record_prefilter(result: PrefilterResult):
+    """Counts how many stores the bounding box prefilter pruned, so we can
+    see what it saves on real traffic."""
+    metrics.PREFILTER_STORES.labels(result="kept").inc(len(result.positions))
+    metrics.PREFILTER_STORES.labels(result="pruned").inc(result.pruned)
 
-def stores(
+    logger.debug(
+        "Bounding box pruned %d of %d stores.",
+        result.pruned,
+        len(result.positions) + result.pruned,
+    )
+
+
+def _snapshot(
     store_repo_factory: StoreRepoFactory,
-):
+    catalog: Optional[StoreCatalog],
+) -> CatalogSnapshot:
+    """Without a process-level catalog, i.e. in a one-off call, we build
+    a throwaway one."""
+    if catalog is None:
+        catalog = StoreCatalog(store_repo_factory)
+    with metrics.stage("catalog"):
+        return catalog.snapshot()
+
+
+def _query_coords_map(
+    store_repo_factory: StoreRepoFactory,
+    snapshot: CatalogSnapshot,
+    postcodes: list[str],
+) -> dict[str, tuple[float, float]]:
+    """The stores' coords are already in the catalog, so we only geocode
+    the postcodes that don't belong to one of the stores, all in one bulk
+    lookup. Postcodes that can't be geocoded are left out."""
+    with metrics.stage("geocode"):
+        return _lookup_query_coords_map(store_repo_factory, snapshot, postcodes)
+
+
+def _lookup_query_coords_map(
+    store_repo_factory: StoreRepoFactory,
+    snapshot: CatalogSnapshot,
+    postcodes: list[str],
+) -> dict[str, tuple[float, float]]:
+    table = snapshot.table
+    coords_map, missing = {}, []
+    for p in postcodes:
+        pos = snapshot.postcode_positions.get(postcode_module.normalise(p))
+        if pos is not None and not math.isnan(table.lats[pos]):
+            coords_map[p] = table.lats[pos], table.longs[pos]
+        else:
+            missing.append(p)
+
+    if missing:
+        store_postcode_repo = store_repo_factory.create_store_postcode_repo()
+        found = store_postcode_repo.postcode_to_coords_map(missing)
+        coords_map.update(
+            (p, (found[p]["lat"], found[p]["long"])) for p in missing if p in found
+        )
+
+    return coords_map
+
+
+def _query_coords(
+    store_repo_factory: StoreRepoFactory,
+    snapshot: CatalogSnapshot,
+    postcode,
+) -> tuple[float, float]:
+    query_coords = _query_coords_map(store_repo_factory, snapshot, [postcode])
+    if postcode not in query_coords:
+        raise PostcodeNotFoundError(postcode)
+    return query_coords[postcode]
+
+
+class StoreResults(NamedTuple):
+    """Stores are produced lazily, one at a time, so that large result sets
+    never have to be held in a list. The catalog version tells the caller
+    which snapshot of the catalog the stores came from, i.e. to make sure
+    the pages of a paginated result all come from the same one."""
 
-    store_repo = store_repo_factory.create_store_repo()
-    store_postcode_repo = store_repo_factory.create_store_postcode_repo()
+    catalog_version: str
+    stores: Iterator[dict]
 
-    stores = store_repo.list()
 
-    postcode_coords_map = store_postcode_repo.postcode_to_coords_map(
-        [s["postcode"] for s in stores],
+def _iter_stores(snapshot: CatalogSnapshot, positions: Iterable[int]):
+    row = snapshot.table.row
+    for i in positions:
+        yield row(i).to_dict()
+
+
+def query_stores(
+    store_repo_factory: StoreRepoFactory,
+    catalog: Optional[StoreCatalog] = None,
+    offset: int = 0,
+) -> StoreResults:
+    """All stores, in alphabetical order, skipping the first offset."""
+    snapshot = _snapshot(store_repo_factory, catalog)
+
+    # The snapshot is already sorted by name.
+    return StoreResults(
+        snapshot.version,
+        _iter_stores(snapshot, range(offset, len(snapshot.table))),
     )
 
-    _aggregate_coords(stores, postcode_coords_map)
 
-    return sorted(
-        stores,
-        key=lambda x: x["name"],
+def _within_radius(
+    store_repo_factory: StoreRepoFactory,
+    snapshot: CatalogSnapshot,
+    postcode,
+    radius_km,
+) -> list[tuple[int, float]]:
+    """Returns the positions of the stores within radius_km of the postcode,
+    from north to south, along with their distances.
+
+    Only candidates get the exact distance check. They come from the store
+    repo's own index when it keeps one, i.e. the R*Tree of a store
+    database, then from the catalog's spatial index when it has one, and
+    otherwise from a bounding box around the query point."""
+
+    query_lat, query_long = _query_coords(store_repo_factory, snapshot, postcode)
+    table = snapshot.table
+
+    with metrics.stage("filter"):
+        positions = store_repo_factory.create_store_repo().candidates_within_radius(
+            query_lat,
+            query_long,
+            radius_km,
+            snapshot.source_version,
+        )
+        if positions is None and snapshot.index is not None:
+            positions = snapshot.index.candidates_within_radius(
+                query_lat,
+                query_long,
+                radius_km,
+            )
+        if positions is None:
+            prefiltered = BoundingBox.around(
+                query_lat,
+                query_long,
+                radius_km,
+            ).prefilter(table.lats, table.longs)
+            _record_prefilter(prefiltered)
+            positions = prefiltered.positions
+
+        # The distances of all candidates are calculated in one batch.
+        within_radius = [
+            (positions[i], distance_km)
+            for i, distance_km in store.distances_within_radius(
+                query_lat,
+                query_long,
+                radius_km,
+                [table.lats[i] for i in positions],
+                [table.longs[i] for i in positions],
+            )
+        ]
+
+    with metrics.stage("sort"):
+        within_radius.sort(key=lambda x: table.lats[x[0]], reverse=True)
+    return within_radius
+
+
+def _bucket_radius_km(radius_km, bucket_km) -> float:
+    """Rounds the radius up to the bucket it falls in, so that searches
+    with similar radii share the same cached result."""
+    if not bucket_km:
+        return radius_km
+    return max(math.ceil(radius_km / bucket_km), 1) * bucket_km
+
+
+def _nearby_positions(
+    store_repo_factory: StoreRepoFactory,
+    snapshot: CatalogSnapshot,
+    postcode,
+    radius_km,
+    result_cache: Optional[ResultCache] = None,
+) -> Iterator[int]:
+    """With a result cache, results are cached by the normalised postcode
+    and the radius rounded up to its bucket. The cached result holds the
+    distance of each store, so a search for a smaller radius in the same
+    bucket still gets exactly the stores within its own radius."""
+
+    if radius_km < 0:
+        raise ValueError("radius_km cannot be negative.")
+
+    if result_cache is None:
+        within_radius = _within_radius(
+            store_repo_factory,
+            snapshot,
+            postcode,
+            radius_km,
+        )
+    else:
+        bucket_radius_km = _bucket_radius_km(
+            radius_km,
+            config.NEARBY_RESULT_CACHE_RADIUS_BUCKET_KM,
+        )
+        key = (postcode_module.normalise(postcode), bucket_radius_km)
+
+        within_radius = result_cache.get(key, snapshot.version)
+        if within_radius is None:
+            within_radius = tuple(
+                _within_radius(
+                    store_repo_factory,
+                    snapshot,
+                    postcode,
+                    bucket_radius_km,
+                )
+            )
+            result_cache.put(key, snapshot.version, within_radius)
+
+    return (i for i, distance_km in within_radius if distance_km <= radius_km)
+
+
+def query_nearby_stores(
+    store_repo_factory: StoreRepoFactory,
+    postcode,
+    radius_km,
+    catalog: Optional[StoreCatalog] = None,
+    offset: int = 0,
+    result_cache: Optional[ResultCache] = None,
+) -> StoreResults:
+    """The stores within radius_km of the postcode, from north to south,
+    skipping the first offset.
+
+    The stores come from the catalog with their coords already joined,
+    so we only need to geocode the supplied postcode. The postcode is
+    geocoded and the stores within radius found before returning, so any
+    errors are raised here rather than part way through the stores."""
+
+    snapshot = _snapshot(store_repo_factory, catalog)
+    positions = _nearby_positions(
+        store_repo_factory,
+        snapshot,
+        postcode,
+        radius_km,
+        result_cache,
+    )
+
+    # Only positions are sorted, the stores are produced as they're needed.
+    return StoreResults(
+        snapshot.version,
+        _iter_stores(snapshot, itertools.islice(positions, offset, None)),
     )
 
 
+def stores(
+    store_repo_factory: StoreRepoFactory,
+    catalog: Optional[StoreCatalog] = None,
+) -> StoreTableView:
+    """All stores, in alphabetical order, as a view of the catalog's table.
+    Stores are only created as the view is read."""
+    return _snapshot(store_repo_factory, catalog).table.view()
+
+
 def nearby_stores(
     store_repo_factory: StoreRepoFactory,
     postcode,
     radius_km,
+    catalog: Optional[StoreCatalog] = None,
+    result_cache: Optional[ResultCache] = None,
+) -> StoreTableView:
+    snapshot = _snapshot(store_repo_factory, catalog)
+    return snapshot.table.view(
+        array.array(
+            "q",
+            _nearby_positions(
+                store_repo_factory,
+                snapshot,
+                postcode,
+                radius_km,
+                result_cache,
+            ),
+        )
+    )
+
+
+def nearest_stores(
+    store_repo_factory: StoreRepoFactory,
+    postcode,
+    k,
+    max_radius_km=None,
+    catalog: Optional[StoreCatalog] = None,
 ):
-    """We won't call stores, which seems like a convenience. Instead
-    we have the opportunity to make only 1 call to Postcodes.io instead of 2.
-    We do this by including the supplied postcode into the call to get the
-    lat and long for the stores."""
+    """Returns the k stores nearest to the postcode, nearest first, each
+    with its distance in km. Optionally only stores within max_radius_km
+    are considered.
 
-    store_repo = store_repo_factory.create_store_repo()
-    store_postcode_repo = store_repo_factory.create_store_postcode_repo()
+    The catalog's spatial index is walked for the k nearest when it has
+    one. Otherwise the nearest are selected with a heap, rather than
+    sorting every store by distance. Either way the distances calculated
+    to pick the stores are the ones returned."""
 
-    stores = store_repo.list()
+    if k < 0:
+        raise ValueError("k cannot be negative.")
 
-    postcode_coords_map = store_postcode_repo.postcode_to_coords_map(
-        [s["postcode"] for s in stores] + [postcode],
-    )
+    snapshot = _snapshot(store_repo_factory, catalog)
+    table = snapshot.table
+    query_lat, query_long = _query_coords(store_repo_factory, snapshot, postcode)
 
-    _aggregate_coords(stores, postcode_coords_map)
+    with metrics.stage("filter"):
+        if snapshot.index is not None:
+            positions = snapshot.index.nearest(query_lat, query_long, k, max_radius_km)
+        elif max_radius_km is not None:
+            prefiltered = BoundingBox.around(
+                query_lat,
+                query_long,
+                max_radius_km,
+            ).prefilter(table.lats, table.longs)
+            _record_prefilter(prefiltered)
+            positions = prefiltered.positions
+        else:
+            positions = None
 
-    if query_coords := postcode_coords_map.get(postcode):
-        query_lat, query_long = query_coords["lat"], query_coords["long"]
+        if positions is None:
+            # Every store is a candidate, so the table's columns are used
+            # as they are rather than copied.
+            positions = range(len(table))
+            lats, longs = table.lats, table.longs
+        else:
+            lats = [table.lats[i] for i in positions]
+            longs = [table.longs[i] for i in positions]
 
-    stores_within_radius = []
-    for s in stores:
-        store = factory.create_store(
-            s["name"],
-            s["postcode"],
-            s.get("lat", None),
-            s.get("long", None),
+        nearest = store.nearest_positions(
+            query_lat,
+            query_long,
+            k,
+            lats,
+            longs,
+            max_radius_km,
         )
-        if store.is_within_radius(query_lat, query_long, radius_km):
-            stores_within_radius.append(s)
 
-    return sorted(
-        stores_within_radius,
-        key=lambda x: x["lat"],
-        reverse=True,
-    )
+    return [
+        {**table.row(positions[i]).to_dict(), "distance_km": distance_km}
+        for distance_km, i in nearest
+    ]
+
+
+class BatchNearbyResults(NamedTuple):
+    catalog_version: str
+    # One result per origin postcode, in the order given. Each has either
+    # the stores nearby, from north to south, or an error.
+    results: list[dict]
+
+
+def batch_nearby_stores(
+    store_repo_factory: StoreRepoFactory,
+    postcodes: list[str],
+    radius_km,
+    catalog: Optional[StoreCatalog] = None,
+) -> BatchNearbyResults:
+    """The stores within radius_km of each of many origin postcodes, each
+    with its distance in km.
+
+    Rather than a nearby search per origin, the origins are geocoded in a
+    single bulk lookup and the distances from every origin to every store
+    calculated in one vectorized pass. An origin that can't be geocoded
+    gets an error in its result rather than failing the whole batch."""
+
+    if radius_km < 0:
+        raise ValueError("radius_km cannot be negative.")
+
+    snapshot = _snapshot(store_repo_factory, catalog)
+    table = snapshot.table
+
+    origins = list(dict.fromkeys(postcodes))
+    coords_map = _query_coords_map(store_repo_factory, snapshot, origins)
+    geocoded = [p for p in origins if p in coords_map]
+
+    with metrics.stage("filter"):
+        within_radius = dict(
+            zip(
+                geocoded,
+                store.batch_distances_within_radius(
+                    [coords_map[p][0] for p in geocoded],
+                    [coords_map[p][1] for p in geocoded],
+                    radius_km,
+                    table.lats,
+                    table.longs,
+                    max_block_cells=config.BATCH_NEARBY_MAX_BLOCK_CELLS,
+                ),
+            )
+        )
+
+    results = []
+    for p in postcodes:
+        if p not in within_radius:
+            results.append({"postcode": p, "error": str(PostcodeNotFoundError(p))})
+            continue
+
+        nearby = sorted(within_radius[p], key=lambda x: table.lats[x[0]], reverse=True)
+        results.append(
+            {
+                "postcode": p,
+                "stores": [
+                    {**table.row(pos).to_dict(), "distance_km": distance_km}
+                    for pos, distance_km in nearby
+                ],
+            }
+        )
+
+    return BatchNearbyResults(snapshot.version, results)
@@ -0,0 +1,89 @@
+"""Nothing used to be prepared before the first request, so the first
+visitor paid for reading the stores, geocoding them and compiling the
+templates. Warm-up does that work at startup instead, on a background
+thread, while the readiness probe reports the app as not ready.
+
+The steps run one after another within a time budget. Steps that fail
+are logged and warm-up carries on, as the app can still do the work on
+demand. Once the budget runs out the app is reported as ready anyway,
+and any steps that haven't started are skipped, so a slow dependency
+can't keep the app out of service forever."""
+
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class WarmUp:
+    def __init__(
+        self,
+        steps: list[tuple[str, Callable[[], None]]],
+        budget_seconds: float,
+        clock=time.monotonic,
+    ):
+        self.steps = steps
+        self.budget_seconds = budget_seconds
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._statuses = {name: PENDING for name, _ in steps}
+        self._started_at: Optional[float] = None
+        self._finished = threading.Event()
+
+    def start(self) -> threading.Thread:
+        """Runs the steps on a background thread."""
+        thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        with self._lock:
+            self._started_at = self.clock()
+
+        try:
+            for name, step in self.steps:
+                if self._is_over_budget():
+                    self._set_status(name, SKIPPED)
+                    continue
+
+                self._set_status(name, RUNNING)
+                try:
+                    step()
+                except Exception:
+                    logger.exception("Warm-up step %s failed.", name)
+                    self._set_status(name, FAILED)
+                else:
+                    self._set_status(name, DONE)
+        finally:
+            self._finished.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def is_ready(self) -> bool:
+        return self._finished.is_set() or self._is_over_budget()
+
+    def report(self) -> dict:
+        with self._lock:
+            statuses = dict(self._statuses)
+        return {"ready": self.is_ready(), "steps": statuses}
+
+    def _is_over_budget(self) -> bool:
+        with self._lock:
+            started_at = self._started_at
+        return (
+            started_at is not None and self.clock() - started_at >= self.budget_seconds
+        )
+
+    def _set_status(self, name: str, status: str):
+        with self._lock:
+            self._statuses[name] = status
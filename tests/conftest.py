@@ -2,16 +2,19 @@ import json
 
 import pytest
 
-from src import config, constants
+from src import config, constants, metrics
 from src.adapters import repo
 from src.adapters.factory import DefaultStoreRepoFactory, StoreRepoFactory
-from src.app import app as flask_app
-from src.entrypoints import routes
-
-_ = routes
+from src.app import create_app
 
 
 class FakeStorePostcodesIORepo(repo.AbstractStorePostcodeRepo):
+    """Looks the postcodes up in a file of real Postcodes.io results. The
+    file is only read once, and shared by all the repos reading it, as
+    repos are created per request."""
+
+    _coords_maps: dict[str, dict] = {}
+
     def __init__(
         self,
         test_store_postcodes_file_path: str,
@@ -22,20 +25,25 @@ class FakeStorePostcodesIORepo(repo.AbstractStorePostcodeRepo):
         self,
         postcodes,
     ):
-        _ = postcodes
-
-        # Map postcodes to their coords.
-        with open(self.test_store_postcodes_file_path, encoding="utf-8") as f:
-            entries = json.load(f)["result"]
-
-        return {
-            e["query"]: {
-                "lat": e["result"]["latitude"],
-                "long": e["result"]["longitude"],
+        coords_map = self._coords_map(self.test_store_postcodes_file_path)
+        return {p: coords_map[p] for p in postcodes if p in coords_map}
+
+    @classmethod
+    def _coords_map(cls, path: str) -> dict:
+        if path not in cls._coords_maps:
+            # Map postcodes to their coords.
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)["result"]
+
+            cls._coords_maps[path] = {
+                e["query"]: {
+                    "lat": e["result"]["latitude"],
+                    "long": e["result"]["longitude"],
+                }
+                for e in entries
+                if e["result"]
             }
-            for e in entries
-            if e["result"]
-        }
+        return cls._coords_maps[path]
 
 
 class FakeStoreRepoFactory(StoreRepoFactory):
@@ -48,35 +56,83 @@ class FakeStoreRepoFactory(StoreRepoFactory):
         )
 
 
+class CountingStoreRepoFactory(FakeStoreRepoFactory):
+    """Counts the postcode repos created, i.e. one per geocoding, and records
+    the postcodes looked up in each call. All the postcode repos share
+    postcode_repo, so a test can stand in for its lookups. The stores are
+    read from stores_file_path when given."""
+
+    def __init__(self, stores_file_path=None):
+        self.stores_file_path = stores_file_path
+        self.postcode_repo = FakeStorePostcodesIORepo(
+            config.TEST_STORE_POSTCODES_FILE,
+        )
+        self.geocode_calls = 0
+        self.lookups = []
+
+    def create_store_repo(self) -> repo.AbstractStoreRepo:
+        if self.stores_file_path is None:
+            return super().create_store_repo()
+        return repo.StoreFileRepo(self.stores_file_path)
+
+    def create_store_postcode_repo(self) -> repo.AbstractStorePostcodeRepo:
+        self.geocode_calls += 1
+        factory = self
+
+        class Counting(repo.AbstractStorePostcodeRepo):
+            def postcode_to_coords_map(self, postcodes):
+                factory.lookups.append(postcodes)
+                return factory.postcode_repo.postcode_to_coords_map(postcodes)
+
+        return Counting()
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def metric_sample(name, **labels):
+    """The value of a sample in the rendered metrics, or 0 if it's not
+    there yet. The metrics are process-wide, so tests check how much a
+    metric has gone up by rather than its value."""
+    rendered = metrics.REGISTRY.render()
+    for line in rendered.splitlines():
+        if line.startswith("#"):
+            continue
+        series, value = line.rsplit(" ", 1)
+        series_name, _, series_labels = series.partition("{")
+        if series_name == name and all(
+            f'{k}="{v}"' in series_labels for k, v in labels.items()
+        ):
+            return float(value)
+    return 0
+
+
 @pytest.fixture
 def e2e_app():
-    flask_app.config.update(
+    yield create_app(
         {
             "TESTING": True,
             "TEMPLATES_AUTO_RELOAD": True,
-            "template_folder": "entrypoints/templates",
+            constants.STORE_REPO_FACTORY: DefaultStoreRepoFactory,
         },
     )
 
-    flask_app.config[constants.STORE_REPO_FACTORY] = DefaultStoreRepoFactory
-
-    yield flask_app
-
 
 @pytest.fixture
 def integrations_app():
-    flask_app.config.update(
+    yield create_app(
         {
             "TESTING": True,
             "TEMPLATES_AUTO_RELOAD": True,
-            "template_folder": "entrypoints/templates",
+            constants.STORE_REPO_FACTORY: FakeStoreRepoFactory,
         },
     )
 
-    flask_app.config[constants.STORE_REPO_FACTORY] = FakeStoreRepoFactory
-
-    yield flask_app
-
 
 @pytest.fixture
 def integrations_client(integrations_app):
@@ -0,0 +1,115 @@
+"""These tests are for the JSON api. They are integrations tests
+as the test AppContext provides a fake repo with the same
+information as what Postcodes.io would provide."""
+
+# Stores returned as JSON in alphabetical order
+# Pages followed with the cursor cover all stores
+# Cursor expired when the catalog changes
+# Bad request on invalid limit or cursor
+# Nearby stores returned as JSON from north to south
+# Nearby stores streamed as NDJSON
+# Not found on unknown nearby postcode
+# Html nearby stores use the query params
+
+
+import dataclasses
+import json
+
+from bs4 import BeautifulSoup
+
+from src import constants
+
+
+def test_stores_returned_as_json_in_alphabetical_order(integrations_client):
+    """Stores returned as JSON in alphabetical order"""
+    response = integrations_client.get("/api/stores/?limit=1000")
+    assert response.status_code == 200
+
+    names = [s["name"] for s in response.json["stores"]]
+    assert len(names) == 95
+    assert names == sorted(names)
+    assert response.json["next_cursor"] is None
+
+
+def test_pages_followed_with_cursor_cover_all_stores(integrations_client):
+    """Pages followed with the cursor cover all stores"""
+    names, cursor = [], None
+    while True:
+        url = "/api/stores/?limit=10" + (f"&cursor={cursor}" if cursor else "")
+        response = integrations_client.get(url)
+        assert response.status_code == 200
+        assert len(response.json["stores"]) <= 10
+
+        names += [s["name"] for s in response.json["stores"]]
+        if not (cursor := response.json["next_cursor"]):
+            break
+
+    all_stores = integrations_client.get("/api/stores/?limit=1000").json["stores"]
+    assert names == [s["name"] for s in all_stores]
+
+
+def test_cursor_expired_when_catalog_changes(integrations_app, integrations_client):
+    """Cursor expired when the catalog changes"""
+    cursor = integrations_client.get("/api/stores/?limit=10").json["next_cursor"]
+
+    catalog = integrations_app.config[constants.STORE_CATALOG]
+    catalog._snapshot = dataclasses.replace(catalog._snapshot, version="changed")
+
+    response = integrations_client.get(f"/api/stores/?limit=10&cursor={cursor}")
+    assert response.status_code == 410
+
+
+def test_bad_request_on_invalid_limit_or_cursor(integrations_client):
+    """Bad request on invalid limit or cursor"""
+    assert integrations_client.get("/api/stores/?limit=0").status_code == 400
+    assert integrations_client.get("/api/stores/?limit=100000").status_code == 400
+    assert integrations_client.get("/api/stores/?cursor=notacursor").status_code == 400
+    assert integrations_client.get("/api/stores/nearby/").status_code == 400
+
+
+def test_nearby_stores_returned_as_json_from_north_to_south(integrations_client):
+    """Nearby stores returned as JSON from north to south"""
+    response = integrations_client.get(
+        "/api/stores/nearby/?postcode=CM20 1FE&radius_km=30"
+    )
+    assert response.status_code == 200
+
+    stores = response.json["stores"]
+    assert stores
+    assert all(stores[i]["lat"] >= stores[i + 1]["lat"] for i in range(len(stores) - 1))
+
+
+def test_nearby_stores_streamed_as_ndjson(integrations_client):
+    """Nearby stores streamed as NDJSON"""
+    paged = integrations_client.get(
+        "/api/stores/nearby/?postcode=CM20 1FE&radius_km=30"
+    ).json["stores"]
+
+    response = integrations_client.get(
+        "/api/stores/nearby/?postcode=CM20 1FE&radius_km=30",
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+
+    streamed = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert streamed == paged
+
+
+def test_not_found_on_unknown_nearby_postcode(integrations_client):
+    """Not found on unknown nearby postcode"""
+    response = integrations_client.get("/api/stores/nearby/?postcode=ZZ99 9ZZ")
+    assert response.status_code == 404
+    assert "error" in response.json
+
+
+def test_html_nearby_stores_use_query_params(integrations_client):
+    """Html nearby stores use the query params"""
+    response = integrations_client.get("/nearby/?postcode=EN9 3YW&radius_km=5")
+    assert response.status_code == 200
+
+    soup = BeautifulSoup(response.data, "html.parser")
+    names = [p.text for p in soup.find_all("p", class_="store-name")]
+    assert names
+    assert "Harlow" not in names
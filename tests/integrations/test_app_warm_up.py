@@ -0,0 +1,130 @@
+"""The apps are created with the FakeStoreRepoFactory, so warming them up
+doesn't call Postcodes.io."""
+
+# Catalog, geocoder and templates warmed up before ready
+# Not ready while warm-up is running
+# Ready once the budget runs out, with the rest skipped
+# Failed steps don't hold up readiness
+# Ready straight away without warm-up
+# Healthy whether or not ready
+# Error on an unknown warm-up step
+
+
+import threading
+import time
+
+import pytest
+
+from src import constants
+from src.app import create_app
+from src.srv_layer import warm_up
+from src.srv_layer.warm_up import WarmUp
+from tests.conftest import CountingStoreRepoFactory, FakeStoreRepoFactory
+
+
+def create_warm_app(steps=("catalog", "geocode", "templates"), **app_config):
+    return create_app(
+        {
+            "TESTING": True,
+            constants.STORE_REPO_FACTORY: CountingStoreRepoFactory,
+            constants.WARM_UP_STEPS: steps,
+        }
+        | app_config,
+    )
+
+
+def test_catalog_geocoder_and_templates_warmed_up_before_ready():
+    """Catalog, geocoder and templates warmed up before ready"""
+    # The app creates a factory per request, so it's given the same one
+    # every time to see all of its lookups.
+    factory = CountingStoreRepoFactory()
+    app = create_warm_app(**{constants.STORE_REPO_FACTORY: lambda: factory})
+    assert app.config[constants.WARM_UP].wait(timeout=5)
+
+    response = app.test_client().get("/readyz")
+    assert response.status_code == 200
+    assert response.json == {
+        "ready": True,
+        "steps": {"catalog": "done", "geocode": "done", "templates": "done"},
+    }
+
+    assert app.config[constants.STORE_CATALOG]._snapshot is not None
+    assert ["CM20 1FE"] in factory.lookups
+    assert any(name == "index.html" for _, name in app.jinja_env.cache.keys())
+
+
+def test_not_ready_while_warm_up_running():
+    """Not ready while warm-up is running"""
+    released = threading.Event()
+
+    class BlockingStoreRepoFactory(FakeStoreRepoFactory):
+        def create_store_repo(self):
+            released.wait(timeout=5)
+            return super().create_store_repo()
+
+    app = create_warm_app(
+        steps=("catalog",),
+        **{constants.STORE_REPO_FACTORY: BlockingStoreRepoFactory},
+    )
+    client = app.test_client()
+
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json["steps"]["catalog"] in ("pending", "running")
+
+    released.set()
+    assert app.config[constants.WARM_UP].wait(timeout=5)
+    assert client.get("/readyz").status_code == 200
+
+
+def test_ready_once_budget_runs_out_with_rest_skipped():
+    """Ready once the budget runs out, with the rest skipped"""
+    released = threading.Event()
+    steps = [("slow", lambda: released.wait(timeout=5)), ("next", lambda: None)]
+    warm = WarmUp(steps, budget_seconds=0.1)
+    warm.start()
+
+    assert not warm.is_ready()
+    time.sleep(0.15)
+    assert warm.is_ready()
+
+    released.set()
+    assert warm.wait(timeout=5)
+    assert warm.report()["steps"] == {"slow": warm_up.DONE, "next": warm_up.SKIPPED}
+
+
+def test_failed_steps_dont_hold_up_readiness():
+    """Failed steps don't hold up readiness"""
+
+    def fail():
+        raise ConnectionError()
+
+    warm = WarmUp([("fail", fail), ("next", lambda: None)], budget_seconds=5)
+    warm.run()
+
+    assert warm.is_ready()
+    assert warm.report()["steps"] == {"fail": warm_up.FAILED, "next": warm_up.DONE}
+
+
+def test_ready_straight_away_without_warm_up(integrations_client):
+    """Ready straight away without warm-up"""
+    response = integrations_client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json == {"ready": True, "steps": {}}
+
+
+def test_healthy_whether_or_not_ready():
+    """Healthy whether or not ready"""
+    app = create_warm_app(steps=())
+    # Swap in a warm-up that hasn't been started.
+    app.config[constants.WARM_UP] = WarmUp([], budget_seconds=5)
+
+    client = app.test_client()
+    assert client.get("/readyz").status_code == 503
+    assert client.get("/healthz").status_code == 200
+
+
+def test_error_on_unknown_warm_up_step():
+    """Error on an unknown warm-up step"""
+    with pytest.raises(ValueError):
+        create_warm_app(steps=("catalog", "caches"))
@@ -0,0 +1,126 @@
+"""The benchmarks are run on small synthetic catalogs, with one repeat, to
+check they work rather than to time anything."""
+
+# Same seed generates the same catalog
+# Synthetic postcodes are unique and normalised
+# Synthetic geocoder only answers the postcodes asked for
+# Synthetic geocoder fails at its failure rate
+# Benchmark results saved as JSON
+# Runs compared by median time
+# Error on an unknown benchmark case
+
+
+import pytest
+
+from benchmarks import cases, measure, synthetic
+from src.domain import postcode
+
+
+def test_same_seed_generates_same_catalog():
+    """Same seed generates the same catalog"""
+    catalog = synthetic.generate_catalog(200, seed=1)
+
+    again = synthetic.generate_catalog(200, seed=1)
+    assert (catalog.names, catalog.postcodes) == (again.names, again.postcodes)
+    # Compared as strings, as the coords that don't resolve are nan.
+    assert str(catalog.coords) == str(again.coords)
+    assert catalog.postcodes != synthetic.generate_catalog(200, seed=2).postcodes
+    assert len(catalog) == 200
+
+
+def test_synthetic_postcodes_unique_and_normalised():
+    """Synthetic postcodes are unique and normalised"""
+    catalog = synthetic.generate_catalog(1000)
+    postcodes = catalog.postcodes + catalog.query_postcodes
+
+    assert len(set(postcodes)) == len(postcodes)
+    assert all(postcode.normalise(p) == p for p in postcodes)
+    # Some of them don't resolve, the same as on Postcodes.io.
+    assert 0 < len(catalog.resolved_postcodes()) < len(catalog)
+
+
+def test_synthetic_geocoder_only_answers_postcodes_asked_for():
+    """Synthetic geocoder only answers the postcodes asked for"""
+    catalog = synthetic.generate_catalog(100)
+    geocoder = synthetic.SyntheticStorePostcodeRepo(catalog)
+    resolved = catalog.resolved_postcodes()[:3]
+
+    coords_map = geocoder.postcode_to_coords_map(resolved + ["ZZ99 9ZZ"])
+
+    assert set(coords_map) == set(resolved)
+    assert coords_map[resolved[0]] == {
+        "lat": catalog.coords[resolved[0]][0],
+        "long": catalog.coords[resolved[0]][1],
+    }
+
+
+def test_synthetic_geocoder_fails_at_its_failure_rate():
+    """Synthetic geocoder fails at its failure rate"""
+    catalog = synthetic.generate_catalog(100)
+    geocoder = synthetic.SyntheticStorePostcodeRepo(catalog, failure_rate=0.5)
+
+    for _ in range(200):
+        try:
+            geocoder.postcode_to_coords_map(catalog.postcodes[:1])
+        except ConnectionError:
+            pass
+
+    assert geocoder.calls == 200
+    assert 60 < geocoder.failures < 140
+
+
+def test_benchmark_results_saved_as_json(tmp_path):
+    """Benchmark results saved as JSON"""
+    settings = cases.Settings(
+        sizes=[100, 200],
+        cases=list(cases.CASES),
+        repeats=1,
+        queries=4,
+    )
+    measurements = cases.run(settings)
+    path = str(tmp_path / "results" / "run.json")
+    measure.save_results(path, {"sizes": settings.sizes}, measurements)
+
+    results = measure.load_results(path)
+    assert results["settings"] == {"sizes": [100, 200]}
+    assert "python" in results["environment"]
+    assert [(r["case"], r["stores"]) for r in results["results"]] == [
+        (c, size) for size in [100, 200] for c in cases.CASES
+    ]
+    for r in results["results"]:
+        assert r["failures"] == 0
+        assert 0 < r["seconds"]["min"] <= r["seconds"]["max"]
+        assert r["peak_memory_bytes"] > 0
+
+
+def test_runs_compared_by_median_time():
+    """Runs compared by median time"""
+
+    def run(medians):
+        return {
+            "results": [
+                {"case": c, "stores": 100, "seconds": {"median": s}}
+                for c, s in medians.items()
+            ]
+        }
+
+    rows = measure.compare(
+        run({"views.stores": 0.2, "routes.stores": 1.0}),
+        run({"views.stores": 0.1, "build_snapshot": 3.0}),
+    )
+
+    assert rows == [
+        {
+            "case": "views.stores",
+            "stores": 100,
+            "baseline_seconds": 0.2,
+            "candidate_seconds": 0.1,
+            "ratio": 0.5,
+        }
+    ]
+
+
+def test_error_on_unknown_benchmark_case():
+    """Error on an unknown benchmark case"""
+    with pytest.raises(ValueError):
+        cases.run(cases.Settings(sizes=[100], cases=["views.everything"]))
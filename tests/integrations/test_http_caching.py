@@ -0,0 +1,76 @@
+"""These tests are for the conditional caching of the store
+listings. They are integrations tests as the test AppContext
+provides a fake repo with the same information as what
+Postcodes.io would provide."""
+
+# Listing sent with validators
+# Not modified on matching ETag without calling the view
+# Not modified since Last-Modified
+# ETag differs by query params
+# Modified when the catalog changes
+
+
+import dataclasses
+
+from src import config, constants
+from src.srv_layer import views
+
+
+def test_listing_sent_with_validators(integrations_client):
+    """Listing sent with validators"""
+    response = integrations_client.get("/")
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert response.last_modified is not None
+    assert response.headers["Cache-Control"] == config.HTTP_CACHE_CONTROL
+
+
+def test_not_modified_on_matching_etag_without_calling_view(
+    integrations_client,
+    monkeypatch,
+):
+    """Not modified on matching ETag without calling the view"""
+    etag, _ = integrations_client.get("/nearby/").get_etag()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The view should not have been called.")
+
+    monkeypatch.setattr(views, "nearby_stores", fail)
+
+    response = integrations_client.get(
+        "/nearby/",
+        headers={"If-None-Match": f'"{etag}"'},
+    )
+    assert response.status_code == 304
+    assert response.get_etag() == (etag, False)
+
+
+def test_not_modified_since_last_modified(integrations_client):
+    """Not modified since Last-Modified"""
+    last_modified = integrations_client.get("/").headers["Last-Modified"]
+
+    response = integrations_client.get(
+        "/",
+        headers={"If-Modified-Since": last_modified},
+    )
+    assert response.status_code == 304
+
+
+def test_etag_differs_by_query_params(integrations_client):
+    """ETag differs by query params"""
+    etag_30 = integrations_client.get("/nearby/?radius_km=30").get_etag()
+    etag_5 = integrations_client.get("/nearby/?radius_km=5").get_etag()
+    assert etag_30 != etag_5
+
+
+def test_modified_when_catalog_changes(integrations_app, integrations_client):
+    """Modified when the catalog changes"""
+    etag, _ = integrations_client.get("/").get_etag()
+
+    catalog = integrations_app.config[constants.STORE_CATALOG]
+    catalog._snapshot = dataclasses.replace(catalog._snapshot, version="changed")
+
+    response = integrations_client.get("/", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
@@ -0,0 +1,136 @@
+"""The mock Postcodes.io server is run on a local port and called through
+PostcodesIORepo, the same as the app calls Postcodes.io. The load test is
+run for a second, against a small synthetic catalog, to check it works
+rather than to measure anything."""
+
+# Mock server answers bulk lookups for PostcodesIORepo
+# Mock server refuses more than 100 postcodes at a time
+# Mock server fails at its error rate
+# Load test reports throughput, latencies and upstream calls
+# Config put back after the load test
+# Error on an unknown route in the request mix
+# Nearest-rank percentiles
+
+
+import pytest
+import requests
+
+from benchmarks import load_test, synthetic
+from benchmarks.measure import percentile
+from benchmarks.mock_postcodesio import MockPostcodesIOServer
+from src import config
+from src.adapters import repo
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return synthetic.generate_catalog(300)
+
+
+def test_mock_server_answers_bulk_lookups_for_postcodesio_repo(catalog):
+    """Mock server answers bulk lookups for PostcodesIORepo"""
+    resolved = catalog.resolved_postcodes()[:150]
+
+    with MockPostcodesIOServer(catalog) as upstream:
+        coords_map = repo.PostcodesIORepo(
+            upstream.bulk_postcodes_url,
+            session=requests.Session(),
+        ).postcode_to_coords_map(resolved + ["ZZ99 9ZZ"])
+
+        # Split into chunks of 100 postcodes.
+        assert upstream.stats().calls == 2
+        assert upstream.stats().postcodes == 151
+
+    assert set(coords_map) == set(resolved)
+    assert coords_map[resolved[0]] == {
+        "lat": catalog.coords[resolved[0]][0],
+        "long": catalog.coords[resolved[0]][1],
+    }
+
+
+def test_mock_server_refuses_more_than_100_postcodes(catalog):
+    """Mock server refuses more than 100 postcodes at a time"""
+    with MockPostcodesIOServer(catalog) as upstream:
+        response = requests.post(
+            upstream.bulk_postcodes_url,
+            json={"postcodes": catalog.postcodes[:101]},
+        )
+
+        assert response.status_code == 400
+        assert upstream.stats().rejected == 1
+
+
+def test_mock_server_fails_at_its_error_rate(catalog):
+    """Mock server fails at its error rate"""
+    with MockPostcodesIOServer(catalog, error_rate=0.5) as upstream:
+        with requests.Session() as session:
+            statuses = [
+                session.post(
+                    upstream.bulk_postcodes_url,
+                    json={"postcodes": catalog.postcodes[:1]},
+                ).status_code
+                for _ in range(100)
+            ]
+
+        assert set(statuses) == {200, 500}
+        assert statuses.count(500) == upstream.stats().errors
+        assert 25 < upstream.stats().errors < 75
+
+
+def test_load_test_reports_throughput_latencies_and_upstream_calls():
+    """Load test reports throughput, latencies and upstream calls"""
+    report = load_test.run(
+        load_test.LoadTestSettings(
+            stores=300,
+            clients=4,
+            duration_seconds=1,
+            postcodes=20,
+            upstream_latency_seconds=0.01,
+            upstream_jitter_seconds=0.005,
+        )
+    )
+
+    assert report["requests"] > 0
+    assert report["throughput_rps"] > 0
+    assert set(report["routes"]) == {"stores", "nearby"}
+    latency = report["latency_ms"]
+    assert 0 < latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+    assert set(report["statuses"]) <= {"200", "404"}
+    # The stores were geocoded during warm-up, 100 postcodes at a time.
+    assert report["upstream"]["warm_up"]["calls"] == 3
+    assert report["upstream"]["load"]["rejected"] == 0
+
+
+def test_config_put_back_after_load_test():
+    """Config put back after the load test"""
+    url, stores_file = config.POSTCODESIO_BULK_POSTCODES_URL, config.STORES_FILE
+
+    load_test.run(
+        load_test.LoadTestSettings(
+            stores=100,
+            clients=1,
+            duration_seconds=0.1,
+            postcodes=5,
+            upstream_latency_seconds=0,
+            upstream_jitter_seconds=0,
+        )
+    )
+
+    assert config.POSTCODESIO_BULK_POSTCODES_URL == url
+    assert config.STORES_FILE == stores_file
+
+
+def test_error_on_unknown_route_in_request_mix():
+    """Error on an unknown route in the request mix"""
+    with pytest.raises(ValueError):
+        load_test.run(load_test.LoadTestSettings(mix={"stores": 1, "api": 1}))
+
+
+def test_nearest_rank_percentiles():
+    """Nearest-rank percentiles"""
+    values = list(range(100, 0, -1))
+
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 95) == 7
@@ -0,0 +1,240 @@
+"""The metrics are process-wide, so the tests check how much a metric has
+gone up by rather than its value. Postcodes.io is stood in for by the
+mock server from the benchmarks."""
+
+# Stage timings recorded for a nearby search
+# Metrics exposed in the Prometheus text format
+# Every sample belongs to a family with HELP and TYPE lines
+# Histogram buckets are cumulative
+# Upstream requests, batch sizes and unresolved postcodes counted
+# Upstream errors counted
+# Geocode cache hits and misses counted
+# Catalog size reported
+# Stores kept and pruned by the prefilter counted
+# Nearby result cache hits, misses and evictions counted
+# Nothing recorded with metrics disabled
+
+
+import pytest
+import requests
+
+from benchmarks import synthetic
+from benchmarks.mock_postcodesio import MockPostcodesIOServer
+from src import config, metrics
+from src.adapters import repo
+from src.srv_layer.result_cache import ResultCache
+from tests.conftest import metric_sample
+
+
+def stage_count(stage):
+    return metric_sample("stores_stage_duration_seconds_count", stage=stage)
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return synthetic.generate_catalog(250)
+
+
+def test_stage_timings_recorded_for_nearby_search(integrations_client):
+    """Stage timings recorded for a nearby search"""
+    stages = ["catalog", "geocode", "filter", "sort", "render"]
+    before = {s: stage_count(s) for s in stages}
+
+    response = integrations_client.get("/nearby/?postcode=AL1%202RJ&radius_km=30")
+    assert response.status_code == 200
+
+    for s in stages:
+        assert stage_count(s) == before[s] + 1, s
+    assert metric_sample("stores_stage_duration_seconds_sum", stage="render") > 0
+
+
+def test_metrics_exposed_in_prometheus_text_format(integrations_client):
+    """Metrics exposed in the Prometheus text format"""
+    integrations_client.get("/")
+
+    response = integrations_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert "# TYPE stores_stage_duration_seconds histogram" in text
+    assert "# TYPE stores_upstream_requests_total counter" in text
+    assert "# TYPE stores_catalog_stores gauge" in text
+    assert 'stores_stage_duration_seconds_bucket{stage="render",le="+Inf"}' in text
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            float(line.rsplit(" ", 1)[1])
+
+
+def test_every_sample_belongs_to_family_with_help_and_type(integrations_client):
+    """Every sample belongs to a family with HELP and TYPE lines"""
+    integrations_client.get("/nearby/?postcode=AL1%202RJ&radius_km=30")
+    text = integrations_client.get("/metrics").get_data(as_text=True)
+
+    helps, types, sample_names = set(), {}, set()
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            helps.add(line.split(" ")[2])
+        elif line.startswith("# TYPE "):
+            _, _, family, type_name = line.split(" ")
+            types[family] = type_name
+        else:
+            sample_names.add(line.split("{")[0].split(" ")[0])
+
+    assert helps == set(types)
+    assert types["stores_upstream_requests_total"] == "counter"
+    suffixes = {
+        "counter": [""],
+        "gauge": [""],
+        "histogram": ["_bucket", "_sum", "_count"],
+    }
+    for name in sample_names:
+        assert any(
+            name == family + suffix
+            for family, type_name in types.items()
+            for suffix in suffixes[type_name]
+        ), name
+    for family, type_name in types.items():
+        if type_name == "counter":
+            assert family.endswith("_total"), family
+
+
+def test_histogram_buckets_are_cumulative():
+    """Histogram buckets are cumulative"""
+    registry = metrics.Registry()
+    histogram = metrics.Histogram(
+        "test_seconds",
+        "A test.",
+        ["path"],
+        buckets=[0.1, 1],
+        registry=registry,
+    )
+    for value in [0.05, 0.5, 0.5, 5]:
+        histogram.labels(path='/a "b"').observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP test_seconds A test.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{path="/a \\"b\\"",le="0.1"} 1',
+        'test_seconds_bucket{path="/a \\"b\\"",le="1"} 3',
+        'test_seconds_bucket{path="/a \\"b\\"",le="+Inf"} 4',
+        'test_seconds_sum{path="/a \\"b\\""} 6.05',
+        'test_seconds_count{path="/a \\"b\\""} 4',
+    ]
+
+
+def test_upstream_requests_batch_sizes_and_unresolved_postcodes_counted(catalog):
+    """Upstream requests, batch sizes and unresolved postcodes counted"""
+    postcodes = catalog.resolved_postcodes()[:150] + ["ZZ99 9ZZ"]
+    ok = metric_sample("stores_upstream_requests_total", outcome="ok")
+    batches = metric_sample("stores_upstream_batch_postcodes_count")
+    batched_postcodes = metric_sample("stores_upstream_batch_postcodes_sum")
+    unresolved = metric_sample("stores_geocode_unresolved_postcodes_total")
+
+    with MockPostcodesIOServer(catalog) as upstream:
+        repo.PostcodesIORepo(
+            upstream.bulk_postcodes_url,
+            session=requests.Session(),
+        ).postcode_to_coords_map(postcodes)
+
+    assert metric_sample("stores_upstream_requests_total", outcome="ok") == ok + 2
+    assert metric_sample("stores_upstream_batch_postcodes_count") == batches + 2
+    assert (
+        metric_sample("stores_upstream_batch_postcodes_sum") == batched_postcodes + 151
+    )
+    assert metric_sample("stores_geocode_unresolved_postcodes_total") == unresolved + 1
+
+
+def test_upstream_errors_counted(catalog):
+    """Upstream errors counted"""
+    errors = metric_sample("stores_upstream_requests_total", outcome="error")
+
+    with MockPostcodesIOServer(catalog, error_rate=1) as upstream:
+        with pytest.raises(requests.HTTPError):
+            repo.PostcodesIORepo(
+                upstream.bulk_postcodes_url,
+                session=requests.Session(),
+            ).postcode_to_coords_map(catalog.postcodes[:1])
+
+    assert (
+        metric_sample("stores_upstream_requests_total", outcome="error") == errors + 1
+    )
+
+
+def test_geocode_cache_hits_and_misses_counted(catalog, tmp_path):
+    """Geocode cache hits and misses counted"""
+    hits = metric_sample("stores_geocode_cache_lookups_total", result="hit")
+    misses = metric_sample("stores_geocode_cache_lookups_total", result="miss")
+    cached_repo = repo.SqliteCachingStorePostcodeRepo(
+        synthetic.SyntheticStorePostcodeRepo(catalog),
+        str(tmp_path / "geocode_cache.sqlite3"),
+        ttl_seconds=60,
+        negative_ttl_seconds=60,
+        max_entries=100,
+    )
+
+    cached_repo.postcode_to_coords_map(catalog.postcodes[:3])
+    cached_repo.postcode_to_coords_map(catalog.postcodes[:5])
+
+    assert metric_sample("stores_geocode_cache_lookups_total", result="hit") == hits + 3
+    assert (
+        metric_sample("stores_geocode_cache_lookups_total", result="miss") == misses + 5
+    )
+
+
+def test_catalog_size_reported(integrations_client):
+    """Catalog size reported"""
+    integrations_client.get("/")
+
+    assert metric_sample("stores_catalog_stores") == 95
+
+
+def test_stores_kept_and_pruned_by_prefilter_counted(integrations_client):
+    """Stores kept and pruned by the prefilter counted"""
+    kept = metric_sample("stores_prefilter_stores_total", result="kept")
+    pruned = metric_sample("stores_prefilter_stores_total", result="pruned")
+
+    integrations_client.get("/nearby/?postcode=AL1%202RJ&radius_km=30")
+
+    # The test catalog is too small for a spatial index, so it's prefiltered.
+    kept_delta = metric_sample("stores_prefilter_stores_total", result="kept") - kept
+    pruned_delta = (
+        metric_sample("stores_prefilter_stores_total", result="pruned") - pruned
+    )
+    assert kept_delta > 0
+    assert pruned_delta > 0
+    assert kept_delta + pruned_delta <= 95
+
+
+def test_nearby_result_cache_hits_misses_and_evictions_counted():
+    """Nearby result cache hits, misses and evictions counted"""
+    hits = metric_sample("stores_cache_lookups_total", cache="test", result="hit")
+    misses = metric_sample("stores_cache_lookups_total", cache="test", result="miss")
+    evictions = metric_sample("stores_cache_evictions_total", cache="test")
+    result_cache = ResultCache(max_entries=1, ttl_seconds=60, name="test")
+
+    result_cache.get("a", "v1")
+    result_cache.put("a", "v1", [1])
+    result_cache.get("a", "v1")
+    result_cache.put("b", "v1", [2])
+
+    assert (
+        metric_sample("stores_cache_lookups_total", cache="test", result="hit")
+        == hits + 1
+    )
+    assert (
+        metric_sample("stores_cache_lookups_total", cache="test", result="miss")
+        == misses + 1
+    )
+    assert metric_sample("stores_cache_evictions_total", cache="test") == evictions + 1
+    assert metric_sample("stores_cache_entries", cache="test") == 1
+
+
+def test_nothing_recorded_with_metrics_disabled(monkeypatch, integrations_client):
+    """Nothing recorded with metrics disabled"""
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+    before = stage_count("render")
+
+    integrations_client.get("/")
+
+    assert stage_count("render") == before
@@ -0,0 +1,161 @@
+"""The profiles are written to a temporary directory per test."""
+
+# Request profiled with the authorised header
+# Allocations captured for a profiled request
+# Request not profiled without the header
+# Request not profiled with the wrong token
+# Nothing profiled with profiling disabled
+# 1 in N requests sampled
+# Oldest profiles deleted to stay within the disk budget
+# Request served as normal while another is profiled
+
+
+import pstats
+
+import pytest
+
+from src import config
+from src.entrypoints import profiling
+
+TOKEN = "let-me-profile"
+
+
+@pytest.fixture
+def profiles_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(config, "PROFILING_TOKEN", TOKEN)
+    monkeypatch.setattr(config, "PROFILING_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "PROFILING_SAMPLE_EVERY", 0)
+    return tmp_path
+
+
+def profile_names(directory):
+    return sorted(p.name for p in directory.iterdir())
+
+
+def test_request_profiled_with_authorised_header(profiles_dir, integrations_client):
+    """Request profiled with the authorised header"""
+    response = integrations_client.get(
+        "/nearby/?postcode=AL1%202RJ&radius_km=30",
+        headers={profiling.TOKEN_HEADER: TOKEN},
+    )
+
+    assert response.status_code == 200
+    name = response.headers[profiling.PROFILE_HEADER]
+    assert "routes_nearby_stores-requested" in name
+    stats = pstats.Stats(str(profiles_dir / f"{name}.pstats"))
+    assert any(
+        function == "nearby_stores" for _, _, function in stats.stats  # type: ignore
+    )
+
+
+def test_allocations_captured_for_profiled_request(profiles_dir, integrations_client):
+    """Allocations captured for a profiled request"""
+    response = integrations_client.get(
+        "/",
+        headers={profiling.TOKEN_HEADER: TOKEN},
+    )
+
+    name = response.headers[profiling.PROFILE_HEADER]
+    allocations = (profiles_dir / f"{name}.allocations.txt").read_text()
+    lines = allocations.splitlines()
+    assert lines[0] == "GET /?"
+    assert lines[1].startswith("Peak traced memory: ")
+    assert 0 < len(lines[3:]) <= config.PROFILING_TRACEMALLOC_TOP
+    assert "size=" in lines[3]
+
+
+def test_request_not_profiled_without_header(profiles_dir, integrations_client):
+    """Request not profiled without the header"""
+    response = integrations_client.get("/")
+
+    assert response.status_code == 200
+    assert profiling.PROFILE_HEADER not in response.headers
+    assert profile_names(profiles_dir) == []
+
+
+def test_request_not_profiled_with_wrong_token(profiles_dir, integrations_client):
+    """Request not profiled with the wrong token"""
+    response = integrations_client.get(
+        "/",
+        headers={profiling.TOKEN_HEADER: "let-me-in"},
+    )
+
+    assert response.status_code == 200
+    assert profiling.PROFILE_HEADER not in response.headers
+    assert profile_names(profiles_dir) == []
+
+
+def test_nothing_profiled_with_profiling_disabled(
+    monkeypatch, profiles_dir, integrations_client
+):
+    """Nothing profiled with profiling disabled"""
+    monkeypatch.setattr(config, "PROFILING_ENABLED", False)
+    monkeypatch.setattr(config, "PROFILING_SAMPLE_EVERY", 1)
+
+    response = integrations_client.get(
+        "/",
+        headers={profiling.TOKEN_HEADER: TOKEN},
+    )
+
+    assert profiling.PROFILE_HEADER not in response.headers
+    assert profile_names(profiles_dir) == []
+
+
+def test_1_in_n_requests_sampled(monkeypatch, profiles_dir, integrations_client):
+    """1 in N requests sampled"""
+    monkeypatch.setattr(config, "PROFILING_SAMPLE_EVERY", 4)
+    draws = iter([3, 0, 2, 1, 0])
+    monkeypatch.setattr(profiling.random, "randrange", lambda n: next(draws))
+
+    for _ in range(5):
+        response = integrations_client.get("/")
+        assert response.status_code == 200
+        # Only requested profiles are named in the response.
+        assert profiling.PROFILE_HEADER not in response.headers
+
+    names = profile_names(profiles_dir)
+    assert len(names) == 4
+    assert all("routes_stores-sampled" in n for n in names)
+
+
+def test_oldest_profiles_deleted_to_stay_within_disk_budget(
+    monkeypatch, profiles_dir, integrations_client
+):
+    """Oldest profiles deleted to stay within the disk budget"""
+    old = profiles_dir / "20000101T000000-routes_stores-sampled-00000000.pstats"
+    old.write_bytes(b"x" * 1000)
+    unrelated = profiles_dir / "notes.txt"
+    unrelated.write_bytes(b"x" * 1000)
+    response = integrations_client.get("/", headers={profiling.TOKEN_HEADER: TOKEN})
+    name = response.headers[profiling.PROFILE_HEADER]
+    profile_bytes = sum(
+        (profiles_dir / f"{name}{suffix}").stat().st_size
+        for suffix in [profiling.PSTATS_SUFFIX, profiling.ALLOCATIONS_SUFFIX]
+    )
+    monkeypatch.setattr(config, "PROFILING_DISK_BUDGET_BYTES", profile_bytes + 500)
+
+    response = integrations_client.get("/", headers={profiling.TOKEN_HEADER: TOKEN})
+
+    newest = response.headers[profiling.PROFILE_HEADER]
+    assert not old.exists()
+    assert unrelated.exists()
+    assert (profiles_dir / f"{newest}.pstats").exists()
+    assert (profiles_dir / f"{newest}.allocations.txt").exists()
+    budgeted = [p for p in profiles_dir.iterdir() if p != unrelated]
+    assert sum(p.stat().st_size for p in budgeted) <= profile_bytes + 500
+
+
+def test_request_served_as_normal_while_another_is_profiled(
+    profiles_dir, integrations_client
+):
+    """Request served as normal while another is profiled"""
+    with profiling._profiling_lock:
+        response = integrations_client.get(
+            "/",
+            headers={profiling.TOKEN_HEADER: TOKEN},
+        )
+
+    assert response.status_code == 200
+    assert profiling.PROFILE_HEADER not in response.headers
+    assert profile_names(profiles_dir) == []
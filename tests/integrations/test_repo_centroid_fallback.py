@@ -0,0 +1,137 @@
+"""The centroid index is compiled into a temporary directory. The
+postcodes that don't resolve in test_store_postcodes.json, i.e.
+AL9 5JP, get their coords from it."""
+
+# Unresolved postcodes get an approximate centroid
+# Resolved postcodes left as they are
+# Postcodes looked up once however they are written
+# Stores without coords flagged as approximate in the catalog
+# Nearby search from an unresolved postcode
+# Compile centroids command writes the file
+
+
+import pytest
+
+from src import config
+from src.adapters import gazetteer, repo
+from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog
+from tests.conftest import FakeStoreRepoFactory
+
+
+class RecordingStorePostcodeRepo(repo.AbstractStorePostcodeRepo):
+    def __init__(self, coords_map):
+        self.coords_map = coords_map
+        self.requested = []
+
+    def postcode_to_coords_map(self, postcodes):
+        self.requested.append(postcodes)
+        return {p: self.coords_map[p] for p in postcodes if p in self.coords_map}
+
+
+@pytest.fixture
+def centroid_index_file(tmp_path):
+    path = str(tmp_path / "centroids.json")
+    gazetteer.compile_centroid_index(
+        [
+            ("AL9 5AA", 51.76, -0.22),
+            ("AL9 7ZZ", 51.70, -0.20),
+            ("CM20 1FE", 51.77, 0.1),
+        ],
+        path,
+    )
+    return path
+
+
+class CentroidStoreRepoFactory(FakeStoreRepoFactory):
+    def __init__(self, centroid_index_file_path):
+        self.centroid_index_file_path = centroid_index_file_path
+
+    def create_store_postcode_repo(self):
+        return repo.NormalisingStorePostcodeRepo(
+            repo.CentroidFallbackStorePostcodeRepo(
+                super().create_store_postcode_repo(),
+                self.centroid_index_file_path,
+            )
+        )
+
+
+def test_unresolved_postcodes_get_approximate_centroid(centroid_index_file):
+    """Unresolved postcodes get an approximate centroid"""
+    postcode_repo = repo.CentroidFallbackStorePostcodeRepo(
+        RecordingStorePostcodeRepo({}),
+        centroid_index_file,
+    )
+
+    coords_map = postcode_repo.postcode_to_coords_map(["AL9 5JP", "AL9 6ZZ", "ZZ1 1ZZ"])
+
+    assert coords_map["AL9 5JP"] == {
+        "lat": pytest.approx(51.76),
+        "long": pytest.approx(-0.22),
+        "approximate": True,
+    }
+    assert coords_map["AL9 6ZZ"]["lat"] == pytest.approx(51.73, abs=0.01)
+    assert coords_map["AL9 6ZZ"]["approximate"]
+    assert "ZZ1 1ZZ" not in coords_map
+
+
+def test_resolved_postcodes_left_as_they_are(centroid_index_file):
+    """Resolved postcodes left as they are"""
+    postcode_repo = repo.CentroidFallbackStorePostcodeRepo(
+        RecordingStorePostcodeRepo({"AL9 5JP": {"lat": 51.0, "long": -0.1}}),
+        centroid_index_file,
+    )
+
+    assert postcode_repo.postcode_to_coords_map(["AL9 5JP"]) == {
+        "AL9 5JP": {"lat": 51.0, "long": -0.1}
+    }
+
+
+def test_postcodes_looked_up_once_however_they_are_written():
+    """Postcodes looked up once however they are written"""
+    wrapped = RecordingStorePostcodeRepo({"CM20 1FE": {"lat": 51.0, "long": 0.1}})
+    postcode_repo = repo.NormalisingStorePostcodeRepo(wrapped)
+
+    coords_map = postcode_repo.postcode_to_coords_map(
+        ["cm201fe", "CM20 1FE", " cm20  1fe", "ZZ99 9ZZ"]
+    )
+
+    assert wrapped.requested == [["CM20 1FE", "ZZ99 9ZZ"]]
+    assert set(coords_map) == {"cm201fe", "CM20 1FE", " cm20  1fe"}
+
+
+def test_stores_without_coords_flagged_approximate_in_catalog(centroid_index_file):
+    """Stores without coords flagged as approximate in the catalog"""
+    factory = CentroidStoreRepoFactory(centroid_index_file)
+    stores = views.stores(factory, StoreCatalog(factory))
+
+    hatfield = next(s for s in stores if s.postcode == "AL9 5JP")
+    assert hatfield.approximate
+    assert hatfield.to_dict()["approximate"] is True
+    assert not any(s.approximate for s in stores if s.postcode == "CM20 2SX")
+
+
+def test_nearby_search_from_unresolved_postcode(centroid_index_file):
+    """Nearby search from an unresolved postcode"""
+    factory = CentroidStoreRepoFactory(centroid_index_file)
+
+    stores = views.nearby_stores(factory, "al96zz", 10, StoreCatalog(factory))
+    assert any(s.postcode == "AL9 5JP" for s in stores)
+
+
+def test_compile_centroids_command_writes_file(integrations_app, tmp_path):
+    """Compile centroids command writes the file"""
+    path = str(tmp_path / "centroids.json")
+
+    result = integrations_app.test_cli_runner().invoke(
+        args=[
+            "compile-centroids",
+            config.TEST_STORE_POSTCODES_FILE,
+            "--output-file",
+            path,
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    centroid_index = gazetteer.load_centroid_index(path)
+    assert centroid_index.lookup("CM20 9ZZ") is not None
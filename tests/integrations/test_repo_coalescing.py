@@ -0,0 +1,170 @@
+"""CoalescingStorePostcodeRepo is tested with a fake geocoder that holds
+each lookup open until the test lets it go, so that lookups are in
+flight at the same time. It answers from test_store_postcodes.json."""
+
+# Concurrent lookups of the same postcodes share one call
+# Only postcodes not already in flight are looked up
+# Shared lookup errors raised to every caller
+# Postcodes looked up again once the lookup has finished
+# Lookups only shared between repos with the same name
+
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import config
+from src.adapters import repo
+from tests.conftest import FakeStorePostcodesIORepo
+
+
+class BlockingStorePostcodeRepo(repo.AbstractStorePostcodeRepo):
+    def __init__(self, error=None):
+        self.error = error
+        self.released = threading.Event()
+        self.requested = []
+        self.lock = threading.Lock()
+        self.wrapped = FakeStorePostcodesIORepo(config.TEST_STORE_POSTCODES_FILE)
+
+    def postcode_to_coords_map(self, postcodes):
+        with self.lock:
+            self.requested.append(postcodes)
+        self.released.wait(timeout=5)
+
+        if self.error is not None:
+            raise self.error
+        return self.wrapped.postcode_to_coords_map(postcodes)
+
+
+def lookup(geocoder, name, postcodes):
+    return repo.CoalescingStorePostcodeRepo(geocoder, name).postcode_to_coords_map(
+        postcodes
+    )
+
+
+def wait_for_requests(geocoder, n):
+    deadline = time.monotonic() + 2
+    while len(geocoder.requested) < n:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def in_flight_count(name):
+    return sum(
+        1 for n, _ in repo.CoalescingStorePostcodeRepo._shared_in_flight if n == name
+    )
+
+
+def test_concurrent_lookups_share_one_call():
+    """Concurrent lookups of the same postcodes share one call"""
+    geocoder = BlockingStorePostcodeRepo()
+    postcodes = ["CM20 2SX", "AL1 2RJ", "ZZ99 9ZZ"]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [
+            executor.submit(
+                lookup,
+                geocoder,
+                "share",
+                postcodes,
+            )
+            for _ in range(8)
+        ]
+        wait_for_requests(geocoder, 1)
+        # Give the other callers time to attach to the lookup in flight.
+        time.sleep(0.1)
+        geocoder.released.set()
+        results = [f.result() for f in futures]
+
+    assert geocoder.requested == [postcodes]
+    assert all(r == results[0] for r in results)
+    assert set(results[0]) == {"CM20 2SX", "AL1 2RJ"}
+
+
+def test_only_postcodes_not_in_flight_looked_up():
+    """Only postcodes not already in flight are looked up"""
+    geocoder = BlockingStorePostcodeRepo()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(
+            lookup,
+            geocoder,
+            "overlap",
+            ["CM20 2SX", "AL1 2RJ"],
+        )
+        wait_for_requests(geocoder, 1)
+        second = executor.submit(
+            lookup,
+            geocoder,
+            "overlap",
+            ["AL1 2RJ", "BN14 9GB"],
+        )
+        wait_for_requests(geocoder, 2)
+        geocoder.released.set()
+
+        assert set(first.result()) == {"CM20 2SX", "AL1 2RJ"}
+        assert set(second.result()) == {"AL1 2RJ", "BN14 9GB"}
+
+    assert geocoder.requested == [["CM20 2SX", "AL1 2RJ"], ["BN14 9GB"]]
+
+
+def test_shared_lookup_errors_raised_to_every_caller():
+    """Shared lookup errors raised to every caller"""
+    geocoder = BlockingStorePostcodeRepo(error=ConnectionError())
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(
+                lookup,
+                geocoder,
+                "error",
+                ["CM20 2SX"],
+            )
+            for _ in range(4)
+        ]
+        wait_for_requests(geocoder, 1)
+        time.sleep(0.1)
+        geocoder.released.set()
+
+        for f in futures:
+            with pytest.raises(ConnectionError):
+                f.result()
+
+    assert len(geocoder.requested) == 1
+    assert in_flight_count("error") == 0
+
+
+def test_postcodes_looked_up_again_once_lookup_finished():
+    """Postcodes looked up again once the lookup has finished"""
+    geocoder = BlockingStorePostcodeRepo()
+    geocoder.released.set()
+    postcode_repo = repo.CoalescingStorePostcodeRepo(geocoder, "again")
+
+    postcode_repo.postcode_to_coords_map(["CM20 2SX"])
+    postcode_repo.postcode_to_coords_map(["CM20 2SX"])
+
+    assert geocoder.requested == [["CM20 2SX"], ["CM20 2SX"]]
+    assert in_flight_count("again") == 0
+
+
+def test_lookups_only_shared_between_repos_with_same_name():
+    """Lookups only shared between repos with the same name"""
+    geocoder = BlockingStorePostcodeRepo()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(
+                lookup,
+                geocoder,
+                name,
+                ["CM20 2SX"],
+            )
+            for name in ["name-a", "name-b"]
+        ]
+        wait_for_requests(geocoder, 2)
+        geocoder.released.set()
+        _ = [f.result() for f in futures]
+
+    assert geocoder.requested == [["CM20 2SX"], ["CM20 2SX"]]
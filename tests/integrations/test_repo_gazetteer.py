@@ -0,0 +1,144 @@
+"""The gazetteer is compiled into a temporary directory from
+test_store_postcodes.json, so its lookups can be compared with the
+FakePostcodesIORepo's."""
+
+# Gazetteer lookups match Postcodes.io
+# Lookups ignore case and spacing
+# Unknown postcodes left out
+# ONS extract compiled without postcodes lacking coords
+# Gazetteer reopened when the file is replaced
+# Error on a file that is not a gazetteer
+# Misses fall back to the next repo
+# Compile gazetteer command writes the file
+
+
+import pytest
+
+from src import config
+from src.adapters import gazetteer, repo
+from tests.conftest import FakeStoreRepoFactory
+
+
+def store_postcodes():
+    return [s["postcode"] for s in repo.StoreFileRepo(config.STORES_FILE).list()]
+
+
+@pytest.fixture
+def gazetteer_file(tmp_path):
+    path = str(tmp_path / "gazetteer.bin")
+    gazetteer.compile_gazetteer(
+        gazetteer.iter_entries(config.TEST_STORE_POSTCODES_FILE),
+        path,
+    )
+    return path
+
+
+def test_gazetteer_lookups_match_postcodesio(gazetteer_file):
+    """Gazetteer lookups match Postcodes.io"""
+    postcodes = store_postcodes()
+    expected = (
+        FakeStoreRepoFactory()
+        .create_store_postcode_repo()
+        .postcode_to_coords_map(postcodes)
+    )
+
+    coords_map = repo.GazetteerStorePostcodeRepo(gazetteer_file).postcode_to_coords_map(
+        postcodes
+    )
+
+    assert coords_map == {p: c for p, c in expected.items() if p in postcodes}
+
+
+def test_lookups_ignore_case_and_spacing(gazetteer_file):
+    """Lookups ignore case and spacing"""
+    g = gazetteer.Gazetteer(gazetteer_file)
+    assert g.lookup("cm201fe") == g.lookup(" CM20  1FE ") == g.lookup("CM20 1FE")
+    assert g.lookup("CM20 1FE") is not None
+
+
+def test_unknown_postcodes_left_out(gazetteer_file):
+    """Unknown postcodes left out"""
+    coords_map = repo.GazetteerStorePostcodeRepo(gazetteer_file).postcode_to_coords_map(
+        ["ZZ99 9ZZ", "AL9 5JP", "", "NOT A POSTCODE"]
+    )
+    assert coords_map == {}
+
+
+def test_ons_extract_compiled_without_postcodes_lacking_coords(tmp_path):
+    """ONS extract compiled without postcodes lacking coords"""
+    source = tmp_path / "ONSPD.csv"
+    source.write_text(
+        "pcd,pcds,lat,long\n"
+        "CM201FE,CM20 1FE,51.776402,0.114084\n"
+        "GY1 1AA,GY1 1AA,99.999999,0.000000\n"
+        "AL1 2RJ,AL1 2RJ,51.741753,-0.341337\n",
+        encoding="utf-8",
+    )
+    path = str(tmp_path / "gazetteer.bin")
+
+    assert gazetteer.compile_gazetteer(gazetteer.iter_entries(str(source)), path) == 2
+
+    g = gazetteer.Gazetteer(path)
+    assert len(g) == 2
+    assert g.lookup("AL1 2RJ") == (51.741753, -0.341337)
+    assert g.lookup("GY1 1AA") is None
+
+
+def test_gazetteer_reopened_when_file_replaced(tmp_path):
+    """Gazetteer reopened when the file is replaced"""
+    path = str(tmp_path / "gazetteer.bin")
+    postcode_repo = repo.GazetteerStorePostcodeRepo(path)
+
+    gazetteer.compile_gazetteer([("CM20 1FE", 51.0, 0.1)], path)
+    assert postcode_repo.postcode_to_coords_map(["CM20 1FE"]) == {
+        "CM20 1FE": {"lat": 51.0, "long": 0.1}
+    }
+
+    gazetteer.compile_gazetteer([("CM20 1FE", 52.0, 0.2)], path)
+    assert postcode_repo.postcode_to_coords_map(["CM20 1FE"]) == {
+        "CM20 1FE": {"lat": 52.0, "long": 0.2}
+    }
+
+
+def test_error_on_file_that_is_not_a_gazetteer(tmp_path):
+    """Error on a file that is not a gazetteer"""
+    for content in [b"", b"STGAZ001", b"NOTAGAZ!" + bytes(8)]:
+        path = tmp_path / "gazetteer.bin"
+        path.write_bytes(content)
+        with pytest.raises(ValueError):
+            gazetteer.Gazetteer(str(path))
+
+
+def test_misses_fall_back_to_next_repo(tmp_path):
+    """Misses fall back to the next repo"""
+    path = str(tmp_path / "gazetteer.bin")
+    gazetteer.compile_gazetteer([("CM20 1FE", 51.0, 0.1)], path)
+
+    postcode_repo = repo.FallbackStorePostcodeRepo(
+        [
+            repo.GazetteerStorePostcodeRepo(path),
+            FakeStoreRepoFactory().create_store_postcode_repo(),
+        ]
+    )
+    coords_map = postcode_repo.postcode_to_coords_map(["CM20 1FE", "AL1 2RJ"])
+
+    assert coords_map["CM20 1FE"] == {"lat": 51.0, "long": 0.1}
+    assert coords_map["AL1 2RJ"] == {"lat": 51.741753, "long": -0.341337}
+
+
+def test_compile_gazetteer_command_writes_file(integrations_app, tmp_path):
+    """Compile gazetteer command writes the file"""
+    path = str(tmp_path / "gazetteer.bin")
+
+    result = integrations_app.test_cli_runner().invoke(
+        args=[
+            "compile-gazetteer",
+            config.TEST_STORE_POSTCODES_FILE,
+            "--output-file",
+            path,
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Compiled 94 postcodes" in result.output
+    assert len(gazetteer.Gazetteer(path)) == 94
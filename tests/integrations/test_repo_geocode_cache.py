@@ -0,0 +1,129 @@
+"""The caching repo is tested against a fake wrapped repo that
+counts the postcodes it was asked for, so we can assert that
+only cache misses reach it. The cache file is created in a
+temporary folder for each test."""
+
+# Only misses are sent to the wrapped repo
+# Entries expire after their TTL
+# Unresolved postcodes are negatively cached
+# Cache size is bounded with least recently used eviction
+# Schema created once per cache file rather than per connection
+
+
+import sqlite3
+
+from src.adapters import repo
+from tests.conftest import FakeClock
+
+COORDS = {
+    "CM20 2SX": {"lat": 51.785161, "long": 0.121998},
+    "CM20 1FE": {"lat": 51.77624, "long": 0.095126},
+    "EN9 3YW": {"lat": 51.677378, "long": 0.001689},
+}
+
+
+class CountingStorePostcodeRepo(repo.AbstractStorePostcodeRepo):
+    def __init__(self):
+        self.requested = []
+
+    def postcode_to_coords_map(self, postcodes):
+        self.requested.append(list(postcodes))
+        return {p: COORDS[p] for p in postcodes if p in COORDS}
+
+
+def create_caching_repo(tmp_path, wrapped, clock, max_entries=100):
+    return repo.SqliteCachingStorePostcodeRepo(
+        wrapped,
+        str(tmp_path / "geocode_cache.sqlite3"),
+        ttl_seconds=60,
+        negative_ttl_seconds=10,
+        max_entries=max_entries,
+        clock=clock,
+    )
+
+
+def test_only_misses_sent_to_wrapped_repo(tmp_path):
+    """Only misses are sent to the wrapped repo"""
+    wrapped, clock = CountingStorePostcodeRepo(), FakeClock()
+    caching_repo = create_caching_repo(tmp_path, wrapped, clock)
+
+    res = caching_repo.postcode_to_coords_map(["CM20 2SX"])
+    assert res == {"CM20 2SX": COORDS["CM20 2SX"]}
+
+    # A new instance shares the same file, as repos are created per request.
+    caching_repo = create_caching_repo(tmp_path, wrapped, clock)
+    res = caching_repo.postcode_to_coords_map(["CM20 2SX", "CM20 1FE"])
+
+    assert res == {"CM20 2SX": COORDS["CM20 2SX"], "CM20 1FE": COORDS["CM20 1FE"]}
+    assert wrapped.requested == [["CM20 2SX"], ["CM20 1FE"]]
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    """Entries expire after their TTL"""
+    wrapped, clock = CountingStorePostcodeRepo(), FakeClock()
+    caching_repo = create_caching_repo(tmp_path, wrapped, clock)
+
+    caching_repo.postcode_to_coords_map(["CM20 2SX"])
+    clock.now += 59
+    caching_repo.postcode_to_coords_map(["CM20 2SX"])
+    assert len(wrapped.requested) == 1
+
+    clock.now += 2
+    caching_repo.postcode_to_coords_map(["CM20 2SX"])
+    assert len(wrapped.requested) == 2
+
+
+def test_unresolved_postcodes_negatively_cached(tmp_path):
+    """Unresolved postcodes are negatively cached"""
+    wrapped, clock = CountingStorePostcodeRepo(), FakeClock()
+    caching_repo = create_caching_repo(tmp_path, wrapped, clock)
+
+    assert caching_repo.postcode_to_coords_map(["XX1 1XX"]) == {}
+    assert caching_repo.postcode_to_coords_map(["XX1 1XX"]) == {}
+    assert wrapped.requested == [["XX1 1XX"]]
+
+    # Negative entries expire sooner than resolved ones.
+    clock.now += 11
+    caching_repo.postcode_to_coords_map(["XX1 1XX"])
+    assert wrapped.requested == [["XX1 1XX"], ["XX1 1XX"]]
+
+
+def test_cache_size_bounded_with_lru_eviction(tmp_path):
+    """Cache size is bounded with least recently used eviction"""
+    wrapped, clock = CountingStorePostcodeRepo(), FakeClock()
+    caching_repo = create_caching_repo(tmp_path, wrapped, clock, max_entries=2)
+
+    caching_repo.postcode_to_coords_map(["CM20 2SX"])
+    clock.now += 1
+    caching_repo.postcode_to_coords_map(["CM20 1FE"])
+    clock.now += 1
+
+    # Touch CM20 2SX so CM20 1FE becomes the least recently used.
+    caching_repo.postcode_to_coords_map(["CM20 2SX"])
+    clock.now += 1
+    caching_repo.postcode_to_coords_map(["EN9 3YW"])
+
+    wrapped.requested.clear()
+    caching_repo.postcode_to_coords_map(["CM20 2SX", "EN9 3YW", "CM20 1FE"])
+    assert wrapped.requested == [["CM20 1FE"]]
+
+
+def test_schema_created_once_per_cache_file(monkeypatch, tmp_path):
+    """Schema created once per cache file rather than per connection"""
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(repo.sqlite3, "connect", traced_connect)
+    wrapped, clock = CountingStorePostcodeRepo(), FakeClock()
+
+    create_caching_repo(tmp_path, wrapped, clock).postcode_to_coords_map(["EN9 3YW"])
+    create_caching_repo(tmp_path, wrapped, clock).postcode_to_coords_map(["CM20 1FE"])
+
+    ddl = [s for s in statements if s.startswith("CREATE")]
+    assert len(ddl) == 2
+    assert wrapped.requested == [["EN9 3YW"], ["CM20 1FE"]]
@@ -0,0 +1,161 @@
+"""PostcodesIORepo is tested with a fake session standing in for
+requests.Session, so no real calls are made to Postcodes.io. The
+fake answers each bulk request from test_store_postcodes.json."""
+
+# Postcodes split into chunks within the bulk limit
+# Results from all chunks merged
+# Duplicate postcodes only requested once
+# Error on chunk size over the bulk limit
+# Chunks of concurrent lookups share one bounded pool
+
+
+import json
+import threading
+import time
+
+import pytest
+
+from src import config
+from src.adapters import repo
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self):
+        with open(config.TEST_STORE_POSTCODES_FILE, encoding="utf-8") as f:
+            self.entries = {e["query"]: e for e in json.load(f)["result"]}
+        self.lock = threading.Lock()
+        self.requested = []
+
+    def post(self, url, data, timeout):
+        _ = url, timeout
+        with self.lock:
+            self.requested.append(data["postcodes"])
+        return FakeResponse(
+            {
+                "status": 200,
+                "result": [
+                    self.entries.get(p, {"query": p, "result": None})
+                    for p in data["postcodes"]
+                ],
+            }
+        )
+
+
+class SlowFakeSession(FakeSession):
+    """Records the most requests it had in flight at once."""
+
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def post(self, url, data, timeout):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        try:
+            return super().post(url, data, timeout)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def all_test_postcodes(session):
+    return list(session.entries)
+
+
+def test_postcodes_split_into_chunks_within_limit():
+    """Postcodes split into chunks within the bulk limit"""
+    session = FakeSession()
+    postcodes_repo = repo.PostcodesIORepo(
+        config.POSTCODESIO_BULK_POSTCODES_URL,
+        chunk_size=10,
+        max_workers=3,
+        session=session,
+    )
+    postcodes = all_test_postcodes(session)
+
+    postcodes_repo.postcode_to_coords_map(postcodes)
+
+    assert all(len(r) <= 10 for r in session.requested)
+    assert sorted(p for r in session.requested for p in r) == sorted(postcodes)
+
+
+def test_results_from_all_chunks_merged():
+    """Results from all chunks merged"""
+    session = FakeSession()
+    postcodes = all_test_postcodes(session)
+
+    chunked = repo.PostcodesIORepo(
+        config.POSTCODESIO_BULK_POSTCODES_URL,
+        chunk_size=7,
+        session=session,
+    ).postcode_to_coords_map(postcodes)
+    unchunked = repo.PostcodesIORepo(
+        config.POSTCODESIO_BULK_POSTCODES_URL,
+        session=session,
+    ).postcode_to_coords_map(postcodes)
+
+    assert chunked == unchunked
+    assert chunked["CM20 1FE"] == {"lat": 51.77624, "long": 0.095126}
+
+
+def test_duplicate_postcodes_only_requested_once():
+    """Duplicate postcodes only requested once"""
+    session = FakeSession()
+    postcodes_repo = repo.PostcodesIORepo(
+        config.POSTCODESIO_BULK_POSTCODES_URL,
+        session=session,
+    )
+
+    postcodes_repo.postcode_to_coords_map(["CM20 1FE", "EN9 3YW", "CM20 1FE"])
+
+    assert session.requested == [["CM20 1FE", "EN9 3YW"]]
+
+
+def test_error_on_chunk_size_over_bulk_limit():
+    """Error on chunk size over the bulk limit"""
+    with pytest.raises(ValueError):
+        repo.PostcodesIORepo(
+            config.POSTCODESIO_BULK_POSTCODES_URL,
+            chunk_size=101,
+            session=FakeSession(),
+        )
+
+
+def test_chunks_of_concurrent_lookups_share_one_bounded_pool(monkeypatch):
+    """Chunks of concurrent lookups share one bounded pool"""
+    monkeypatch.setattr(repo.PostcodesIORepo, "_shared_executor", None)
+    session = SlowFakeSession()
+    postcodes = all_test_postcodes(session)
+
+    def lookup():
+        repo.PostcodesIORepo(
+            config.POSTCODESIO_BULK_POSTCODES_URL,
+            chunk_size=5,
+            max_workers=2,
+            session=session,
+        ).postcode_to_coords_map(postcodes)
+
+    lookups = [threading.Thread(target=lookup) for _ in range(4)]
+    for t in lookups:
+        t.start()
+    for t in lookups:
+        t.join()
+
+    executor = repo.PostcodesIORepo._shared_executor
+    executor.shutdown()
+    assert len(session.requested) == 4 * len(range(0, len(postcodes), 5))
+    assert session.max_in_flight == 2
@@ -0,0 +1,220 @@
+"""ResilientStorePostcodeRepo is tested against a fake geocoder that
+answers from test_store_postcodes.json, after whatever latency and with
+whatever errors are queued up for each call. The clocks are faked where
+the tests are about staleness or the circuit resetting, and real where
+they're about latency."""
+
+# Last known coords served without calling the geocoder
+# Stale coords served straight away and refreshed in the background
+# Circuit opens after repeated failures and fails fast
+# Slow calls count as failures
+# Circuit closes again after a successful trial call
+# Slow attempt hedged with a second attempt
+# Failed attempt retried
+# Lookup gives up after the timeout
+# Service unavailable while the geocoder is failing
+
+
+import threading
+import time
+
+import pytest
+
+from src import config, constants
+from src.adapters import repo, resilience
+from src.adapters.resilience import CircuitBreaker, GeocoderGuard, LastKnownCoords
+from src.exceptions import GeocoderUnavailableError
+from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog
+from tests.conftest import FakeClock, FakeStorePostcodesIORepo, FakeStoreRepoFactory
+
+
+class FaultyStorePostcodeRepo(repo.AbstractStorePostcodeRepo):
+    def __init__(self, faults=()):
+        """faults are the (latency in seconds, error to raise) of each call
+        in turn. Calls after those answer straight away."""
+        self.faults = list(faults)
+        self.requested = []
+        self.lock = threading.Lock()
+        self.wrapped = FakeStorePostcodesIORepo(config.TEST_STORE_POSTCODES_FILE)
+
+    def postcode_to_coords_map(self, postcodes):
+        with self.lock:
+            call = len(self.requested)
+            self.requested.append(postcodes)
+
+        latency, error = self.faults[call] if call < len(self.faults) else (0, None)
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return self.wrapped.postcode_to_coords_map(postcodes)
+
+
+def create_guard(clock=time.monotonic, **kwargs):
+    settings = {
+        "hedge_after_seconds": 0.05,
+        "max_attempts": 2,
+        "timeout_seconds": 1,
+        "max_hedged_postcodes": 100,
+        "max_workers": 4,
+    }
+    return GeocoderGuard(
+        LastKnownCoords(60, 100, clock=clock),
+        CircuitBreaker(3, 30, slow_call_seconds=0.5, clock=clock),
+        **(settings | kwargs),
+    )
+
+
+def wait_until(condition, timeout_seconds=2):
+    deadline = time.monotonic() + timeout_seconds
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_last_known_coords_served_without_calling_geocoder():
+    """Last known coords served without calling the geocoder"""
+    geocoder = FaultyStorePostcodeRepo()
+    postcode_repo = repo.ResilientStorePostcodeRepo(geocoder, create_guard())
+
+    first = postcode_repo.postcode_to_coords_map(["CM20 2SX", "ZZ99 9ZZ"])
+    second = postcode_repo.postcode_to_coords_map(["CM20 2SX", "ZZ99 9ZZ"])
+
+    assert first == second and list(first) == ["CM20 2SX"]
+    assert geocoder.requested == [["CM20 2SX", "ZZ99 9ZZ"]]
+
+
+def test_stale_coords_served_and_refreshed_in_background():
+    """Stale coords served straight away and refreshed in the background"""
+    clock = FakeClock(now=0.0)
+    geocoder = FaultyStorePostcodeRepo([(0, None), (0.5, None)])
+    guard = create_guard(clock, hedge_after_seconds=10)
+    postcode_repo = repo.ResilientStorePostcodeRepo(geocoder, guard)
+    expected = postcode_repo.postcode_to_coords_map(["CM20 2SX"])
+
+    clock.now = 61
+    started_at = time.monotonic()
+    assert postcode_repo.postcode_to_coords_map(["CM20 2SX"]) == expected
+    assert time.monotonic() - started_at < 0.25
+
+    wait_until(lambda: "CM20 2SX" in guard.last_known.lookup(["CM20 2SX"])[0])
+    assert geocoder.requested == [["CM20 2SX"], ["CM20 2SX"]]
+
+
+def test_circuit_opens_after_repeated_failures_and_fails_fast():
+    """Circuit opens after repeated failures and fails fast"""
+    geocoder = FaultyStorePostcodeRepo([(0, ConnectionError())] * 6)
+    guard = create_guard(max_attempts=1)
+    postcode_repo = repo.ResilientStorePostcodeRepo(geocoder, guard)
+
+    for _ in range(3):
+        with pytest.raises(GeocoderUnavailableError):
+            postcode_repo.postcode_to_coords_map(["CM20 2SX"])
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(resilience.CircuitOpenError):
+        postcode_repo.postcode_to_coords_map(["CM20 2SX"])
+    assert len(geocoder.requested) == 3
+
+
+def test_slow_calls_count_as_failures():
+    """Slow calls count as failures"""
+    clock = FakeClock(now=0.0)
+    breaker = CircuitBreaker(2, 30, slow_call_seconds=1, clock=clock)
+
+    def slow_call():
+        clock.now += 2
+        return "result"
+
+    assert breaker.call(slow_call) == "result"
+    assert breaker.call(slow_call) == "result"
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Large lookups are expected to take a while.
+    breaker = CircuitBreaker(2, 30, slow_call_seconds=1, clock=clock)
+    breaker.call(slow_call, check_slow=False)
+    breaker.call(slow_call, check_slow=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_closes_after_successful_trial_call():
+    """Circuit closes again after a successful trial call"""
+    clock = FakeClock(now=0.0)
+    breaker = CircuitBreaker(1, 30, clock=clock)
+    with pytest.raises(ConnectionError):
+        breaker.call(lambda: (_ for _ in ()).throw(ConnectionError()))
+
+    clock.now = 31
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    # Only one trial call at a time.
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_attempt_hedged_with_second_attempt():
+    """Slow attempt hedged with a second attempt"""
+    geocoder = FaultyStorePostcodeRepo([(1, None), (0, None)])
+    postcode_repo = repo.ResilientStorePostcodeRepo(geocoder, create_guard())
+
+    started_at = time.monotonic()
+    coords_map = postcode_repo.postcode_to_coords_map(["CM20 2SX"])
+
+    assert time.monotonic() - started_at < 0.5
+    assert "CM20 2SX" in coords_map
+    assert len(geocoder.requested) == 2
+
+
+def test_failed_attempt_retried():
+    """Failed attempt retried"""
+    geocoder = FaultyStorePostcodeRepo([(0, ConnectionError())])
+    guard = create_guard(hedge_after_seconds=10)
+    postcode_repo = repo.ResilientStorePostcodeRepo(geocoder, guard)
+
+    assert "CM20 2SX" in postcode_repo.postcode_to_coords_map(["CM20 2SX"])
+    assert len(geocoder.requested) == 2
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_lookup_gives_up_after_timeout():
+    """Lookup gives up after the timeout"""
+    geocoder = FaultyStorePostcodeRepo([(1, None), (1, None)])
+    postcode_repo = repo.ResilientStorePostcodeRepo(
+        geocoder,
+        create_guard(timeout_seconds=0.2),
+    )
+
+    started_at = time.monotonic()
+    with pytest.raises(GeocoderUnavailableError):
+        postcode_repo.postcode_to_coords_map(["CM20 2SX"])
+    assert time.monotonic() - started_at < 0.5
+
+
+def test_service_unavailable_while_geocoder_failing(integrations_app):
+    """Service unavailable while the geocoder is failing"""
+    guard = create_guard(max_attempts=1)
+    for _ in range(3):
+        guard.breaker.record_failure()
+
+    class FailingStoreRepoFactory(FakeStoreRepoFactory):
+        def create_store_postcode_repo(self):
+            return repo.ResilientStorePostcodeRepo(FaultyStorePostcodeRepo(), guard)
+
+    integrations_app.config[constants.STORE_REPO_FACTORY] = FailingStoreRepoFactory
+    integrations_client = integrations_app.test_client()
+
+    # EN9 3YW isn't a store postcode, so it has to be geocoded.
+    response = integrations_client.get("/api/stores/nearby/?postcode=EN9 3YW")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    assert "error" in response.json
+
+    with pytest.raises(GeocoderUnavailableError):
+        views.nearby_stores(
+            FailingStoreRepoFactory(),
+            "EN9 3YW",
+            30,
+            StoreCatalog(FakeStoreRepoFactory()),
+        )
@@ -0,0 +1,208 @@
+"""SqliteStoreRepo is tested against a database in a temporary
+directory, imported from stores.json with the FakePostcodesIORepo
+providing the coords."""
+
+# Imported stores read back with their coords
+# Nearby stores from the R*Tree match the catalog
+# R*Tree ids are the stores' positions in the catalog
+# Nearby stores found across the antimeridian
+# Catalog searched instead once the database has moved on
+# Catalog built from the database without geocoding
+# Version changes on every import
+# Version read without creating the schema
+# Import stores command fills the database
+
+
+import pytest
+
+from src import config
+from src.adapters import repo
+from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog
+from tests.conftest import FakeStoreRepoFactory, metric_sample
+
+
+class DatabaseStoreRepoFactory(FakeStoreRepoFactory):
+    def __init__(self, db_file_path):
+        self.db_file_path = db_file_path
+        self.geocoded = []
+
+    def create_store_repo(self):
+        return repo.SqliteStoreRepo(self.db_file_path)
+
+    def create_store_postcode_repo(self):
+        geocoded = self.geocoded
+        wrapped = super().create_store_postcode_repo()
+
+        class Recording(repo.AbstractStorePostcodeRepo):
+            def postcode_to_coords_map(self, postcodes):
+                geocoded.extend(postcodes)
+                return wrapped.postcode_to_coords_map(postcodes)
+
+        return Recording()
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / "stores.sqlite3")
+    repo.SqliteStoreRepo(path, batch_size=10).import_stores(
+        repo.StoreFileRepo(config.STORES_FILE).iter_stores(),
+        FakeStoreRepoFactory().create_store_postcode_repo(),
+    )
+    return path
+
+
+def test_imported_stores_read_back_with_their_coords(db_file):
+    """Imported stores read back with their coords"""
+    stores = repo.SqliteStoreRepo(db_file).list()
+    file_stores = repo.StoreFileRepo(config.STORES_FILE).list()
+    coords_map = (
+        FakeStoreRepoFactory()
+        .create_store_postcode_repo()
+        .postcode_to_coords_map([s["postcode"] for s in file_stores])
+    )
+
+    assert [(s["name"], s["postcode"]) for s in stores] == [
+        (s["name"], s["postcode"]) for s in file_stores
+    ]
+    for s in stores:
+        if coords := coords_map.get(s["postcode"]):
+            assert (s["lat"], s["long"]) == (coords["lat"], coords["long"])
+        else:
+            assert "lat" not in s and "long" not in s
+
+
+def test_nearby_stores_from_rtree_match_catalog(db_file):
+    """Nearby stores from the R*Tree match the catalog"""
+    factory = DatabaseStoreRepoFactory(db_file)
+    catalog = StoreCatalog(factory)
+    file_catalog = StoreCatalog(FakeStoreRepoFactory())
+    found = 0
+
+    for postcode, radius_km in [("CM20 1FE", 30), ("EN9 3YW", 5), ("AL1 2RJ", 0)]:
+        file_nearby = views.nearby_stores(
+            FakeStoreRepoFactory(), postcode, radius_km, file_catalog
+        )
+        prefiltered = metric_sample("stores_prefilter_stores_total", result="kept")
+
+        nearby = views.nearby_stores(factory, postcode, radius_km, catalog)
+
+        assert [s.name for s in nearby] == [s.name for s in file_nearby]
+        found += len(nearby)
+        # The catalog is too small for a spatial index, so without the
+        # R*Tree it would have been prefiltered.
+        assert (
+            metric_sample("stores_prefilter_stores_total", result="kept") == prefiltered
+        )
+    assert found > 0
+
+
+def test_rtree_ids_are_stores_positions_in_catalog(tmp_path):
+    """R*Tree ids are the stores' positions in the catalog"""
+    path = str(tmp_path / "stores.sqlite3")
+    repo.SqliteStoreRepo(path).import_stores(
+        [
+            {"name": "Crewe", "postcode": "C1", "lat": 53.1, "long": -2.4},
+            {"name": "Alton", "postcode": "A2", "lat": 51.1, "long": -0.9},
+            {"name": "Alton", "postcode": "A1", "lat": 51.2, "long": -1.0},
+            {"name": "Bath", "postcode": "B1"},
+            {"name": "Ålesund", "postcode": "N1", "lat": 62.5, "long": 6.2},
+        ]
+    )
+    snapshot = StoreCatalog(DatabaseStoreRepoFactory(path)).snapshot()
+
+    positions = repo.SqliteStoreRepo(path).candidates_within_radius(
+        55, 0, 20000, snapshot.source_version
+    )
+
+    table = snapshot.table
+    assert sorted(table.postcodes[p] for p in positions) == ["A1", "A2", "C1", "N1"]
+    assert list(table.postcodes) == ["A2", "A1", "B1", "C1", "N1"]
+
+
+def test_nearby_stores_found_across_antimeridian(tmp_path):
+    """Nearby stores found across the antimeridian"""
+    store_repo = repo.SqliteStoreRepo(str(tmp_path / "stores.sqlite3"))
+    store_repo.import_stores(
+        [
+            {"name": "East", "postcode": "E", "lat": 1.0, "long": 179.9},
+            {"name": "West", "postcode": "W", "lat": 1.0, "long": -179.9},
+            {"name": "Far", "postcode": "F", "lat": 1.0, "long": 170.0},
+        ]
+    )
+    snapshot = StoreCatalog(
+        DatabaseStoreRepoFactory(store_repo.db_file_path)
+    ).snapshot()
+
+    positions = store_repo.candidates_within_radius(
+        1.0, 179.95, 50, snapshot.source_version
+    )
+
+    assert sorted(snapshot.table.names[p] for p in positions) == ["East", "West"]
+
+
+def test_catalog_searched_instead_once_database_has_moved_on(db_file):
+    """Catalog searched instead once the database has moved on"""
+    store_repo = repo.SqliteStoreRepo(db_file)
+    assert store_repo.candidates_within_radius(51.7, 0.1, 30, 1) is not None
+
+    store_repo.import_stores([{"name": "Harlow", "postcode": "CM20 2SX"}])
+
+    assert store_repo.candidates_within_radius(51.7, 0.1, 30, 1) is None
+    assert store_repo.candidates_within_radius(51.7, 0.1, 30, 2) == []
+    assert (
+        repo.StoreFileRepo(config.STORES_FILE).candidates_within_radius(
+            51.7, 0.1, 30, None
+        )
+        is None
+    )
+
+
+def test_catalog_built_from_database_without_geocoding(db_file):
+    """Catalog built from the database without geocoding"""
+    factory = DatabaseStoreRepoFactory(db_file)
+    snapshot = StoreCatalog(factory).snapshot()
+
+    file_snapshot = StoreCatalog(FakeStoreRepoFactory()).snapshot()
+    assert snapshot.version == file_snapshot.version
+
+    # Stores that couldn't be geocoded are retried, but no others.
+    missing = {s.postcode for s in snapshot.table.view() if s.lat is None}
+    assert set(factory.geocoded) == missing
+    assert len(missing) < len(snapshot.table)
+
+
+def test_version_changes_on_every_import(tmp_path):
+    """Version changes on every import"""
+    store_repo = repo.SqliteStoreRepo(str(tmp_path / "stores.sqlite3"))
+    before = store_repo.version()
+
+    store_repo.import_stores([{"name": "Harlow", "postcode": "CM20 2SX"}])
+    first = store_repo.version()
+    store_repo.import_stores([{"name": "Harlow", "postcode": "CM20 2SX"}])
+
+    assert len({before, first, store_repo.version()}) == 3
+    assert store_repo.list() == [{"name": "Harlow", "postcode": "CM20 2SX"}]
+
+
+def test_version_read_without_creating_schema(db_file, tmp_path):
+    """Version read without creating the schema"""
+    missing = tmp_path / "missing.sqlite3"
+
+    assert repo.SqliteStoreRepo(str(missing)).version() == 0
+    assert not missing.exists()
+    store_repo = repo.SqliteStoreRepo(db_file)
+    assert store_repo.version() == store_repo.version() == 1
+
+
+def test_import_stores_command_fills_database(integrations_app, tmp_path):
+    """Import stores command fills the database"""
+    path = str(tmp_path / "stores.sqlite3")
+
+    result = integrations_app.test_cli_runner().invoke(
+        args=["import-stores", "--db-file", path],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Imported 95 stores" in result.output
+    assert len(repo.SqliteStoreRepo(path).list()) == 95
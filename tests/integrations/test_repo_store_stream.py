@@ -0,0 +1,140 @@
+"""StoreFileRepo is tested against stores.json and copies of it written
+to a temporary directory in the other supported formats."""
+
+# Streamed stores match the whole file parsed at once
+# NDJSON stores file read one store per line
+# Memory mapped stores file read the same
+# Multibyte characters split across chunks decoded
+# Error on a malformed stores file
+# Numbers and other scalars split across chunks decoded
+# Error on anything but whitespace after the array
+# Catalog geocoded one batch at a time
+# Batch size read from config when the catalog is built
+
+
+import json
+
+import pytest
+
+from src import config
+from src.adapters import repo
+from src.adapters.store_stream import iter_json_array
+from src.srv_layer.catalog import build_snapshot
+from tests.conftest import FakeStoreRepoFactory
+
+
+def all_stores():
+    with open(config.STORES_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class BatchRecordingStoreRepoFactory(FakeStoreRepoFactory):
+    def __init__(self):
+        self.batches = []
+
+    def create_store_postcode_repo(self):
+        batches = self.batches
+        wrapped = super().create_store_postcode_repo()
+
+        class Recording(repo.AbstractStorePostcodeRepo):
+            def postcode_to_coords_map(self, postcodes):
+                batches.append(postcodes)
+                return wrapped.postcode_to_coords_map(postcodes)
+
+        return Recording()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_streamed_stores_match_whole_file_parsed_at_once(chunk_size):
+    """Streamed stores match the whole file parsed at once"""
+    store_repo = repo.StoreFileRepo(config.STORES_FILE, chunk_size=chunk_size)
+    assert list(store_repo.iter_stores()) == all_stores()
+
+
+def test_ndjson_stores_file_read_one_store_per_line(tmp_path):
+    """NDJSON stores file read one store per line"""
+    path = tmp_path / "stores.ndjson"
+    path.write_text(
+        "\n".join(json.dumps(s) for s in all_stores()) + "\n\n",
+        encoding="utf-8",
+    )
+
+    store_repo = repo.StoreFileRepo(str(path), chunk_size=10)
+    assert store_repo.list() == all_stores()
+
+
+@pytest.mark.parametrize("file_name", ["stores.json", "stores.jsonl"])
+def test_memory_mapped_stores_file_read_the_same(tmp_path, file_name):
+    """Memory mapped stores file read the same"""
+    path = tmp_path / file_name
+    if file_name.endswith(".jsonl"):
+        path.write_text("\n".join(json.dumps(s) for s in all_stores()))
+    else:
+        path.write_text(json.dumps(all_stores()))
+
+    store_repo = repo.StoreFileRepo(str(path), use_mmap=True, chunk_size=5)
+    assert list(store_repo.iter_stores()) == all_stores()
+
+
+def test_multibyte_characters_split_across_chunks_decoded(tmp_path):
+    """Multibyte characters split across chunks decoded"""
+    stores = [{"name": "Llandudno Cyffordd – Ŵ", "postcode": "LL31 9XY"}]
+    path = tmp_path / "stores.json"
+    path.write_text(json.dumps(stores, ensure_ascii=False), encoding="utf-8")
+
+    for chunk_size in range(1, 8):
+        store_repo = repo.StoreFileRepo(str(path), use_mmap=True, chunk_size=chunk_size)
+        assert store_repo.list() == stores
+        store_repo = repo.StoreFileRepo(str(path), chunk_size=chunk_size)
+        assert store_repo.list() == stores
+
+
+def test_error_on_malformed_stores_file():
+    """Error on a malformed stores file"""
+    for text in ['{"name": "Harlow"}', '[{"name": "Harlow"}', "[1 2]", "[1,]"]:
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_json_array(iter(text)))
+
+    assert list(iter_json_array(iter("[12, 345 ]"))) == [12, 345]
+    assert list(iter_json_array(iter(" [ ] "))) == []
+
+
+def test_numbers_and_other_scalars_split_across_chunks_decoded():
+    """Numbers and other scalars split across chunks decoded"""
+    values = [1.5, 1e5, -0.25e-3, 12345, 0, True, False, None, "x", [2.5], {"a": 1}]
+    for text in [json.dumps(values), json.dumps(values).replace(" ", ""), "[1.5]"]:
+        for chunk_size in range(1, len(text) + 1):
+            chunks = [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+            assert list(iter_json_array(chunks)) == json.loads(text), chunk_size
+
+
+def test_error_on_anything_but_whitespace_after_array():
+    """Error on anything but whitespace after the array"""
+    for chunk_size in [1, 2, 100]:
+        for text in ["[1]x", "[1] ,", "[] []"]:
+            chunks = [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+            with pytest.raises(json.JSONDecodeError):
+                list(iter_json_array(chunks))
+
+        assert list(iter_json_array(["[1]", " ", "\n"])) == [1]
+
+
+def test_catalog_geocoded_one_batch_at_a_time():
+    """Catalog geocoded one batch at a time"""
+    factory = BatchRecordingStoreRepoFactory()
+    batched = build_snapshot(factory, batch_size=10)
+    whole = build_snapshot(FakeStoreRepoFactory(), batch_size=1000)
+
+    assert len(factory.batches) == 10
+    assert all(len(b) <= 10 for b in factory.batches)
+    assert batched.version == whole.version
+
+
+def test_batch_size_read_from_config_when_catalog_built(monkeypatch):
+    """Batch size read from config when the catalog is built"""
+    monkeypatch.setattr(config, "STORE_INGEST_BATCH_SIZE", 50)
+    factory = BatchRecordingStoreRepoFactory()
+
+    build_snapshot(factory)
+
+    assert [len(b) for b in factory.batches] == [50, 45]
@@ -0,0 +1,123 @@
+"""The integrations test will use the FakePostcodesIORepo to
+pull the postcodes data from test_store_postcodes.json
+instead of making actual calls to the postcodesio api."""
+
+# Repeat nearby search served from the cache
+# Cached results exact for each radius in a bucket
+# Results only served for the catalog version they were computed from
+# Requests on the old catalog don't empty the cache during a reload
+# Entries expire after their TTL
+# Least recently used entries evicted
+# Counters consistent under concurrent access
+
+
+import threading
+
+from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog
+from src.srv_layer.result_cache import ResultCache
+from tests.conftest import CountingStoreRepoFactory, FakeClock, FakeStoreRepoFactory
+
+
+def test_repeat_nearby_search_served_from_cache():
+    """Repeat nearby search served from the cache"""
+    factory = CountingStoreRepoFactory()
+    catalog = StoreCatalog(factory)
+    result_cache = ResultCache(max_entries=10, ttl_seconds=60)
+
+    # EN9 3YW isn't a store postcode, so it has to be geocoded.
+    first = views.nearby_stores(factory, "EN9 3YW", 20, catalog, result_cache)
+    geocode_calls = factory.geocode_calls
+    second = views.nearby_stores(factory, "en9  3yw", 20, catalog, result_cache)
+
+    assert list(first) == list(second)
+    assert factory.geocode_calls == geocode_calls
+    assert result_cache.stats()["hits"] == 1
+    assert result_cache.stats()["misses"] == 1
+
+
+def test_cached_results_exact_for_each_radius_in_bucket():
+    """Cached results exact for each radius in a bucket"""
+    factory = FakeStoreRepoFactory()
+    catalog = StoreCatalog(factory)
+    result_cache = ResultCache(max_entries=10, ttl_seconds=60)
+
+    for radius_km in [30, 26, 27.5, 29, 0]:
+        cached = views.nearby_stores(
+            factory, "CM20 1FE", radius_km, catalog, result_cache
+        )
+        uncached = views.nearby_stores(factory, "CM20 1FE", radius_km, catalog)
+        assert list(cached) == list(uncached)
+
+
+def test_results_only_served_for_catalog_version_computed_from():
+    """Results only served for the catalog version they were computed from"""
+    result_cache = ResultCache(max_entries=10, ttl_seconds=60)
+
+    result_cache.put("key", "v1", "result")
+    assert result_cache.get("key", "v1") == "result"
+    assert result_cache.get("key", "v2") is None
+
+
+def test_requests_on_old_catalog_dont_empty_cache_during_reload():
+    """Requests on the old catalog don't empty the cache during a reload"""
+    result_cache = ResultCache(max_entries=10, ttl_seconds=60)
+    result_cache.put("a", "v1", "old a")
+
+    # Requests on the new and the old catalog take turns.
+    result_cache.put("a", "v2", "new a")
+    result_cache.put("b", "v1", "old b")
+    result_cache.put("b", "v2", "new b")
+
+    assert result_cache.get("a", "v2") == "new a"
+    assert result_cache.get("b", "v2") == "new b"
+    assert result_cache.get("b", "v1") == "old b"
+    assert result_cache.stats()["entries"] == 4
+
+
+def test_entries_expire_after_ttl():
+    """Entries expire after their TTL"""
+    clock = FakeClock()
+    result_cache = ResultCache(max_entries=10, ttl_seconds=60, clock=clock)
+
+    result_cache.put("key", "v1", "result")
+    clock.now += 59
+    assert result_cache.get("key", "v1") == "result"
+    clock.now += 2
+    assert result_cache.get("key", "v1") is None
+
+
+def test_least_recently_used_entries_evicted():
+    """Least recently used entries evicted"""
+    result_cache = ResultCache(max_entries=2, ttl_seconds=60)
+
+    result_cache.put("a", "v1", 1)
+    result_cache.put("b", "v1", 2)
+    result_cache.get("a", "v1")
+    result_cache.put("c", "v1", 3)
+
+    assert result_cache.get("b", "v1") is None
+    assert result_cache.get("a", "v1") == 1
+    assert result_cache.get("c", "v1") == 3
+    assert result_cache.stats()["evictions"] == 1
+
+
+def test_counters_consistent_under_concurrent_access():
+    """Counters consistent under concurrent access"""
+    result_cache = ResultCache(max_entries=50, ttl_seconds=60)
+
+    def worker(n):
+        for i in range(500):
+            key = (n * i) % 100
+            if result_cache.get(key, "v1") is None:
+                result_cache.put(key, "v1", key)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = result_cache.stats()
+    assert stats["hits"] + stats["misses"] == 8 * 500
+    assert stats["entries"] <= 50
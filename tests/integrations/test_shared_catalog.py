@@ -0,0 +1,166 @@
+"""The catalog is published to a file in a temporary folder and attached
+to from there, the same as the workers would. It's built with the
+FakeStoreRepoFactory, so publishing it doesn't call Postcodes.io."""
+
+# Attached catalog has the same stores as the published one
+# Attached columns read from the map, read only
+# Searches on the attached catalog match the built one
+# Workers attach to a republished catalog
+# Catalog attached in another process without geocoding
+# First read waits for the catalog to be published
+# Error on a file that isn't a catalog
+# Publish catalog command writes the file
+
+
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from src.adapters import repo
+from src.srv_layer import shared_catalog, views
+from src.srv_layer.catalog import build_snapshot
+from src.srv_layer.shared_catalog import SharedStoreCatalog
+from tests.conftest import FakeStoreRepoFactory
+
+
+class ListStoreRepo(repo.AbstractStoreRepo):
+    def __init__(self, stores):
+        self.stores = stores
+
+    def list(self):
+        return self.stores
+
+
+class FirstStoresRepoFactory(FakeStoreRepoFactory):
+    def __init__(self, n):
+        self.n = n
+
+    def create_store_repo(self):
+        return ListStoreRepo(super().create_store_repo().list()[: self.n])
+
+
+class SnapshotCatalog:
+    """Serves a snapshot built up front."""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def snapshot(self):
+        return self._snapshot
+
+
+@pytest.fixture
+def built():
+    # Every store is indexed, so the index is published too.
+    return build_snapshot(FakeStoreRepoFactory(), spatial_index_min_stores=0)
+
+
+@pytest.fixture
+def catalog_file(tmp_path, built):
+    path = str(tmp_path / "catalog.bin")
+    shared_catalog.publish_snapshot(built, path)
+    return path
+
+
+def attached_summary(path):
+    snapshot = shared_catalog.attach_snapshot(path)
+    return len(snapshot.table), snapshot.version, snapshot.table.row(0).name
+
+
+def test_attached_catalog_has_same_stores_as_published(built, catalog_file):
+    """Attached catalog has the same stores as the published one"""
+    attached = shared_catalog.attach_snapshot(catalog_file)
+
+    assert list(attached.table.view()) == list(built.table.view())
+    assert attached.version == built.version
+    assert attached.built_at == built.built_at
+    assert dict(attached.postcode_positions) == dict(built.postcode_positions)
+
+
+def test_attached_columns_read_from_map_read_only(catalog_file):
+    """Attached columns read from the map, read only"""
+    table = shared_catalog.attach_snapshot(catalog_file).table
+
+    assert isinstance(table.lats, memoryview) and table.lats.readonly
+    with pytest.raises(TypeError):
+        table.lats[0] = 0.0
+    with pytest.raises(TypeError):
+        table.names[0] = "Renamed"
+
+
+def test_searches_on_attached_catalog_match_built_one(built, catalog_file):
+    """Searches on the attached catalog match the built one"""
+    factory = FakeStoreRepoFactory()
+    attached = SharedStoreCatalog(catalog_file)
+    assert attached.snapshot().index is not None
+
+    for postcode in ["CM20 1FE", "AL1 2RJ", "EN9 3YW"]:
+        assert list(views.nearby_stores(factory, postcode, 30, attached)) == list(
+            views.nearby_stores(factory, postcode, 30, SnapshotCatalog(built))
+        )
+        assert views.nearest_stores(factory, postcode, 5, None, attached) == (
+            views.nearest_stores(factory, postcode, 5, None, SnapshotCatalog(built))
+        )
+
+
+def test_workers_attach_to_republished_catalog(built, catalog_file):
+    """Workers attach to a republished catalog"""
+    catalog = SharedStoreCatalog(catalog_file)
+    before = catalog.snapshot()
+    assert catalog.snapshot() is before
+
+    smaller = build_snapshot(FirstStoresRepoFactory(10))
+    shared_catalog.publish_snapshot(smaller, catalog_file)
+
+    after = catalog.snapshot()
+    assert after.version == smaller.version != before.version
+    assert len(after.table) == 10
+    # Readers still holding the old snapshot can carry on reading it.
+    assert len(list(before.table.view())) == len(built.table)
+
+
+def test_catalog_attached_in_another_process_without_geocoding(built, catalog_file):
+    """Catalog attached in another process without geocoding"""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        summary = pool.apply(attached_summary, (catalog_file,))
+
+    assert summary == (len(built.table), built.version, built.table.row(0).name)
+
+
+def test_first_read_waits_for_catalog_to_be_published(tmp_path, built):
+    """First read waits for the catalog to be published"""
+    path = str(tmp_path / "catalog.bin")
+
+    with pytest.raises(FileNotFoundError):
+        SharedStoreCatalog(path).snapshot()
+
+    publisher = threading.Timer(0.2, shared_catalog.publish_snapshot, (built, path))
+    publisher.start()
+    started_at = time.monotonic()
+    assert SharedStoreCatalog(path, 5).snapshot().version == built.version
+    assert time.monotonic() - started_at < 5
+    publisher.join()
+
+
+def test_error_on_file_that_isnt_a_catalog(tmp_path):
+    """Error on a file that isn't a catalog"""
+    for contents in [b"", b"STGAZ001" + bytes(64)]:
+        path = tmp_path / "not_a_catalog.bin"
+        path.write_bytes(contents)
+        with pytest.raises(ValueError):
+            shared_catalog.attach_snapshot(str(path))
+
+
+def test_publish_catalog_command_writes_file(integrations_app, tmp_path):
+    """Publish catalog command writes the file"""
+    path = str(tmp_path / "catalog.bin")
+
+    result = integrations_app.test_cli_runner().invoke(
+        args=["publish-catalog", "--output-file", path],
+    )
+
+    assert result.exit_code == 0, result.output
+    attached = shared_catalog.attach_snapshot(path)
+    assert attached.version == build_snapshot(FakeStoreRepoFactory()).version
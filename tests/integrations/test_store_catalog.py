@@ -0,0 +1,138 @@
+"""The catalog is tested against a copy of stores.json in a
+temporary folder, so that we can change the file on disk and
+check the catalog picks up the change."""
+
+# Stores loaded and geocoded once
+# Snapshot is read only
+# Reload when stores file changes
+# Readers served the current snapshot during a reload
+# Current snapshot served while the stores file is missing
+# Spatial index threshold read from config when the catalog is built
+
+
+import json
+import os
+import shutil
+import threading
+
+import pytest
+
+from src import config
+from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog
+from tests.conftest import CountingStoreRepoFactory
+
+
+@pytest.fixture
+def stores_file(tmp_path):
+    path = tmp_path / "stores.json"
+    shutil.copy(config.STORES_FILE, path)
+    return path
+
+
+def rewrite_stores_file(path, stores):
+    stat = os.stat(path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stores, f)
+    # Make sure the mtime moves on, even on coarse grained filesystems.
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_stores_loaded_and_geocoded_once(stores_file):
+    """Stores loaded and geocoded once"""
+    factory = CountingStoreRepoFactory(str(stores_file))
+    catalog = StoreCatalog(factory)
+
+    first = views.stores(factory, catalog)
+    second = views.stores(factory, catalog)
+
+    assert list(first) == list(second)
+    assert factory.geocode_calls == 1
+    assert [s.name for s in first] == sorted(s.name for s in first)
+
+
+def test_snapshot_is_read_only(stores_file):
+    """Snapshot is read only"""
+    catalog = StoreCatalog(CountingStoreRepoFactory(str(stores_file)))
+    snapshot = catalog.snapshot()
+
+    with pytest.raises(TypeError):
+        snapshot.table.names[0] = "Renamed"
+    with pytest.raises(TypeError):
+        snapshot.table.lats[0] = 0.0
+
+
+def test_reload_when_stores_file_changes(stores_file):
+    """Reload when stores file changes"""
+    factory = CountingStoreRepoFactory(str(stores_file))
+    catalog = StoreCatalog(factory)
+    before = catalog.snapshot()
+
+    rewrite_stores_file(stores_file, [{"name": "Harlow", "postcode": "CM20 2SX"}])
+    catalog.snapshot()
+    catalog.wait_for_reload(5)
+    after = catalog.snapshot()
+
+    assert after is not before
+    assert after.version != before.version
+    assert list(after.table.names) == ["Harlow"]
+    assert factory.geocode_calls == 2
+
+
+def test_readers_served_current_snapshot_during_reload(stores_file):
+    """Readers served the current snapshot during a reload"""
+    factory = CountingStoreRepoFactory(str(stores_file))
+    catalog = StoreCatalog(factory)
+    before = catalog.snapshot()
+
+    # Hold up the rebuild inside the geocoding call.
+    in_rebuild, release_rebuild = threading.Event(), threading.Event()
+    postcode_to_coords_map = factory.postcode_repo.postcode_to_coords_map
+
+    def slow_postcode_to_coords_map(postcodes):
+        in_rebuild.set()
+        release_rebuild.wait(5)
+        return postcode_to_coords_map(postcodes)
+
+    factory.postcode_repo.postcode_to_coords_map = slow_postcode_to_coords_map
+    rewrite_stores_file(stores_file, [{"name": "Harlow", "postcode": "CM20 2SX"}])
+
+    # Even the read that notices the change doesn't wait for the rebuild.
+    assert catalog.snapshot() is before
+    assert in_rebuild.wait(5)
+
+    assert catalog.snapshot() is before
+
+    release_rebuild.set()
+    catalog.wait_for_reload(5)
+    assert catalog.snapshot() is not before
+
+
+def test_current_snapshot_served_while_stores_file_missing(stores_file):
+    """Current snapshot served while the stores file is missing"""
+    factory = CountingStoreRepoFactory(str(stores_file))
+    catalog = StoreCatalog(factory)
+    before = catalog.snapshot()
+    stores = json.loads(stores_file.read_text(encoding="utf-8"))
+
+    os.remove(stores_file)
+
+    assert catalog.snapshot() is before
+    assert len(views.stores(factory, catalog)) == len(before.table)
+
+    with open(stores_file, "w", encoding="utf-8") as f:
+        json.dump(stores[:1], f)
+    catalog.snapshot()
+    catalog.wait_for_reload(5)
+    assert list(catalog.snapshot().table.names) == [stores[0]["name"]]
+
+
+def test_spatial_index_threshold_read_from_config_when_built(monkeypatch):
+    """Spatial index threshold read from config when the catalog is built"""
+    factory = CountingStoreRepoFactory()
+
+    monkeypatch.setattr(config, "SPATIAL_INDEX_MIN_STORES", 1)
+    assert StoreCatalog(factory).snapshot().index is not None
+
+    monkeypatch.setattr(config, "SPATIAL_INDEX_MIN_STORES", 1_000_000)
+    assert StoreCatalog(factory).snapshot().index is None
@@ -0,0 +1,218 @@
+"""The integrations test will use the FakePostcodesIORepo to
+pull the postcodes data from test_store_postcodes.json
+instead of making actual calls to the postcodesio api."""
+
+# Each store rendered once per catalog version
+# Only the listed stores rendered
+# Fragments dropped when the catalog version changes
+# Requests on the old catalog don't drop the new catalog's fragments
+# Hits, misses and fragments held reported on /metrics
+# Repeat page assembled from the cached fragments
+# Nearby page shares the fragments of the stores page
+# Long store list streamed
+# Streamed page the same as the rendered page
+# Short store list rendered in full
+# Streamed page rendered in full while profiled
+
+
+import pstats
+
+from bs4 import BeautifulSoup
+
+from src import config, constants
+from src.domain.store_table import StoreTableBuilder
+from src.entrypoints import profiling
+from src.entrypoints.fragment_cache import StoreFragmentCache
+from tests.conftest import metric_sample
+
+
+def make_table(names):
+    builder = StoreTableBuilder()
+    builder.extend(
+        {"name": n, "postcode": f"AB1 {i}CD", "lat": 51.5, "long": -0.1}
+        for i, n in enumerate(names)
+    )
+    return builder.build()
+
+
+class CountingRender:
+    def __init__(self):
+        self.rendered = []
+
+    def __call__(self, store):
+        self.rendered.append(store.name)
+        return f"<li>{store.name}</li>"
+
+
+def store_names(response):
+    soup = BeautifulSoup(response.data, "html.parser")
+    return [p.text for p in soup.find_all("p", class_="store-name")]
+
+
+def test_each_store_rendered_once_per_catalog_version():
+    """Each store rendered once per catalog version"""
+    cache = StoreFragmentCache()
+    table = make_table(["Alton", "Bath", "Crewe"])
+    render = CountingRender()
+
+    first = list(cache.fragments(table.view(), render))
+    second = list(cache.fragments(table.view(), render))
+
+    assert first == second == ["<li>Alton</li>", "<li>Bath</li>", "<li>Crewe</li>"]
+    assert render.rendered == ["Alton", "Bath", "Crewe"]
+    assert cache.stats() == {
+        "fragments": 3,
+        "hits": 3,
+        "misses": 3,
+        "invalidations": 0,
+    }
+
+
+def test_only_listed_stores_rendered():
+    """Only the listed stores rendered"""
+    cache = StoreFragmentCache()
+    table = make_table(["Alton", "Bath", "Crewe"])
+    render = CountingRender()
+
+    fragments = list(cache.fragments(table.view([2, 0]), render))
+
+    assert fragments == ["<li>Crewe</li>", "<li>Alton</li>"]
+    assert render.rendered == ["Crewe", "Alton"]
+
+
+def test_fragments_dropped_when_catalog_version_changes():
+    """Fragments dropped when the catalog version changes"""
+    cache = StoreFragmentCache()
+    render = CountingRender()
+    list(cache.fragments(make_table(["Alton", "Bath"]).view(), render))
+
+    fragments = list(cache.fragments(make_table(["Alton", "Buxton"]).view(), render))
+
+    assert fragments == ["<li>Alton</li>", "<li>Buxton</li>"]
+    assert render.rendered == ["Alton", "Bath", "Alton", "Buxton"]
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_requests_on_old_catalog_dont_drop_new_catalogs_fragments():
+    """Requests on the old catalog don't drop the new catalog's fragments"""
+    cache = StoreFragmentCache()
+    render = CountingRender()
+    old, new = make_table(["Alton", "Bath"]), make_table(["Alton", "Buxton"])
+
+    # Requests on the old and the new catalog take turns during a reload.
+    for table in [old, new, old, new]:
+        list(cache.fragments(table.view(), render))
+
+    assert render.rendered == ["Alton", "Bath", "Alton", "Buxton"]
+    assert cache.stats() == {
+        "fragments": 2,
+        "hits": 4,
+        "misses": 4,
+        "invalidations": 1,
+    }
+
+
+def test_hits_misses_and_fragments_held_reported_on_metrics(integrations_client):
+    """Hits, misses and fragments held reported on /metrics"""
+
+    lookup = "stores_cache_lookups_total"
+    hits = metric_sample(lookup, cache="store_fragments", result="hit")
+    misses = metric_sample(lookup, cache="store_fragments", result="miss")
+
+    integrations_client.get("/")
+    integrations_client.get("/")
+
+    assert metric_sample(lookup, cache="store_fragments", result="hit") == hits + 95
+    assert metric_sample(lookup, cache="store_fragments", result="miss") == misses + 95
+    assert metric_sample("stores_cache_entries", cache="store_fragments") == 95
+
+
+def test_repeat_page_assembled_from_cached_fragments(
+    integrations_app, integrations_client
+):
+    """Repeat page assembled from the cached fragments"""
+    cache = integrations_app.config[constants.STORE_FRAGMENT_CACHE]
+
+    first = integrations_client.get("/")
+    second = integrations_client.get("/")
+
+    assert second.data == first.data
+    assert len(store_names(first)) == 95
+    assert cache.stats()["misses"] == 95
+    assert cache.stats()["hits"] == 95
+
+
+def test_nearby_page_shares_fragments_of_stores_page(
+    integrations_app, integrations_client
+):
+    """Nearby page shares the fragments of the stores page"""
+    cache = integrations_app.config[constants.STORE_FRAGMENT_CACHE]
+    integrations_client.get("/")
+
+    response = integrations_client.get("/nearby/?postcode=AL1%202RJ&radius_km=30")
+
+    assert response.status_code == 200
+    assert len(store_names(response)) > 0
+    assert cache.stats()["misses"] == 95
+    assert cache.stats()["hits"] == len(store_names(response))
+
+
+def test_long_store_list_streamed(monkeypatch, integrations_client):
+    """Long store list streamed"""
+    monkeypatch.setattr(config, "STORE_LIST_STREAM_MIN_STORES", 95)
+    monkeypatch.setattr(config, "STORE_LIST_CHUNK_STORES", 10)
+
+    response = integrations_client.get("/", buffered=False)
+
+    assert response.status_code == 200
+    # The test client streams every response, so only the missing length
+    # shows that the app streamed it.
+    assert "Content-Length" not in response.headers
+    assert response.headers["ETag"]
+    chunks = list(response.response)
+    response.close()
+    # The head, 10 chunks of stores and the tail, at least.
+    assert len(chunks) >= 12
+
+
+def test_streamed_page_same_as_rendered_page(monkeypatch, integrations_client):
+    """Streamed page the same as the rendered page"""
+    rendered = integrations_client.get("/")
+    monkeypatch.setattr(config, "STORE_LIST_STREAM_MIN_STORES", 1)
+
+    streamed = integrations_client.get("/")
+
+    assert "Content-Length" not in streamed.headers
+    assert streamed.data == rendered.data
+
+
+def test_short_store_list_rendered_in_full(monkeypatch, integrations_client):
+    """Short store list rendered in full"""
+    monkeypatch.setattr(config, "STORE_LIST_STREAM_MIN_STORES", 96)
+
+    response = integrations_client.get("/")
+
+    assert response.headers["Content-Length"] == str(len(response.data))
+
+
+def test_streamed_page_rendered_in_full_while_profiled(
+    monkeypatch, tmp_path, integrations_client
+):
+    """Streamed page rendered in full while profiled"""
+    monkeypatch.setattr(config, "STORE_LIST_STREAM_MIN_STORES", 1)
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(config, "PROFILING_TOKEN", "let-me-profile")
+    monkeypatch.setattr(config, "PROFILING_OUTPUT_DIR", str(tmp_path))
+
+    response = integrations_client.get(
+        "/",
+        headers={profiling.TOKEN_HEADER: "let-me-profile"},
+    )
+
+    assert response.headers["Content-Length"] == str(len(response.data))
+    assert len(store_names(response)) == 95
+    name = response.headers[profiling.PROFILE_HEADER]
+    stats = pstats.Stats(str(tmp_path / f"{name}.pstats"))
+    assert any(
+        function == "_timed_render" for _, _, function in stats.stats  # type: ignore
+    )
@@ -0,0 +1,90 @@
+"""These tests are for the batch nearby search. They are integrations
+tests as the FakeStoreRepoFactory provides a fake repo with the same
+information as what Postcodes.io would provide."""
+
+# Batch results match a nearby search per origin
+# Origins geocoded in one bulk lookup
+# Error only for the origins that cannot be geocoded
+# Batch nearby stores returned as JSON in origin order
+# Bad request on an invalid batch
+
+
+from src import config
+from src.srv_layer import views
+from src.srv_layer.catalog import StoreCatalog
+from tests.conftest import CountingStoreRepoFactory, FakeStoreRepoFactory
+
+
+def test_batch_results_match_nearby_search_per_origin():
+    """Batch results match a nearby search per origin"""
+    factory = FakeStoreRepoFactory()
+    catalog = StoreCatalog(factory)
+    origins = ["CM20 1FE", "EN9 3YW", "AL1 2RJ", "BN14 9GB"]
+
+    results = views.batch_nearby_stores(factory, origins, 30, catalog).results
+
+    assert [r["postcode"] for r in results] == origins
+    for origin, result in zip(origins, results):
+        nearby = views.nearby_stores(factory, origin, 30, catalog)
+        assert [s["name"] for s in result["stores"]] == [s.name for s in nearby]
+        assert all(s["distance_km"] <= 30 for s in result["stores"])
+
+
+def test_origins_geocoded_in_one_bulk_lookup():
+    """Origins geocoded in one bulk lookup"""
+    factory = CountingStoreRepoFactory()
+    catalog = StoreCatalog(factory)
+    catalog.snapshot()
+    factory.lookups.clear()
+
+    # EN9 3YW and CM20 1FE aren't store postcodes, AL1 2RJ is.
+    views.batch_nearby_stores(factory, ["EN9 3YW", "AL1 2RJ", "CM20 1FE"], 30, catalog)
+
+    assert factory.lookups == [["EN9 3YW", "CM20 1FE"]]
+
+
+def test_error_only_for_origins_that_cannot_be_geocoded():
+    """Error only for the origins that cannot be geocoded"""
+    results = views.batch_nearby_stores(
+        FakeStoreRepoFactory(),
+        ["ZZ99 9ZZ", "CM20 1FE"],
+        30,
+    ).results
+
+    assert "error" in results[0] and "stores" not in results[0]
+    assert results[1]["stores"]
+
+
+def test_batch_nearby_stores_returned_as_json_in_origin_order(integrations_client):
+    """Batch nearby stores returned as JSON in origin order"""
+    response = integrations_client.post(
+        "/api/stores/nearby/batch/",
+        json={"postcodes": ["EN9 3YW", "ZZ99 9ZZ", "CM20 1FE"], "radius_km": 20},
+    )
+    assert response.status_code == 200
+
+    results = response.json["results"]
+    assert [r["postcode"] for r in results] == ["EN9 3YW", "ZZ99 9ZZ", "CM20 1FE"]
+    assert "error" in results[1]
+    stores = results[2]["stores"]
+    assert all(stores[i]["lat"] >= stores[i + 1]["lat"] for i in range(len(stores) - 1))
+    assert response.json["catalog_version"]
+
+
+def test_bad_request_on_invalid_batch(integrations_client):
+    """Bad request on an invalid batch"""
+    url = "/api/stores/nearby/batch/"
+    too_many = ["CM20 1FE"] * (config.BATCH_NEARBY_MAX_POSTCODES + 1)
+
+    for body in [
+        {},
+        {"postcodes": []},
+        {"postcodes": "CM20 1FE"},
+        {"postcodes": [1]},
+        {"postcodes": too_many},
+        {"postcodes": ["CM20 1FE"], "radius_km": -1},
+        {"postcodes": ["CM20 1FE"], "radius_km": "30"},
+    ]:
+        assert integrations_client.post(url, json=body).status_code == 400
+
+    assert integrations_client.post(url, data="not json").status_code == 400
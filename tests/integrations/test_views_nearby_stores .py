@@ -31,9 +31,9 @@ def test_nearby_stores_sorted_from_north_to_south():
     )
 
     # Lat and long must both be present for all.
-    assert all(s.get("lat") and s.get("long") for s in stores)
+    assert all(s.lat and s.long for s in stores)
 
     # The lat should be ordered from greatest to smallest.
     assert all(
-        stores[i].get("lat") >= stores[i + 1].get("lat") for i in range(len(stores) - 1)
+        stores[i].lat >= stores[i + 1].lat for i in range(len(stores) - 1)
     )
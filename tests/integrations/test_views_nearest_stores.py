@@ -0,0 +1,112 @@
+"""The integrations test will use the FakePostcodesIORepo to
+pull the postcodes data from test_store_postcodes.json
+instead of making actual calls to the postcodesio api."""
+
+# Nearest stores sorted from nearest to furthest
+# Nearest stores match a full sort by distance
+# Nearest stores only within max radius
+# Error on unknown postcode
+# Display nearest stores with distances
+# Not found on unknown postcode
+# Bad request on k out of range
+
+
+import pytest
+from bs4 import BeautifulSoup
+
+from src.exceptions import PostcodeNotFoundError
+from src.srv_layer import views
+from tests.conftest import FakeStoreRepoFactory
+
+
+def query_harlow_postcode():
+    return "CM20 1FE"
+
+
+def harlow_coords():
+    return 51.77624, 0.095126
+
+
+def test_nearest_stores_sorted_from_nearest_to_furthest():
+    """Nearest stores sorted from nearest to furthest"""
+    stores = views.nearest_stores(
+        FakeStoreRepoFactory(),
+        postcode=query_harlow_postcode(),
+        k=5,
+    )
+
+    assert len(stores) == 5
+    assert stores[0]["name"] == "Harlow"
+    assert all(
+        stores[i]["distance_km"] <= stores[i + 1]["distance_km"]
+        for i in range(len(stores) - 1)
+    )
+
+
+def test_nearest_stores_match_full_sort_by_distance():
+    """Nearest stores match a full sort by distance"""
+    all_stores = views.stores(FakeStoreRepoFactory())
+    by_distance = sorted(
+        (
+            s.distance_km_from(*harlow_coords()),
+            s.name,
+        )
+        for s in all_stores
+        if s.lat
+    )
+
+    stores = views.nearest_stores(
+        FakeStoreRepoFactory(),
+        postcode=query_harlow_postcode(),
+        k=10,
+    )
+
+    assert [s["name"] for s in stores] == [name for _, name in by_distance[:10]]
+    assert [s["distance_km"] for s in stores] == pytest.approx(
+        [d for d, _ in by_distance[:10]]
+    )
+
+
+def test_nearest_stores_only_within_max_radius():
+    """Nearest stores only within max radius"""
+    stores = views.nearest_stores(
+        FakeStoreRepoFactory(),
+        postcode=query_harlow_postcode(),
+        k=50,
+        max_radius_km=30,
+    )
+    nearby = views.nearby_stores(
+        FakeStoreRepoFactory(),
+        postcode=query_harlow_postcode(),
+        radius_km=30,
+    )
+
+    assert all(s["distance_km"] <= 30 for s in stores)
+    assert sorted(s["name"] for s in stores) == sorted(s.name for s in nearby)
+
+
+def test_error_on_unknown_postcode():
+    """Error on unknown postcode"""
+    with pytest.raises(PostcodeNotFoundError):
+        views.nearest_stores(FakeStoreRepoFactory(), postcode="ZZ99 9ZZ", k=5)
+
+
+def test_display_nearest_stores_with_distances(integrations_client):
+    """Display nearest stores with distances"""
+    response = integrations_client.get("/nearest/CM20 1FE/?k=3")
+    assert response.status_code == 200
+    soup = BeautifulSoup(response.data, "html.parser")
+    assert len(soup.find_all("p", class_="store-name")) == 3
+    assert all("km away" in p.text for p in soup.find_all("p", class_="distance"))
+
+
+def test_not_found_on_unknown_postcode(integrations_client):
+    """Not found on unknown postcode"""
+    response = integrations_client.get("/nearest/ZZ99 9ZZ/")
+    assert response.status_code == 404
+
+
+def test_bad_request_on_k_out_of_range(integrations_client):
+    """Bad request on k out of range"""
+    assert integrations_client.get("/nearest/CM20 1FE/?k=0").status_code == 400
+    assert integrations_client.get("/nearest/CM20 1FE/?k=1000").status_code == 400
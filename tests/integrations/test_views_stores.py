@@ -36,15 +36,15 @@ def test_bulk_returns_lat_and_long_for_most_stores2():
 
     # Some may not have a lat and long as it wasn't
     # determined at source.
-    assert any(s.get("lat") for s in stores)
-    assert any(s.get("long") for s in stores)
+    assert any(s.lat for s in stores)
+    assert any(s.long for s in stores)
 
     # Lat an long must both be present or not at all.
-    assert all(s.get("lat") for s in stores if s.get("long"))
-    assert all(s.get("long") for s in stores if s.get("lat"))
+    assert all(s.lat for s in stores if s.long)
+    assert all(s.long for s in stores if s.lat)
 
     # At least X% will have lat and long.
     assert (
-        sum(1 for s in stores if s.get("lat")) / len(stores)
+        sum(1 for s in stores if s.lat) / len(stores)
         >= config.POSTCODESIO_BULK_POSTCODES_SUCCESS_RATE
     )
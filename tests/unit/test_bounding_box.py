@@ -0,0 +1,97 @@
+"""These unit tests are not concerned with data access.
+They test only the logic of domain entities irrespective
+of the data sources."""
+
+# Box never excludes a store within radius
+# Box wraps around the antimeridian
+# Box covers all longitudes when reaching over a pole
+# Prefilter reports how many stores were pruned
+# Error on negative radius
+
+
+import random
+
+import pytest
+
+from src.domain import bounding_box as bounding_box_module
+from src.domain.bounding_box import BoundingBox
+from src.domain.store import Store
+
+
+@pytest.fixture(params=["numpy", "python"])
+def prefilter_impl(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(bounding_box_module, "numpy", None)
+    return request.param
+
+
+def create_random_stores(count, seed=1):
+    rnd = random.Random(seed)
+    return [
+        Store(
+            f"Store {i}",
+            f"Postcode {i}",
+            rnd.uniform(-89.9, 89.9),
+            rnd.uniform(-179.9, 179.9),
+        )
+        for i in range(count)
+    ]
+
+
+def test_box_never_excludes_store_within_radius(prefilter_impl):
+    """Box never excludes a store within radius"""
+    stores = create_random_stores(3000)
+    lats, longs = [s.lat for s in stores], [s.long for s in stores]
+
+    for lat, long, radius_km in [
+        (51.77624, 0.095126, 30),
+        (0, 179.5, 1500),
+        (-10, -179.5, 1500),
+        (85, 45, 1000),
+        (-85, -45, 1000),
+        (60, 10, 3000),
+    ]:
+        within = [
+            i for i, s in enumerate(stores) if s.is_within_radius(lat, long, radius_km)
+        ]
+        prefiltered = BoundingBox.around(lat, long, radius_km).prefilter(lats, longs)
+
+        assert set(within) <= set(prefiltered.positions)
+
+
+def test_box_wraps_around_antimeridian():
+    """Box wraps around the antimeridian"""
+    box = BoundingBox.around(0, 179.9, 100)
+
+    assert box.crosses_antimeridian
+    assert box.contains(0, -179.9)
+    assert box.contains(0, 179.5)
+    assert not box.contains(0, 0)
+
+
+def test_box_covers_all_longitudes_when_reaching_over_pole():
+    """Box covers all longitudes when reaching over a pole"""
+    box = BoundingBox.around(89.5, 0, 100)
+
+    assert box.max_lat == 90
+    assert (box.min_long, box.max_long) == (-180, 180)
+    assert box.contains(89.9, 179)
+
+
+def test_prefilter_reports_pruned_stores(prefilter_impl):
+    """Prefilter reports how many stores were pruned"""
+    lats = [51.785161, 55.9533, None, 51.677378]
+    longs = [0.121998, -3.1883, 0.1, 0.001689]
+
+    prefiltered = BoundingBox.around(51.77624, 0.095126, 30).prefilter(lats, longs)
+
+    assert prefiltered.positions == [0, 3]
+    assert prefiltered.pruned == 2
+
+
+def test_error_on_negative_radius():
+    """Error on negative radius."""
+    with pytest.raises(ValueError):
+        BoundingBox.around(51.77624, 0.095126, -1)
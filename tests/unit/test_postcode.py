@@ -0,0 +1,71 @@
+"""These unit tests are not concerned with data access.
+They test only the logic of domain entities irrespective
+of the data sources."""
+
+# Postcodes normalised whatever the case and spacing
+# Outward code and sector taken from the postcode
+# Sector centroid preferred over the outward code
+# Centroid averaged on the sphere
+# No centroid for unknown areas
+
+
+import pytest
+
+from src.domain import postcode
+from src.domain.postcode import CentroidIndex
+
+
+def test_postcodes_normalised_whatever_the_case_and_spacing():
+    """Postcodes normalised whatever the case and spacing"""
+    for p in ["cm201fe", " CM20  1FE ", "Cm20 1fE", "CM201FE"]:
+        assert postcode.normalise(p) == "CM20 1FE"
+
+    assert postcode.normalise("w1a0ax") == "W1A 0AX"
+    assert postcode.normalise("n1 9gu") == "N1 9GU"
+    assert postcode.normalise("not a postcode") == "NOTAPOSTCODE"
+
+
+def test_outward_code_and_sector_taken_from_postcode():
+    """Outward code and sector taken from the postcode"""
+    assert postcode.outward_code("cm201fe") == "CM20"
+    assert postcode.sector("cm201fe") == "CM20 1"
+    assert postcode.outward_code("") is None
+    assert postcode.sector("ZZ") is None
+
+
+def test_sector_centroid_preferred_over_outward_code():
+    """Sector centroid preferred over the outward code"""
+    centroid_index = CentroidIndex.from_entries(
+        [
+            ("CM20 1FE", 51.0, 0.0),
+            ("CM20 1AA", 51.2, 0.2),
+            ("CM20 2SX", 52.0, 1.0),
+        ]
+    )
+
+    sector_centroid = centroid_index.lookup("CM20 1ZZ")
+    assert sector_centroid.count == 2
+    assert sector_centroid.lat == pytest.approx(51.1, abs=0.01)
+    assert sector_centroid.long == pytest.approx(0.1, abs=0.01)
+
+    outward_centroid = centroid_index.lookup("cm20 9zz")
+    assert outward_centroid.count == 3
+
+
+def test_centroid_averaged_on_the_sphere():
+    """Centroid averaged on the sphere"""
+    centroid_index = CentroidIndex.from_entries(
+        [("ZE1 0AA", 60.0, 179.0), ("ZE1 0AB", 60.0, -179.0)]
+    )
+
+    # Averaging the longs directly would put it on the other side of the world.
+    centroid = centroid_index.lookup("ZE1 0ZZ")
+    assert abs(centroid.long) == pytest.approx(180.0)
+    assert centroid.lat == pytest.approx(60.0, abs=0.01)
+
+
+def test_no_centroid_for_unknown_areas():
+    """No centroid for unknown areas"""
+    centroid_index = CentroidIndex.from_entries([("CM20 1FE", 51.0, 0.0)])
+    assert centroid_index.lookup("AL9 5JP") is None
+    assert centroid_index.lookup("not a postcode") is None
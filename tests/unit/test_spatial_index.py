@@ -0,0 +1,113 @@
+"""These unit tests are not concerned with data access.
+They test only the logic of domain entities irrespective
+of the data sources."""
+
+# Same stores within radius as the haversine check
+# Same stores within radius near the poles and antimeridian
+# Nearest stores same as a full sort by distance
+# Nearest stores only within max radius
+# Stores without coords never returned
+# Error on negative radius
+
+
+import random
+
+import pytest
+
+from src.domain.spatial import SpatialIndex
+from src.domain.store import Store
+
+
+def create_random_stores(count, lat_range, long_range, seed=1):
+    rnd = random.Random(seed)
+    return [
+        Store(
+            f"Store {i}",
+            f"Postcode {i}",
+            rnd.uniform(*lat_range),
+            rnd.uniform(*long_range),
+        )
+        for i in range(count)
+    ]
+
+
+def within_radius_by_index(stores, lat, long, radius_km):
+    index = SpatialIndex([s.lat for s in stores], [s.long for s in stores])
+    return [
+        i
+        for i in index.candidates_within_radius(lat, long, radius_km)
+        if stores[i].is_within_radius(lat, long, radius_km)
+    ]
+
+
+def within_radius_by_scan(stores, lat, long, radius_km):
+    return [i for i, s in enumerate(stores) if s.is_within_radius(lat, long, radius_km)]
+
+
+def test_same_stores_within_radius_as_haversine_check():
+    """Same stores within radius as the haversine check"""
+    stores = create_random_stores(2000, (49.9, 58.7), (-7.6, 1.8))
+
+    for lat, long, radius_km in [
+        (51.77624, 0.095126, 30),
+        (51.677378, 0.001689, 5),
+        (55.9533, -3.1883, 100),
+        (53.4808, -2.2426, 0),
+        (52.0, -1.0, 2000),
+    ]:
+        assert within_radius_by_index(
+            stores, lat, long, radius_km
+        ) == within_radius_by_scan(stores, lat, long, radius_km)
+
+
+def test_same_stores_within_radius_near_poles_and_antimeridian():
+    """Same stores within radius near the poles and antimeridian"""
+    stores = create_random_stores(2000, (-89.9, 89.9), (-179.9, 179.9))
+
+    for lat, long, radius_km in [
+        (89.5, 0, 500),
+        (-89.5, 90, 500),
+        (0, 179.9, 1000),
+        (10, -179.9, 1000),
+    ]:
+        assert within_radius_by_index(
+            stores, lat, long, radius_km
+        ) == within_radius_by_scan(stores, lat, long, radius_km)
+
+
+def test_nearest_stores_same_as_full_sort_by_distance():
+    """Nearest stores same as a full sort by distance"""
+    stores = create_random_stores(2000, (-89.9, 89.9), (-179.9, 179.9))
+    index = SpatialIndex([s.lat for s in stores], [s.long for s in stores])
+
+    for lat, long in [(51.77624, 0.095126), (89.5, 0), (0, 179.9)]:
+        by_distance = sorted(
+            range(len(stores)), key=lambda i: stores[i].distance_km_from(lat, long)
+        )
+        assert index.nearest(lat, long, 10) == by_distance[:10]
+
+
+def test_nearest_stores_only_within_max_radius():
+    """Nearest stores only within max radius"""
+    stores = create_random_stores(2000, (49.9, 58.7), (-7.6, 1.8))
+    index = SpatialIndex([s.lat for s in stores], [s.long for s in stores])
+
+    nearest = index.nearest(51.77624, 0.095126, 1000, max_radius_km=50)
+
+    assert sorted(nearest) == within_radius_by_scan(stores, 51.77624, 0.095126, 50)
+
+
+def test_stores_without_coords_never_returned():
+    """Stores without coords never returned"""
+    index = SpatialIndex([51.785161, None, 51.785161], [0.121998, 0.121998, None])
+
+    assert index.candidates_within_radius(51.77624, 0.095126, 5) == [0]
+    assert len(index) == 1
+
+
+def test_error_on_negative_radius():
+    """Error on negative radius."""
+    index = SpatialIndex([51.785161], [0.121998])
+
+    with pytest.raises(ValueError):
+        index.candidates_within_radius(51.77624, 0.095126, -1)
@@ -0,0 +1,138 @@
+"""These unit tests are not concerned with data access.
+They test only the logic of domain entities irrespective
+of the data sources."""
+
+# Batch distances match the scalar distances
+# Batch distances match the expected distances
+# Batch distances match without NumPy
+# Positions within radius match is within radius
+# Stores without coords never within radius
+# Distance matrix matches distances per query point
+# Nearest within radius picked from the radius search's distances
+
+
+import math
+
+import pytest
+
+from src.domain import store as store_module
+from src.domain.store import (
+    BATCH_DISTANCE_TOLERANCE_KM,
+    Store,
+    batch_distances_within_radius,
+    distances_within_radius,
+    nearest_positions,
+    positions_within_radius,
+)
+from tests.unit.test_store_distance_km_from import (
+    COORDS_BY_HEMSIPHERE,
+    EXPT_COORDS_DIST,
+)
+
+HEMISPHERES = list(COORDS_BY_HEMSIPHERE)
+LATS = [COORDS_BY_HEMSIPHERE[h]["lat"] for h in HEMISPHERES]
+LONGS = [COORDS_BY_HEMSIPHERE[h]["long"] for h in HEMISPHERES]
+
+
+@pytest.fixture(params=["numpy", "array"])
+def batch_impl(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(store_module, "numpy", None)
+    return request.param
+
+
+def test_batch_distances_match_scalar_distances(batch_impl):
+    """Batch distances match the scalar distances"""
+    for hem in HEMISPHERES:
+        query = COORDS_BY_HEMSIPHERE[hem]
+        distances = Store.distances_km_from(query["lat"], query["long"], LATS, LONGS)
+
+        for hem_2, dist in zip(HEMISPHERES, distances):
+            if hem == hem_2:
+                continue
+            store = Store("Store 1", "Postcode 1", **COORDS_BY_HEMSIPHERE[hem_2])
+            scalar = store.distance_km_from(query["lat"], query["long"])
+            assert abs(scalar - dist) <= BATCH_DISTANCE_TOLERANCE_KM
+
+
+def test_batch_distances_match_expected_distances(batch_impl):
+    """Batch distances match the expected distances"""
+    for hem in HEMISPHERES:
+        query = COORDS_BY_HEMSIPHERE[hem]
+        distances = Store.distances_km_from(query["lat"], query["long"], LATS, LONGS)
+
+        for hem_2, dist in zip(HEMISPHERES, distances):
+            if exp_dist := EXPT_COORDS_DIST.get(f"{hem}_{hem_2}"):
+                # Accounts for slight variation in results.
+                assert abs(exp_dist - dist) <= 0.2
+
+
+def test_positions_within_radius_match_is_within_radius(batch_impl):
+    """Positions within radius match is within radius"""
+    stores = [
+        Store("Store 1", "Postcode 1", lat, long) for lat, long in zip(LATS, LONGS)
+    ]
+
+    for radius_km in [0, 2500, 5000, 10000, 20000]:
+        expected = [
+            i for i, s in enumerate(stores) if s.is_within_radius(45, 0, radius_km)
+        ]
+        assert positions_within_radius(45, 0, radius_km, LATS, LONGS) == expected
+
+
+def test_stores_without_coords_never_within_radius(batch_impl):
+    """Stores without coords never within radius"""
+    lats = [51.785161, None, math.nan, 51.785161]
+    longs = [0.121998, 0.121998, 0.121998, None]
+
+    assert positions_within_radius(51.77624, 0.095126, 50000, lats, longs) == [0]
+
+
+def test_error_on_negative_radius(batch_impl):
+    """Error on negative radius."""
+    with pytest.raises(ValueError):
+        positions_within_radius(51.77624, 0.095126, -1, LATS, LONGS)
+
+
+@pytest.mark.parametrize("max_block_cells", [1, 20, 1_000_000])
+def test_distance_matrix_matches_distances_per_query_point(batch_impl, max_block_cells):
+    """Distance matrix matches distances per query point"""
+    lats = LATS + [None, math.nan]
+    longs = LONGS + [0.121998, 0.121998]
+
+    results = batch_distances_within_radius(
+        LATS, LONGS, 10000, lats, longs, max_block_cells=max_block_cells
+    )
+
+    assert len(results) == len(LATS)
+    for query_lat, query_long, result in zip(LATS, LONGS, results):
+        expected = distances_within_radius(query_lat, query_long, 10000, lats, longs)
+        assert [i for i, _ in result] == [i for i, _ in expected]
+        assert [d for _, d in result] == pytest.approx(
+            [d for _, d in expected], abs=BATCH_DISTANCE_TOLERANCE_KM
+        )
+
+
+def test_nearest_within_radius_picked_from_radius_search_distances(
+    batch_impl, monkeypatch
+):
+    """Nearest within radius picked from the radius search's distances"""
+    lats = LATS + [None, math.nan]
+    longs = LONGS + [0.121998, 0.121998]
+    expected = sorted(
+        (d, i) for i, d in distances_within_radius(45, 0, 10000, lats, longs)
+    )[:3]
+
+    calls = []
+    distances_km_from = Store.distances_km_from
+
+    def counting_distances_km_from(*args):
+        calls.append(args)
+        return distances_km_from(*args)
+
+    monkeypatch.setattr(Store, "distances_km_from", counting_distances_km_from)
+
+    assert nearest_positions(45, 0, 3, lats, longs, max_radius_km=10000) == expected
+    assert len(calls) == 1
@@ -0,0 +1,101 @@
+"""These unit tests are not concerned with data access.
+They test only the logic of domain entities irrespective
+of the data sources."""
+
+# Table sorted by name with coords joined
+# Missing coords read back as None
+# Columns are read only
+# Views select rows without copying stores
+# Slicing a view returns a view
+# Stores have no instance dict
+# Error on columns of different lengths
+
+
+import math
+
+import pytest
+
+from src.domain.store import Store
+from src.domain.store_table import StoreTable, StoreTableBuilder, StoreTableView
+
+
+def records():
+    return [
+        {"name": "St_Albans", "postcode": "AL1 2RJ"},
+        {"name": "Harlow", "postcode": "CM20 1FE"},
+        {"name": "Orpington", "postcode": "BR5 3RP"},
+    ]
+
+
+def postcode_coords_map():
+    return {
+        "AL1 2RJ": {"lat": 51.741753, "long": -0.341337},
+        "CM20 1FE": {"lat": 51.776402, "long": 0.114084},
+    }
+
+
+def build_table():
+    builder = StoreTableBuilder()
+    builder.extend(records(), postcode_coords_map())
+    return builder.build()
+
+
+def test_table_sorted_by_name_with_coords_joined():
+    """Table sorted by name with coords joined"""
+    table = build_table()
+
+    assert table.names == ("Harlow", "Orpington", "St_Albans")
+    assert table.postcodes == ("CM20 1FE", "BR5 3RP", "AL1 2RJ")
+    assert table.row(0) == Store("Harlow", "CM20 1FE", 51.776402, 0.114084)
+    assert len(table) == 3
+
+
+def test_missing_coords_read_back_as_none():
+    """Missing coords read back as None"""
+    table = build_table()
+
+    assert math.isnan(table.lats[1])
+    assert table.row(1).lat is None
+    assert table.row(1).long is None
+    assert table.row(1).to_dict() == {"name": "Orpington", "postcode": "BR5 3RP"}
+
+
+def test_columns_are_read_only():
+    """Columns are read only"""
+    table = build_table()
+
+    with pytest.raises(TypeError):
+        table.names[0] = "Renamed"
+    with pytest.raises(TypeError):
+        table.lats[0] = 0.0
+
+
+def test_views_select_rows_without_copying_stores():
+    """Views select rows without copying stores"""
+    table = build_table()
+
+    with_coords = table.view([2, 0])
+    assert isinstance(with_coords, StoreTableView)
+    assert with_coords.table is table
+    assert [s.name for s in with_coords] == ["St_Albans", "Harlow"]
+
+
+def test_slicing_a_view_returns_a_view():
+    """Slicing a view returns a view"""
+    view = build_table().view()
+
+    assert isinstance(view[1:], StoreTableView)
+    assert [s.name for s in view[1:]] == ["Orpington", "St_Albans"]
+    assert view[-1].name == "St_Albans"
+
+
+def test_stores_have_no_instance_dict():
+    """Stores have no instance dict"""
+    with pytest.raises(AttributeError):
+        Store("Harlow", "CM20 1FE").__dict__
+
+
+def test_error_on_columns_of_different_lengths():
+    """Error on columns of different lengths"""
+    with pytest.raises(ValueError):
+        StoreTable(("Harlow",), ("CM20 1FE",), [51.776402], [])